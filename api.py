@@ -0,0 +1,488 @@
+import hashlib
+import io
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from flask import Blueprint, Response, request
+
+import data_manager
+import metricas
+import optimizer
+
+TIPO_JSON = "application/json"
+TIPO_ARROW = "application/vnd.apache.arrow.stream"
+MAX_RESPOSTAS = 1024
+MAX_BYTES_PAYLOAD = int(os.environ.get("SIMPLEX_API_MAX_BYTES", 16 * 1024 * 1024))
+MAX_PEDIDOS_LOTE = 256
+MAX_CONCORRENTES = int(
+    os.environ.get("SIMPLEX_API_CONCORRENCIA", max(2, os.cpu_count() or 1))
+)
+ESPERA_MAXIMA = float(os.environ.get("SIMPLEX_API_ESPERA", 5.0))
+COLUNAS_RESPOSTA = [
+    "servico",
+    "qtd_sugerida",
+    "lucro_meta",
+    "faturamento_meta",
+    "tempo_meta",
+    "custo_reduzido",
+]
+COLUNAS_RESPOSTA_REAL = [
+    "quantidade_real",
+    "lucro_real",
+    "faturamento_real",
+    "tempo_real",
+    "desvio_qtd",
+    "desvio_lucro",
+]
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+
+class ErroPedido(ValueError):
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class CacheRespostas:
+    def __init__(self, max_respostas=MAX_RESPOSTAS):
+        self.max_respostas = max_respostas
+        self._itens = OrderedDict()
+        self._em_andamento = {}
+        self._lock = threading.Lock()
+        # Segundo nível opcional (ex.: diskcache.Cache), compartilhado entre os
+        # processos do servidor.
+        self.disco = None
+
+    def buscar(self, chave):
+        with self._lock:
+            resposta = self._itens.get(chave)
+            if resposta is not None:
+                self._itens.move_to_end(chave)
+
+        if resposta is None and self.disco is not None:
+            resposta = self.disco.get(chave)
+            if resposta is not None:
+                self._guardar(chave, resposta)
+
+        metricas.metricas.contar_cache("api", resposta is not None)
+        return resposta
+
+    def guardar(self, chave, resposta):
+        # Só planos e inviabilidades ficam guardados; erros de leitura e
+        # servidor cheio são recalculados.
+        if resposta[1] in (200, 422):
+            if self.disco is not None:
+                self.disco.set(chave, resposta)
+            self._guardar(chave, resposta)
+
+    def obter(self, chave, calcular):
+        resposta = self.buscar(chave)
+        if resposta is not None:
+            return resposta
+
+        # Pedidos iguais que chegam juntos esperam o primeiro em vez de
+        # calcular de novo.
+        with self._lock:
+            evento = self._em_andamento.get(chave)
+            dono = evento is None
+            if dono:
+                evento = self._em_andamento[chave] = threading.Event()
+
+        if not dono:
+            evento.wait(ESPERA_MAXIMA)
+            with self._lock:
+                resposta = self._itens.get(chave)
+            if resposta is not None:
+                return resposta
+
+        try:
+            resposta = calcular()
+            self.guardar(chave, resposta)
+            return resposta
+        finally:
+            if dono:
+                self._liberar(chave)
+
+    def _liberar(self, chave):
+        with self._lock:
+            evento = self._em_andamento.pop(chave, None)
+        if evento is not None:
+            evento.set()
+
+    def _guardar(self, chave, resposta):
+        with self._lock:
+            self._itens[chave] = resposta
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_respostas:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+cache_respostas = CacheRespostas()
+vagas = threading.BoundedSemaphore(MAX_CONCORRENTES)
+
+
+def chave_payload(*partes):
+    digest = hashlib.blake2b(digest_size=16)
+    for parte in partes:
+        digest.update(parte if isinstance(parte, bytes) else str(parte).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def ler_tabela_json(valor, nome):
+    # Aceita lista de linhas ([{"servico": ...}, ...]) ou colunas
+    # ({"servico": [...], ...}).
+    if not isinstance(valor, (list, dict)) or not valor:
+        raise ErroPedido(f"'{nome}' deve ser uma lista de linhas ou um dict de colunas")
+    try:
+        df = pd.DataFrame(valor)
+    except ValueError as e:
+        raise ErroPedido(f"'{nome}' inválido: {e}") from None
+    df.columns = [str(c).lower().strip() for c in df.columns]
+    return df
+
+
+def ler_arrow(corpo):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ErroPedido("Payload Arrow requer pyarrow no servidor", 415) from None
+
+    try:
+        return pa.ipc.open_stream(corpo).read_all().to_pandas()
+    except pa.ArrowInvalid as e:
+        raise ErroPedido(f"Payload Arrow inválido: {e}") from None
+
+
+def ler_horas(valor):
+    try:
+        horas = float(valor)
+    except (TypeError, ValueError):
+        raise ErroPedido("'horas' deve ser um número") from None
+    if not math.isfinite(horas) or horas < 0:
+        raise ErroPedido("'horas' deve ser um número positivo")
+    return horas
+
+
+def ler_pedido_json(pedido):
+    if not isinstance(pedido, dict):
+        raise ErroPedido("O pedido deve ser um objeto JSON")
+    if "servicos" not in pedido:
+        raise ErroPedido("Falta 'servicos' no pedido")
+
+    df_realizado = None
+    if pedido.get("realizado"):
+        df_realizado = ler_tabela_json(pedido["realizado"], "realizado")
+        missing = [c for c in ["servico", "quantidade"] if c not in df_realizado]
+        if missing:
+            raise ErroPedido(f"Faltam colunas no Realizado: {missing}")
+
+    capacidades = pedido.get("capacidades")
+    if capacidades is not None and not isinstance(capacidades, dict):
+        raise ErroPedido("'capacidades' deve ser um objeto {recurso: capacidade}")
+
+    return (
+        ler_tabela_json(pedido["servicos"], "servicos"),
+        df_realizado,
+        ler_horas(pedido.get("horas", 360)),
+        bool(pedido.get("inteiro", False)),
+        capacidades,
+    )
+
+
+def otimizar_pedido(df_template, df_realizado, horas, inteiro, capacidades):
+    try:
+        df_raw = data_manager.consolidar_dados(df_template, df_realizado, capacidades)
+    except (ValueError, TypeError) as e:
+        raise ErroPedido(str(e)) from None
+
+    df_final, erro = optimizer.calcular_otimizacao(df_raw, horas, inteiro=inteiro)
+    if erro:
+        return {"erro": erro}, 422
+
+    colunas = COLUNAS_RESPOSTA + (
+        COLUNAS_RESPOSTA_REAL if df_realizado is not None else []
+    )
+    df_final = df_final[colunas]
+    # Devolve na ordem em que os serviços foram enviados.
+    if not df_final.index.is_monotonic_increasing:
+        df_final = df_final.sort_index()
+    return df_final, 200
+
+
+def resposta_json(df_final, status):
+    if status != 200:
+        return df_final, status
+
+    colunas = list(df_final.columns)
+    return (
+        montar_resposta(
+            df_final["servico"].astype(str).tolist(),
+            {col: df_final[col].to_numpy(dtype=float) for col in colunas[1:]},
+            df_final.attrs["horas_disponiveis"],
+            df_final.attrs.get("valor_hora"),
+            df_final.attrs.get("gap_mip"),
+        ),
+        200,
+    )
+
+
+def montar_resposta(servicos, valores, horas, valor_hora, gap_mip=None):
+    # Uma matriz numpy em vez de uma conversão por coluna; NaN/inf viram 0
+    # porque JSON não os representa.
+    colunas = ["servico", *valores]
+    matriz = np.column_stack(list(valores.values()))
+    matriz = np.where(np.isfinite(matriz), matriz, 0.0)
+    return {
+        "plano": [
+            dict(zip(colunas, (servico, *linha)))
+            for servico, linha in zip(servicos, matriz.tolist())
+        ],
+        "resumo": {
+            "lucro": float(valores["lucro_meta"].sum()),
+            "faturamento": float(valores["faturamento_meta"].sum()),
+            "tempo": float(valores["tempo_meta"].sum()),
+            "horas_disponiveis": horas,
+            "valor_hora": valor_hora,
+            "gap_mip": gap_mip,
+        },
+    }
+
+
+def planos_sessao(sessao, horas):
+    # Caminho guloso: todas as horas de uma vez. Com HiGHS, um solve por hora
+    # seguido da sensibilidade, que reaproveita os duais do mesmo solve.
+    if sessao.guloso:
+        X, viavel = sessao.resolver_varios(horas)
+        for j, h in enumerate(horas):
+            yield (X[j], sessao.sensibilidade(h)) if viavel[j] else (None, None)
+        return
+
+    for h in horas:
+        x, erro = (None, True) if h < sessao.tempo_minimo else sessao.resolver(h)
+        yield (None, None) if erro else (x, sessao.sensibilidade(h))
+
+
+def resolver_grupo(pedido, lista_horas):
+    # Pedidos com o mesmo template, realizado e capacidades: consolida uma vez
+    # e resolve todas as horas na mesma sessão do otimizador. Horas inviáveis
+    # voltam como None e seguem pelo caminho normal, que monta a mensagem.
+    df_template, df_realizado, _, _, capacidades = ler_pedido_json(pedido)
+    try:
+        df_raw = data_manager.consolidar_dados(df_template, df_realizado, capacidades)
+    except (ValueError, TypeError) as e:
+        raise ErroPedido(str(e)) from None
+
+    sessao = optimizer.obter_sessao(df_raw)
+    servicos = df_raw["servico"].astype(str).tolist()
+    real = df_raw["quantidade_real"].to_numpy(dtype=float)
+
+    respostas = []
+    for h, (x, sensibilidade) in zip(lista_horas, planos_sessao(sessao, lista_horas)):
+        if x is None or sensibilidade is None:
+            respostas.append(None)
+            continue
+
+        # Mesmas contas de optimizer.calcular_otimizacao, sem o DataFrame.
+        qtd = x.round(0)
+        valores = {
+            "qtd_sugerida": qtd,
+            "lucro_meta": qtd * sessao.lucro,
+            "faturamento_meta": qtd * sessao.venda,
+            "tempo_meta": qtd * sessao.tempo,
+            "custo_reduzido": sensibilidade["custo_reduzido"],
+        }
+        if df_realizado is not None:
+            valores |= {
+                "quantidade_real": real,
+                "lucro_real": real * sessao.lucro,
+                "faturamento_real": real * sessao.venda,
+                "tempo_real": real * sessao.tempo,
+                "desvio_qtd": real - qtd,
+                "desvio_lucro": real * sessao.lucro - valores["lucro_meta"],
+            }
+        respostas.append(
+            serializar(
+                montar_resposta(servicos, valores, h, sensibilidade["valor_hora"]),
+                200,
+            )
+        )
+    return respostas
+
+
+def serializar(conteudo, status):
+    return json.dumps(conteudo, ensure_ascii=False).encode(), status, TIPO_JSON
+
+
+def resolver_json(pedido):
+    try:
+        return serializar(*resposta_json(*otimizar_pedido(*ler_pedido_json(pedido))))
+    except ErroPedido as e:
+        return serializar({"erro": str(e)}, e.status)
+
+
+def resolver_corpo_json(corpo):
+    try:
+        pedido = json.loads(corpo)
+    except ValueError:
+        return serializar({"erro": "JSON inválido"}, 400)
+    return resolver_json(pedido)
+
+
+def resolver_arrow(corpo, args):
+    try:
+        df_final, status = otimizar_pedido(
+            ler_arrow(corpo),
+            None,
+            ler_horas(args.get("horas", 360)),
+            args.get("inteiro", "").lower() in ("1", "true", "sim"),
+            None,
+        )
+    except ErroPedido as e:
+        return serializar({"erro": str(e)}, e.status)
+    if status != 200:
+        return serializar(df_final, status)
+
+    import pyarrow as pa
+
+    buffer = io.BytesIO()
+    tabela = pa.Table.from_pandas(df_final, preserve_index=False)
+    with pa.ipc.new_stream(buffer, tabela.schema) as escritor:
+        escritor.write_table(tabela)
+    return buffer.getvalue(), 200, TIPO_ARROW
+
+
+@contextmanager
+def vaga():
+    # Limita quantos cálculos rodam ao mesmo tempo; o excedente espera um
+    # pouco e depois recebe 503 para tentar de novo.
+    if not vagas.acquire(timeout=ESPERA_MAXIMA):
+        raise ErroPedido("Servidor ocupado, tente novamente", 503)
+    try:
+        with metricas.etapa("api_otimizar"):
+            yield
+    finally:
+        vagas.release()
+
+
+def com_vaga(calcular):
+    def calcular_com_vaga():
+        try:
+            with vaga():
+                return calcular()
+        except ErroPedido as e:
+            return serializar({"erro": str(e)}, e.status)
+
+    return calcular_com_vaga
+
+
+def responder(corpo, status, tipo=None):
+    if not isinstance(corpo, bytes):
+        corpo, status, tipo = serializar(corpo, status)
+
+    resposta = Response(corpo, status=status, mimetype=tipo)
+    if status == 503:
+        resposta.headers["Retry-After"] = "1"
+    return resposta
+
+
+def ler_corpo():
+    if (request.content_length or 0) > MAX_BYTES_PAYLOAD:
+        raise ErroPedido("Payload grande demais", 413)
+    return request.get_data(cache=False)
+
+
+@api.route("/otimizar", methods=["POST"])
+def otimizar():
+    try:
+        corpo = ler_corpo()
+    except ErroPedido as e:
+        return responder({"erro": str(e)}, e.status)
+
+    tipo = request.mimetype
+    chave = chave_payload(tipo, request.query_string, corpo)
+
+    # A chave é o hash dos bytes recebidos; o corpo só é interpretado (JSON
+    # ou Arrow) quando a resposta não está no cache.
+    if tipo == TIPO_ARROW:
+        calcular = com_vaga(lambda: resolver_arrow(corpo, request.args))
+    else:
+        calcular = com_vaga(lambda: resolver_corpo_json(corpo))
+
+    return responder(*cache_respostas.obter(chave, calcular))
+
+
+@api.route("/otimizar/lote", methods=["POST"])
+def otimizar_lote():
+    try:
+        pedidos = json.loads(ler_corpo()).get("pedidos")
+    except ErroPedido as e:
+        return responder({"erro": str(e)}, e.status)
+    except (ValueError, AttributeError):
+        return responder({"erro": "JSON inválido"}, 400)
+
+    if not isinstance(pedidos, list) or not 0 < len(pedidos) <= MAX_PEDIDOS_LOTE:
+        return responder(
+            {"erro": f"'pedidos' deve ser uma lista com 1 a {MAX_PEDIDOS_LOTE} itens"},
+            400,
+        )
+
+    # Pedidos que só diferem nas horas formam um grupo: o template é
+    # consolidado uma vez e as horas são resolvidas juntas na mesma sessão do
+    # otimizador, ocupando uma vaga só. Modo inteiro e horas inviáveis seguem
+    # um a um. As respostas já serializadas são só concatenadas.
+    respostas = [None] * len(pedidos)
+    chaves = [chave_payload("lote", json.dumps(p, sort_keys=True)) for p in pedidos]
+    grupos = {}
+    for i, pedido in enumerate(pedidos):
+        respostas[i] = cache_respostas.buscar(chaves[i])
+        if respostas[i] is not None:
+            continue
+        if not isinstance(pedido, dict) or pedido.get("inteiro"):
+            continue
+        try:
+            horas = ler_horas(pedido.get("horas", 360))
+        except ErroPedido as e:
+            respostas[i] = serializar({"erro": str(e)}, e.status)
+            continue
+        base = json.dumps(
+            {k: v for k, v in pedido.items() if k != "horas"}, sort_keys=True
+        )
+        grupos.setdefault(base, []).append((i, horas))
+
+    for itens in grupos.values():
+        try:
+            with vaga():
+                calculadas = resolver_grupo(
+                    pedidos[itens[0][0]], [horas for _, horas in itens]
+                )
+        except ErroPedido as e:
+            calculadas = [serializar({"erro": str(e)}, e.status)] * len(itens)
+        for (i, _), resposta in zip(itens, calculadas):
+            if resposta is not None:
+                cache_respostas.guardar(chaves[i], resposta)
+                respostas[i] = resposta
+
+    resultados = []
+    for i, pedido in enumerate(pedidos):
+        if respostas[i] is None:
+            respostas[i] = cache_respostas.obter(
+                chaves[i], com_vaga(lambda pedido=pedido: resolver_json(pedido))
+            )
+        corpo, status, _ = respostas[i]
+        resultados.append(b'{"status": %d, "resposta": %s}' % (status, corpo))
+
+    return responder(
+        b'{"resultados": [' + b", ".join(resultados) + b"]}", 200, TIPO_JSON
+    )
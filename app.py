@@ -1,16 +1,71 @@
+import os
+import sqlite3
+import time
+import uuid
+
 import dash
-from dash import html, dcc, Input, Output, State
+from dash import html, dcc, Input, Output, State, DiskcacheManager, ctx, no_update
+import diskcache
 import webbrowser
 from threading import Timer
+from flask import Response, g, request
 
+import api
 import data_manager
+import metricas
 import optimizer
 import components
+import historico
+import robustez
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+
+metricas.configurar_log()
 
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
 
+
+def conectar_discos():
+    # Abre os caches em disco (SQLite) deste processo. Com servidor.py o
+    # módulo é importado no mestre antes do fork e cada worker chama esta
+    # função ao nascer: o mestre não escreve no disco e nenhuma conexão
+    # atravessa o fork.
+    data_manager.cache_uploads.disco = diskcache.Cache(
+        os.path.join(CACHE_DIR, "uploads")
+    )
+    data_manager.cache_resultados.disco = diskcache.Cache(
+        os.path.join(CACHE_DIR, "resultados")
+    )
+    metricas.metricas.disco = diskcache.Cache(os.path.join(CACHE_DIR, "metricas"))
+    components.cache_figuras.disco = diskcache.Cache(os.path.join(CACHE_DIR, "figuras"))
+    api.cache_respostas.disco = diskcache.Cache(os.path.join(CACHE_DIR, "api"))
+    app._background_manager = DiskcacheManager(
+        diskcache.Cache(os.path.join(CACHE_DIR, "callbacks"))
+    )
+
+
+if not os.environ.get("SIMPLEX_DISCOS_POR_WORKER"):
+    conectar_discos()
+
+app.server.register_blueprint(api.api)
+# Ponto de entrada WSGI (gunicorn app:server); ver servidor.py.
+server = app.server
+
 COLORS = components.COLORS
 
+ESTILO_CANCELAR = {
+    "width": "100%",
+    "padding": "10px",
+    "backgroundColor": COLORS["red"],
+    "color": "white",
+    "border": "none",
+    "borderRadius": "8px",
+    "cursor": "pointer",
+    "fontWeight": "bold",
+    "marginTop": "10px",
+}
+ESTILO_PROGRESSO = {"width": "100%", "marginTop": "15px"}
+
 app.layout = html.Div(
     [
         html.Div(
@@ -22,6 +77,7 @@ app.layout = html.Div(
                     "1. Template de metas (Obrigatório)", style={"color": "#94a3b8"}
                 ),
                 components.upload_area("upload-template", "Carregar template"),
+                components.seletor_arquivo_servidor("arquivo-template"),
                 html.Div(
                     id="output-nome-template",
                     style={
@@ -34,6 +90,8 @@ app.layout = html.Div(
                     "2. Dados realizados (Opcional)", style={"color": "#94a3b8"}
                 ),
                 components.upload_area("upload-realizado", "Carregar mês atual"),
+                components.seletor_arquivo_servidor("arquivo-realizado"),
+                dcc.Interval(id="intervalo-arquivos", interval=15_000),
                 html.Div(
                     id="output-nome-realizado",
                     style={
@@ -57,6 +115,45 @@ app.layout = html.Div(
                         "color": "white",
                     },
                 ),
+                dcc.Checklist(
+                    id="input-inteiro",
+                    options=[
+                        {"label": " Quantidades inteiras (mais lento)", "value": "on"}
+                    ],
+                    value=[],
+                    style={"color": "#94a3b8", "marginTop": "15px"},
+                ),
+                html.Label("Unidade", style={"color": "#94a3b8", "marginTop": "15px"}),
+                dcc.Input(
+                    id="input-unidade",
+                    type="text",
+                    value=historico.UNIDADE_PADRAO,
+                    style={
+                        "width": "100%",
+                        "padding": "10px",
+                        "borderRadius": "5px",
+                        "border": "none",
+                        "backgroundColor": "#334155",
+                        "color": "white",
+                    },
+                ),
+                html.Label(
+                    "Mês de referência (AAAA-MM)",
+                    style={"color": "#94a3b8", "marginTop": "15px"},
+                ),
+                dcc.Input(
+                    id="input-mes",
+                    type="text",
+                    placeholder="mês atual",
+                    style={
+                        "width": "100%",
+                        "padding": "10px",
+                        "borderRadius": "5px",
+                        "border": "none",
+                        "backgroundColor": "#334155",
+                        "color": "white",
+                    },
+                ),
                 html.Button(
                     "CALCULAR OTIMIZAÇÃO",
                     id="btn-calcular",
@@ -73,6 +170,56 @@ app.layout = html.Div(
                         "marginTop": "20px",
                     },
                 ),
+                html.Button(
+                    "EXPORTAR SNAPSHOT",
+                    id="btn-snapshot",
+                    n_clicks=0,
+                    style={
+                        "width": "100%",
+                        "padding": "10px",
+                        "backgroundColor": "#334155",
+                        "color": "white",
+                        "border": "none",
+                        "borderRadius": "8px",
+                        "cursor": "pointer",
+                        "marginTop": "10px",
+                    },
+                ),
+                html.Div(
+                    id="status-snapshot",
+                    style={"color": COLORS["gray"], "fontSize": "12px"},
+                ),
+                html.Button(
+                    "FECHAR O MÊS COM ESTE PLANO",
+                    id="btn-fechar-mes",
+                    n_clicks=0,
+                    style={
+                        "width": "100%",
+                        "padding": "10px",
+                        "backgroundColor": "#334155",
+                        "color": "white",
+                        "border": "none",
+                        "borderRadius": "8px",
+                        "cursor": "pointer",
+                        "marginTop": "10px",
+                    },
+                ),
+                html.Div(
+                    id="status-fechamento",
+                    style={"color": COLORS["gray"], "fontSize": "12px"},
+                ),
+                html.Button(
+                    "CANCELAR",
+                    id="btn-cancelar",
+                    n_clicks=0,
+                    style={**ESTILO_CANCELAR, "display": "none"},
+                ),
+                html.Progress(
+                    id="progresso",
+                    value="0",
+                    max="4",
+                    style={**ESTILO_PROGRESSO, "visibility": "hidden"},
+                ),
             ],
             style={
                 "width": "280px",
@@ -106,6 +253,8 @@ app.layout = html.Div(
                     color=components.COLORS["blue"],
                     children=html.Div(id="dashboard-content"),
                 ),
+                dcc.Store(id="sessao-id", storage_type="session"),
+                dcc.Store(id="resultado-chave"),
             ],
             style={"marginLeft": "320px", "padding": "40px", "minHeight": "100vh"},
         ),
@@ -131,199 +280,633 @@ def update_nome_realizado(filename):
     return f"Realizado: {filename}" if filename else "Opcional – não carregado"
 
 
+@app.callback(
+    Output("arquivo-template", "options"),
+    Output("arquivo-realizado", "options"),
+    Input("intervalo-arquivos", "n_intervals"),
+)
+def listar_arquivos_servidor(n_intervals):
+    arquivos = data_manager.listar_arquivos_servidor()
+    return arquivos, arquivos
+
+
+@app.server.before_request
+def iniciar_medicao():
+    g.inicio = time.perf_counter()
+
+
+@app.server.after_request
+def registrar_medicao(resposta):
+    if hasattr(g, "inicio") and request.path != "/metrics":
+        # Rótulo pela regra da rota (ex.: /upload/<upload_id>), não pela URL:
+        # ids e caminhos de assets não criam uma série nova cada.
+        regra = request.url_rule.rule if request.url_rule else "<sem rota>"
+        metricas.metricas.observar(f"http {regra}", time.perf_counter() - g.inicio)
+    return resposta
+
+
+@app.server.route("/metrics")
+def exportar_metricas():
+    return Response(
+        metricas.metricas.texto_prometheus(),
+        mimetype="text/plain; version=0.0.4",
+    )
+
+
+def receber_bloco_upload(upload_id):
+    try:
+        recebido = data_manager.gravar_bloco_upload(
+            upload_id, request.args.get("offset", 0, type=int), request.stream
+        )
+    except data_manager.ErroUpload as e:
+        return {"erro": str(e)}, e.status
+    return {"recebido": recebido}
+
+
+def concluir_upload(upload_id):
+    try:
+        nome = data_manager.concluir_upload(upload_id, request.args.get("nome", ""))
+    except data_manager.ErroUpload as e:
+        return {"erro": str(e)}, e.status
+    return {"arquivo": nome}
+
+
+# As rotas de envio gravam no diretório de arquivos do servidor e não têm
+# autenticação: só existem com SIMPLEX_UPLOADS=1.
+if data_manager.UPLOADS_HABILITADOS:
+    app.server.add_url_rule(
+        "/upload/<upload_id>", view_func=receber_bloco_upload, methods=["PUT"]
+    )
+    app.server.add_url_rule(
+        "/upload/<upload_id>/concluir", view_func=concluir_upload, methods=["POST"]
+    )
+
+
+def digests_uploads(cont_temp, cont_real):
+    # Um hash por upload e por cálculo: serve à chave de origem e ao cache de
+    # leitura, sem repassar o base64 inteiro por str() a cada clique.
+    return (
+        data_manager.digest_upload(cont_temp),
+        data_manager.digest_upload(cont_real),
+    )
+
+
+def origem_dados(name_temp, name_real, arq_temp, arq_real, digests):
+    template = (
+        data_manager.assinatura_arquivo_servidor(arq_temp)
+        if arq_temp
+        else (digests[0], name_temp)
+    )
+    realizado = (
+        data_manager.assinatura_arquivo_servidor(arq_real)
+        if arq_real
+        else (digests[1], name_real)
+    )
+    return data_manager.chave_origem(template, realizado)
+
+
+def carregar_dados(
+    cont_temp,
+    name_temp,
+    cont_real,
+    name_real,
+    arq_temp,
+    arq_real,
+    set_progress,
+    digests=(None, None),
+):
+    set_progress(("1", "4"))
+    with metricas.etapa("ler_template", arquivo=arq_temp or name_temp):
+        if arq_temp:
+            df_template = data_manager.parse_arquivo_servidor(
+                arq_temp, data_manager.COLUNAS_NUMERICAS_TEMPLATE
+            )
+        else:
+            df_template = data_manager.parse_upload(
+                cont_temp,
+                name_temp,
+                data_manager.COLUNAS_NUMERICAS_TEMPLATE,
+                digest=digests[0],
+            )
+
+    if df_template is None:
+        return None
+
+    df_realizado = None
+
+    set_progress(("2", "4"))
+    if arq_real:
+        with metricas.etapa("ler_realizado", arquivo=arq_real):
+            df_realizado = data_manager.parse_arquivo_servidor_realizado(arq_real)
+    elif cont_real:
+        with metricas.etapa("ler_realizado", arquivo=name_real):
+            df_realizado = data_manager.parse_upload_realizado(
+                cont_real, name_real, digest=digests[1]
+            )
+
+    # Um Realizado informado que não pôde ser lido é erro, não "sem realizado".
+    if (arq_real or cont_real) and df_realizado is None:
+        raise ValueError(f"Formato não suportado no Realizado: {arq_real or name_real}")
+
+    with metricas.etapa("consolidar"):
+        return data_manager.consolidar_dados(df_template, df_realizado)
+
+
+@app.callback(
+    Output("status-snapshot", "children"),
+    Input("btn-snapshot", "n_clicks"),
+    State("upload-template", "contents"),
+    State("upload-template", "filename"),
+    State("upload-realizado", "contents"),
+    State("upload-realizado", "filename"),
+    State("arquivo-template", "value"),
+    State("arquivo-realizado", "value"),
+    prevent_initial_call=True,
+)
+def exportar_snapshot(
+    n_clicks, cont_temp, name_temp, cont_real, name_real, arq_temp, arq_real
+):
+    if not cont_temp and not arq_temp:
+        return "Carregue o Template primeiro"
+
+    try:
+        digests = digests_uploads(cont_temp, cont_real)
+        df_raw = carregar_dados(
+            cont_temp,
+            name_temp,
+            cont_real,
+            name_real,
+            arq_temp,
+            arq_real,
+            lambda progresso: None,
+            digests,
+        )
+        if df_raw is None:
+            return "Erro ao ler o Template"
+
+        origem = origem_dados(name_temp, name_real, arq_temp, arq_real, digests)
+        caminho = data_manager.salvar_snapshot(origem, df_raw)
+    except Exception as e:
+        return f"Erro: {str(e)}"
+
+    return f"Snapshot salvo: {os.path.basename(caminho)}"
+
+
+@app.callback(
+    Output("sessao-id", "data"),
+    Input("sessao-id", "data"),
+)
+def iniciar_sessao(sessao_id):
+    return sessao_id or uuid.uuid4().hex
+
+
 @app.callback(
     Output("dashboard-content", "children"),
+    Output("resultado-chave", "data"),
     Input("btn-calcular", "n_clicks"),
     State("upload-template", "contents"),
     State("upload-template", "filename"),
     State("upload-realizado", "contents"),
     State("upload-realizado", "filename"),
     State("input-tempo", "value"),
+    State("input-inteiro", "value"),
+    State("sessao-id", "data"),
+    State("arquivo-template", "value"),
+    State("arquivo-realizado", "value"),
+    State("input-unidade", "value"),
+    State("input-mes", "value"),
+    background=True,
+    running=[
+        (Output("btn-calcular", "disabled"), True, False),
+        (
+            Output("btn-cancelar", "style"),
+            {**ESTILO_CANCELAR, "display": "block"},
+            {**ESTILO_CANCELAR, "display": "none"},
+        ),
+        (
+            Output("progresso", "style"),
+            {**ESTILO_PROGRESSO, "visibility": "visible"},
+            {**ESTILO_PROGRESSO, "visibility": "hidden"},
+        ),
+    ],
+    cancel=[Input("btn-cancelar", "n_clicks")],
+    progress=[Output("progresso", "value"), Output("progresso", "max")],
     prevent_initial_call=True,
 )
-def update_dashboard(n_clicks, cont_temp, name_temp, cont_real, name_real, tempo_disp):
-    if not cont_temp:
-        return html.Div(
-            "Carregue o Template para começar",
-            style={
-                "color": COLORS["yellow"],
-                "textAlign": "center",
-                "fontSize": "20px",
-                "marginTop": "100px",
-            },
+@metricas.medido("update_dashboard")
+def update_dashboard(
+    set_progress,
+    n_clicks,
+    cont_temp,
+    name_temp,
+    cont_real,
+    name_real,
+    tempo_disp,
+    inteiro,
+    sessao_id,
+    arq_temp,
+    arq_real,
+    unidade,
+    mes,
+):
+    if not cont_temp and not arq_temp:
+        return (
+            html.Div(
+                "Carregue o Template para começar",
+                style={
+                    "color": COLORS["yellow"],
+                    "textAlign": "center",
+                    "fontSize": "20px",
+                    "marginTop": "100px",
+                },
+            ),
+            None,
         )
 
     try:
-        df_template = data_manager.parse_upload(cont_temp, name_temp)
+        digests = digests_uploads(cont_temp, cont_real)
+        origem = origem_dados(name_temp, name_real, arq_temp, arq_real, digests)
+        chave = data_manager.chave_resultado(
+            sessao_id, origem, tempo_disp or 360, bool(inteiro)
+        )
+        df_final = data_manager.cache_resultados.get(chave)
 
-        if df_template is None:
-            return html.Div("Erro ao ler o Template", style={"color": COLORS["red"]})
+        if df_final is None:
+            with metricas.etapa("carregar_snapshot"):
+                df_raw = data_manager.carregar_snapshot(origem)
 
-        df_realizado = None
+            if df_raw is None:
+                df_raw = carregar_dados(
+                    cont_temp,
+                    name_temp,
+                    cont_real,
+                    name_real,
+                    arq_temp,
+                    arq_real,
+                    set_progress,
+                    digests,
+                )
 
-        if cont_real:
-            df_realizado = data_manager.parse_upload(cont_real, name_real)
+            if df_raw is None:
+                return (
+                    html.Div("Erro ao ler o Template", style={"color": COLORS["red"]}),
+                    None,
+                )
 
-        df_raw = data_manager.consolidar_dados(df_template, df_realizado)
-        df_final, erro_opt = optimizer.calcular_otimizacao(df_raw, tempo_disp or 360)
+            set_progress(("3", "4"))
+            with metricas.etapa("otimizar", servicos=len(df_raw)):
+                df_final, erro_opt = optimizer.calcular_otimizacao(
+                    df_raw, tempo_disp or 360, inteiro=bool(inteiro)
+                )
 
-        if erro_opt:
-            return html.Div(
-                [
-                    html.H3("Impossível otimizar", style={"color": COLORS["yellow"]}),
-                    html.P(erro_opt, style={"color": "white", "fontSize": "20px"}),
-                    html.P(
-                        "Aumente as horas ou diminua os mínimos obrigatórios",
-                        style={"color": COLORS["gray"]},
+            if erro_opt:
+                return (
+                    html.Div(
+                        [
+                            html.H3(
+                                "Impossível otimizar", style={"color": COLORS["yellow"]}
+                            ),
+                            html.P(
+                                erro_opt, style={"color": "white", "fontSize": "20px"}
+                            ),
+                            html.P(
+                                "Aumente as horas ou diminua os mínimos obrigatórios",
+                                style={"color": COLORS["gray"]},
+                            ),
+                        ],
+                        style={"textAlign": "center", "marginTop": "80px"},
                     ),
-                ],
-                style={"textAlign": "center", "marginTop": "80px"},
-            )
+                    None,
+                )
 
-        meta_lucro = df_final["lucro_meta"].sum()
-        meta_faturamento = df_final["faturamento_meta"].sum()
-        meta_tempo = df_final["tempo_meta"].sum()
+            data_manager.cache_resultados.put(chave, df_final)
 
-        real_lucro = df_final["lucro_real"].sum()
-        real_faturamento = df_final["faturamento_real"].sum()
-        real_tempo = df_final["tempo_real"].sum()
+            # O mesmo cálculo em outra sessão não gera um novo registro. Só
+            # entra nos agregados do mês pelo botão de fechamento.
+            try:
+                historico.registrar_execucao(
+                    df_final,
+                    unidade=unidade,
+                    mes=mes,
+                    assinatura=data_manager.chave_origem(
+                        origem, tempo_disp or 360, bool(inteiro)
+                    ),
+                    horas=tempo_disp or 360,
+                )
+            except ValueError as e:
+                metricas.logger.warning(
+                    "histórico não gravado", extra={"campos": {"erro": str(e)}}
+                )
+            except (sqlite3.Error, OSError):
+                metricas.logger.exception("erro ao gravar o histórico")
 
-        tem_real = real_tempo > 0.1
-        gauges_servicos = (
-            components.gauges_por_servico(df_final) if tem_real else html.Div()
-        )
+        set_progress(("4", "4"))
+        with metricas.etapa("curva_horas"):
+            sessao = optimizer.obter_sessao(df_final)
+            horas_curva = sorted(set(sessao.breakpoints()) | {float(tempo_disp or 360)})
+            curva, _ = optimizer.varrer_horas(df_final, horas_curva, sessao=sessao)
+            curva_horas = components.grafico_curva_horas(curva, tempo_disp or 360)
 
-        if tem_real:
-            kpi_topo = html.Div(
-                [
-                    components.grafico_gauge(
-                        real_lucro, meta_lucro, "Lucro real vs Meta", "R$ "
-                    ),
-                    components.grafico_gauge(
-                        real_faturamento,
-                        meta_faturamento,
-                        "Faturamento real vs Previsto",
-                        "R$ ",
-                    ),
-                    components.grafico_gauge(
-                        real_tempo, meta_tempo, "Tempo real vs Planejado", ""
-                    ),
-                ],
-                style={
-                    "display": "flex",
-                    "flexWrap": "wrap",
-                    "gap": "30px",
-                    "justifyContent": "center",
-                    "margin": "30px 0",
-                },
-            )
-        else:
-            kpi_topo = html.Div(
-                [
-                    components.card_metrica(
-                        "LUCRO MÁXIMO POSSÍVEL",
-                        meta_lucro,
-                        "Se seguir o plano abaixo",
-                        COLORS["green"],
-                        is_moeda=True,
-                    ),
-                    components.card_metrica(
-                        "FATURAMENTO ESPERADO",
-                        meta_faturamento,
-                        "Valor total que entra no caixa",
-                        COLORS["blue"],
-                        is_moeda=True,
-                    ),
-                    components.card_metrica(
-                        "TEMPO PLANEJADO",
-                        f"{meta_tempo:.0f}h",
-                        f"de {tempo_disp}h disponíveis",
-                        COLORS["purple"],
-                        is_moeda=False,
-                    ),
-                    components.card_metrica(
-                        "VALOR DA SUA HORA",
-                        f"R$ {meta_lucro/meta_tempo:.0f}",
-                        "Esse é o quanto vale cada hora otimizada!",
-                        COLORS["yellow"],
-                        is_moeda=False,
-                    ),
-                ],
-                style={
-                    "display": "flex",
-                    "flexWrap": "wrap",
-                    "gap": "20px",
-                    "justifyContent": "center",
-                    "margin": "30px 0",
-                },
-            )
+        with metricas.etapa("graficos"):
+            try:
+                tendencia = components.grafico_tendencia(historico.tendencia(unidade))
+            except (sqlite3.Error, OSError):
+                metricas.logger.exception("erro ao ler o histórico")
+                tendencia = html.Div()
 
-        if tem_real:
-            graficos = html.Div(
-                [
-                    html.Div(
-                        components.grafico_comparativo_financeiro(df_final),
-                        style={"flex": "1", "minWidth": "500px"},
-                    ),
-                    html.Div(
-                        components.grafico_waterfall_financeiro(df_final),
-                        style={"flex": "1", "minWidth": "500px"},
-                    ),
-                ],
-                style={
-                    "display": "flex",
-                    "flexWrap": "wrap",
-                    "gap": "30px",
-                    "margin": "40px 0",
-                },
+            meta_lucro = df_final["lucro_meta"].sum()
+            meta_faturamento = df_final["faturamento_meta"].sum()
+            meta_tempo = df_final["tempo_meta"].sum()
+
+            real_lucro = df_final["lucro_real"].sum()
+            real_faturamento = df_final["faturamento_real"].sum()
+            real_tempo = df_final["tempo_real"].sum()
+
+            tem_real = real_tempo > 0.1
+            gap_mip = df_final.attrs.get("gap_mip")
+            aviso_inteiro = (
+                html.P(
+                    f"Plano com quantidades inteiras (gap de otimalidade: {gap_mip:.2%})",
+                    style={"textAlign": "center", "color": COLORS["gray"]},
+                )
+                if gap_mip is not None
+                else html.Div()
             )
-        else:
-            graficos = html.Div(
-                [
-                    html.Div(
-                        components.grafico_rentabilidade_pareto(df_final),
-                        style={"flex": "1", "minWidth": "500px"},
-                    ),
-                    html.Div(
-                        components.grafico_distribuicao_tempo(df_final),
-                        style={"flex": "1", "minWidth": "400px"},
-                    ),
-                ],
-                style={
-                    "display": "flex",
-                    "flexWrap": "wrap",
-                    "gap": "30px",
-                    "margin": "40px 0",
-                },
+            gauges_servicos = (
+                components.gauges_por_servico(df_final) if tem_real else html.Div()
             )
 
-        return html.Div(
-            [
-                html.H1(
-                    "Seu resultado está pronto!",
+            if tem_real:
+                kpi_topo = html.Div(
+                    [
+                        components.grafico_gauge(
+                            real_lucro, meta_lucro, "Lucro real vs Meta", "R$ "
+                        ),
+                        components.grafico_gauge(
+                            real_faturamento,
+                            meta_faturamento,
+                            "Faturamento real vs Previsto",
+                            "R$ ",
+                        ),
+                        components.grafico_gauge(
+                            real_tempo, meta_tempo, "Tempo real vs Planejado", ""
+                        ),
+                    ],
                     style={
-                        "textAlign": "center",
-                        "color": COLORS["blue"],
-                        "margin": "20px 0",
-                        "fontSize": "32px",
+                        "display": "flex",
+                        "flexWrap": "wrap",
+                        "gap": "30px",
+                        "justifyContent": "center",
+                        "margin": "30px 0",
                     },
-                ),
-                kpi_topo,
-                graficos,
-                gauges_servicos,
-                components.tabela_detalhada(df_final),
-            ],
-            style={"padding": "20px"},
+                )
+            else:
+                kpi_topo = html.Div(
+                    [
+                        components.card_metrica(
+                            "LUCRO MÁXIMO POSSÍVEL",
+                            meta_lucro,
+                            "Se seguir o plano abaixo",
+                            COLORS["green"],
+                            is_moeda=True,
+                        ),
+                        components.card_metrica(
+                            "FATURAMENTO ESPERADO",
+                            meta_faturamento,
+                            "Valor total que entra no caixa",
+                            COLORS["blue"],
+                            is_moeda=True,
+                        ),
+                        components.card_metrica(
+                            "TEMPO PLANEJADO",
+                            f"{meta_tempo:.0f}h",
+                            f"de {tempo_disp}h disponíveis",
+                            COLORS["purple"],
+                            is_moeda=False,
+                        ),
+                        components.card_metrica(
+                            "VALOR DA SUA HORA",
+                            f"R$ {meta_lucro/meta_tempo:.0f}",
+                            "Esse é o quanto vale cada hora otimizada!",
+                            COLORS["yellow"],
+                            is_moeda=False,
+                        ),
+                    ],
+                    style={
+                        "display": "flex",
+                        "flexWrap": "wrap",
+                        "gap": "20px",
+                        "justifyContent": "center",
+                        "margin": "30px 0",
+                    },
+                )
+
+            if tem_real:
+                graficos = html.Div(
+                    [
+                        html.Div(
+                            components.grafico_comparativo_financeiro(df_final),
+                            style={"flex": "1", "minWidth": "500px"},
+                        ),
+                        html.Div(
+                            components.grafico_waterfall_financeiro(df_final),
+                            style={"flex": "1", "minWidth": "500px"},
+                        ),
+                    ],
+                    style={
+                        "display": "flex",
+                        "flexWrap": "wrap",
+                        "gap": "30px",
+                        "margin": "40px 0",
+                    },
+                )
+            else:
+                graficos = html.Div(
+                    [
+                        html.Div(
+                            components.grafico_rentabilidade_pareto(df_final),
+                            style={"flex": "1", "minWidth": "500px"},
+                        ),
+                        html.Div(
+                            components.grafico_distribuicao_tempo(df_final),
+                            style={"flex": "1", "minWidth": "400px"},
+                        ),
+                    ],
+                    style={
+                        "display": "flex",
+                        "flexWrap": "wrap",
+                        "gap": "30px",
+                        "margin": "40px 0",
+                    },
+                )
+
+        return (
+            html.Div(
+                [
+                    html.H1(
+                        "Seu resultado está pronto!",
+                        style={
+                            "textAlign": "center",
+                            "color": COLORS["blue"],
+                            "margin": "20px 0",
+                            "fontSize": "32px",
+                        },
+                    ),
+                    aviso_inteiro,
+                    kpi_topo,
+                    components.cards_sensibilidade(df_final),
+                    curva_horas,
+                    graficos,
+                    tendencia,
+                    gauges_servicos,
+                    components.secao_robustez(robustez.MAX_CENARIOS),
+                    components.tabela_detalhada(df_final),
+                ],
+                style={"padding": "20px"},
+            ),
+            chave,
         )
 
     except Exception as e:
-        import traceback
+        metricas.logger.exception("erro ao montar o dashboard")
+        return (
+            html.Div(
+                f"Erro: {str(e)}",
+                style={"color": COLORS["red"], "textAlign": "center"},
+            ),
+            None,
+        )
+
 
-        traceback.print_exc()
+@app.callback(
+    Output("gauges-grade", "children"),
+    Output("gauges-pagina", "data"),
+    Input("gauges-anterior", "n_clicks"),
+    Input("gauges-proxima", "n_clicks"),
+    Input("gauges-modo", "value"),
+    State("gauges-pagina", "data"),
+    State("resultado-chave", "data"),
+    prevent_initial_call=True,
+)
+@metricas.medido("paginar_gauges")
+def paginar_gauges(anterior, proxima, modo, pagina, chave):
+    df_final = data_manager.cache_resultados.get(chave) if chave else None
+    if df_final is None:
+        return no_update, no_update
+
+    pagina = pagina or 0
+    if ctx.triggered_id == "gauges-anterior":
+        pagina -= 1
+    elif ctx.triggered_id == "gauges-proxima":
+        pagina += 1
+    else:
+        pagina = 0
+
+    ultima = components.total_paginas(len(df_final), components.GAUGES_POR_PAGINA) - 1
+    pagina = min(max(pagina, 0), ultima)
+
+    return components.grade_gauges(df_final, pagina, modo=modo), pagina
+
+
+@app.callback(
+    Output("status-fechamento", "children"),
+    Input("btn-fechar-mes", "n_clicks"),
+    State("resultado-chave", "data"),
+    State("input-unidade", "value"),
+    State("input-mes", "value"),
+    prevent_initial_call=True,
+)
+@metricas.medido("fechar_mes")
+def fechar_mes(n_clicks, chave, unidade, mes):
+    df_final = data_manager.cache_resultados.get(chave) if chave else None
+    if df_final is None:
+        return "Calcule o plano do mês antes de fechá-lo."
+    if not mes:
+        return "Informe o mês de referência (AAAA-MM) para fechar."
+
+    # A assinatura é a mesma do registro feito no cálculo (sem a sessão).
+    try:
+        historico.registrar_execucao(
+            df_final,
+            unidade=unidade,
+            mes=mes,
+            assinatura=chave.split(":", 1)[1],
+            horas=df_final.attrs.get("horas_disponiveis"),
+            fechar=True,
+        )
+    except ValueError as e:
+        return str(e)
+    except (sqlite3.Error, OSError):
+        metricas.logger.exception("erro ao fechar o mês")
+        return "Erro ao gravar o histórico."
+
+    return (
+        f"Mês {mes.strip()} fechado para a unidade "
+        f"{historico.normalizar_unidade(unidade)}. O gráfico mês a mês é "
+        "atualizado no próximo cálculo."
+    )
+
+
+@app.callback(
+    Output("robustez-resultado", "children"),
+    Input("btn-robustez", "n_clicks"),
+    State("robustez-variacao-tempo", "value"),
+    State("robustez-variacao-preco", "value"),
+    State("robustez-cenarios", "value"),
+    State("resultado-chave", "data"),
+    # Em segundo plano, como o cálculo principal: a simulação (e o pool de
+    # processos dos modelos com recursos) não roda na thread do pedido.
+    background=True,
+    running=[(Output("btn-robustez", "disabled"), True, False)],
+    prevent_initial_call=True,
+)
+@metricas.medido("simular_robustez")
+def simular_robustez(n_clicks, var_tempo, var_preco, n_cenarios, chave):
+    df_final = data_manager.cache_resultados.get(chave) if chave else None
+    if df_final is None:
+        return no_update
+
+    n_cenarios = int(n_cenarios or robustez.N_CENARIOS)
+    if not 1 <= n_cenarios <= robustez.MAX_CENARIOS:
         return html.Div(
-            f"Erro: {str(e)}", style={"color": COLORS["red"], "textAlign": "center"}
+            f"Use de 1 a {robustez.MAX_CENARIOS:,} cenários".replace(",", "."),
+            style={"color": COLORS["red"]},
         )
 
+    try:
+        resumo, cenarios = robustez.simular_cenarios(
+            df_final,
+            n_cenarios=n_cenarios,
+            variacao_tempo=(var_tempo or 0) / 100,
+            variacao_preco=(var_preco or 0) / 100,
+        )
+    except Exception as e:
+        metricas.logger.exception("erro na simulação de cenários")
+        return html.Div(f"Erro: {str(e)}", style={"color": COLORS["red"]})
+
+    return components.resultado_robustez(resumo, cenarios)
+
+
+@app.callback(
+    Output("tabela-detalhada", "data"),
+    Output("tabela-detalhada", "page_count"),
+    Input("tabela-detalhada", "page_current"),
+    Input("tabela-detalhada", "page_size"),
+    Input("tabela-detalhada", "sort_by"),
+    Input("tabela-detalhada", "filter_query"),
+    State("resultado-chave", "data"),
+    prevent_initial_call=True,
+)
+@metricas.medido("paginar_tabela")
+def paginar_tabela(page_current, page_size, sort_by, filter_query, chave):
+    df_final = data_manager.cache_resultados.get(chave) if chave else None
+    if df_final is None:
+        return no_update, no_update
+
+    return components.pagina_tabela(
+        df_final, page_current, page_size, sort_by, filter_query
+    )
+
 
 if __name__ == "__main__":
     Timer(1, lambda: webbrowser.open("http://127.0.0.1:8050")).start()
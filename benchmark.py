@@ -0,0 +1,305 @@
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import components
+import data_manager
+import optimizer
+
+TAMANHOS = [10, 1_000, 100_000, 1_000_000]
+MAX_XLSX = 100_000
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+INICIALIZACAO = {
+    "import simplex": ["-c", "import simplex"],
+    "simplex otimizar": [
+        "-m",
+        "simplex",
+        "otimizar",
+        os.path.join("templates", "serviços.xlsx"),
+        "--horas",
+        "360",
+    ],
+    "import app": ["-c", "import app"],
+}
+
+
+def gerar_template(n, seed=0):
+    rng = np.random.default_rng(seed)
+    tempo = rng.uniform(0.5, 16, n).round(1)
+    custo = rng.uniform(5, 50, n).round(2)
+    venda = (custo + rng.uniform(10, 400, n)).round(2)
+    minimo = rng.choice([0, 0, 0, 1, 2], n)
+    maximo = minimo + rng.integers(1, 30, n)
+
+    return pd.DataFrame(
+        {
+            "servico": [f"servico {i}" for i in range(n)],
+            "tempo": [f"{v:.1f}".replace(".", ",") for v in tempo],
+            "custo": [f"R$ {v:.2f}".replace(".", ",") for v in custo],
+            "venda": venda,
+            "minimo": minimo,
+            "maximo": maximo,
+        }
+    )
+
+
+def gerar_realizado(df_template, seed=1):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "servico": df_template["servico"],
+            "quantidade": rng.integers(0, 30, len(df_template)),
+        }
+    )
+
+
+def horas_para(df_template):
+    df = data_manager.limpar_dados_numericos(
+        df_template.copy(), data_manager.COLUNAS_NUMERICAS_TEMPLATE
+    )
+    tempo_minimo = (df["minimo"] * df["tempo"]).sum()
+    tempo_maximo = (df["maximo"] * df["tempo"]).sum()
+    return float(tempo_minimo + 0.3 * (tempo_maximo - tempo_minimo))
+
+
+def conteudo_upload(df, formato):
+    buffer = io.BytesIO()
+    if formato == "csv":
+        df.to_csv(buffer, index=False)
+    else:
+        df.to_excel(buffer, index=False)
+    return "data:application/octet-stream;base64," + base64.b64encode(
+        buffer.getvalue()
+    ).decode("ascii")
+
+
+def limpar_caches():
+    data_manager.cache_uploads.limpar()
+    data_manager.cache_resultados.limpar()
+    data_manager._indices.clear()
+    optimizer._sessoes.clear()
+    components.cache_figuras.limpar()
+
+
+def medir(etapa, n, funcao, preparar, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        limpar_caches()
+        argumentos = preparar()
+        inicio = time.perf_counter()
+        funcao(*argumentos)
+        tempos.append(time.perf_counter() - inicio)
+
+    limpar_caches()
+    argumentos = preparar()
+    tracemalloc.start()
+    funcao(*argumentos)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    resultado = {
+        "etapa": etapa,
+        "tamanho": n,
+        "tempo_min_s": min(tempos),
+        "tempo_mediana_s": statistics.median(tempos),
+        "pico_memoria_mb": pico / 1e6,
+    }
+    imprimir(resultado)
+    return resultado
+
+
+def imprimir(resultado):
+    pico = resultado["pico_memoria_mb"]
+    print(
+        f"{resultado['etapa']:<32} n={resultado['tamanho']:<9} "
+        f"{resultado['tempo_mediana_s'] * 1000:>10.1f} ms "
+        + (f"{pico:>9.1f} MB" if pico is not None else f"{'-':>9}")
+    )
+
+
+def medir_inicializacao(nome, argumentos, repeticoes):
+    # Cada execução é um processo novo, como um cron ou um container que sobe
+    # para um único trabalho.
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        subprocess.run(
+            [sys.executable, *argumentos],
+            cwd=DIRETORIO,
+            check=True,
+            capture_output=True,
+        )
+        tempos.append(time.perf_counter() - inicio)
+
+    resultado = {
+        "etapa": f"inicializacao ({nome})",
+        "tamanho": 0,
+        "tempo_min_s": min(tempos),
+        "tempo_mediana_s": statistics.median(tempos),
+        "pico_memoria_mb": None,
+    }
+    imprimir(resultado)
+    return resultado
+
+
+def benchmark_tamanho(n, repeticoes, max_xlsx=MAX_XLSX):
+    df_template = gerar_template(n)
+    df_realizado = gerar_realizado(df_template)
+    horas = horas_para(df_template)
+
+    resultados = []
+
+    formatos = ["csv"] + (["xlsx"] if n <= max_xlsx else [])
+    for formato in formatos:
+        conteudo = conteudo_upload(df_template, formato)
+        resultados.append(
+            medir(
+                f"parse_upload ({formato})",
+                n,
+                data_manager.parse_upload,
+                lambda: (
+                    conteudo,
+                    f"template.{formato}",
+                    data_manager.COLUNAS_NUMERICAS_TEMPLATE,
+                ),
+                repeticoes,
+            )
+        )
+
+    resultados.append(
+        medir(
+            "limpar_dados_numericos",
+            n,
+            data_manager.limpar_dados_numericos,
+            lambda: (df_template.copy(), data_manager.COLUNAS_NUMERICAS_TEMPLATE),
+            repeticoes,
+        )
+    )
+
+    resultados.append(
+        medir(
+            "consolidar_dados",
+            n,
+            data_manager.consolidar_dados,
+            lambda: (df_template.copy(), df_realizado.copy()),
+            repeticoes,
+        )
+    )
+
+    df_raw = data_manager.consolidar_dados(df_template.copy(), df_realizado.copy())
+    resultados.append(
+        medir(
+            "calcular_otimizacao",
+            n,
+            optimizer.calcular_otimizacao,
+            lambda: (df_raw.copy(), horas),
+            repeticoes,
+        )
+    )
+
+    df_final, erro = optimizer.calcular_otimizacao(df_raw.copy(), horas)
+    if erro:
+        raise RuntimeError(erro)
+
+    for nome, funcao in [
+        ("tabela_detalhada", components.tabela_detalhada),
+        ("gauges_por_servico", components.gauges_por_servico),
+        ("grafico_waterfall_financeiro", components.grafico_waterfall_financeiro),
+    ]:
+        resultados.append(
+            medir(nome, n, funcao, lambda: (df_final.copy(),), repeticoes)
+        )
+
+    return resultados
+
+
+def commit_atual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(resultados, caminho_anterior):
+    with open(caminho_anterior, encoding="utf-8") as f:
+        anteriores = {(r["etapa"], r["tamanho"]): r for r in json.load(f)["resultados"]}
+
+    print(f"\nComparação com {caminho_anterior}:")
+    for r in resultados:
+        anterior = anteriores.get((r["etapa"], r["tamanho"]))
+        if anterior is None:
+            continue
+        razao = r["tempo_mediana_s"] / max(anterior["tempo_mediana_s"], 1e-12)
+        alerta = "  <-- mais lento" if razao > 1.2 else ""
+        print(f"{r['etapa']:<32} n={r['tamanho']:<9} {razao:>6.2f}x{alerta}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Mede cada etapa do fluxo leitura → consolidação → otimização → gráficos."
+    )
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument(
+        "--max-xlsx",
+        type=int,
+        default=MAX_XLSX,
+        help="Maior tamanho para o qual o parse de .xlsx é medido",
+    )
+    parser.add_argument(
+        "--sem-inicializacao",
+        action="store_true",
+        help="Não mede o tempo de inicialização dos pontos de entrada",
+    )
+    parser.add_argument("--saida", default="benchmark_resultados.json")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    args = parser.parse_args(argv)
+
+    resultados = []
+    if not args.sem_inicializacao:
+        for nome, argumentos in INICIALIZACAO.items():
+            resultados.append(medir_inicializacao(nome, argumentos, args.repeticoes))
+
+    for n in args.tamanhos:
+        resultados.extend(benchmark_tamanho(n, args.repeticoes, args.max_xlsx))
+
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "commit": commit_atual(),
+                "data": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "pandas": pd.__version__,
+                "numpy": np.__version__,
+                "repeticoes": args.repeticoes,
+                "resultados": resultados,
+            },
+            f,
+            indent=2,
+            ensure_ascii=False,
+        )
+    print(f"\nResultados salvos em {args.saida}")
+
+    if args.comparar:
+        comparar(resultados, args.comparar)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+ESPERA_SERVIDOR = 60
+
+
+def gerar_pedido(n, seed=0):
+    rng = random.Random(seed)
+    servicos = []
+    for i in range(n):
+        custo = round(rng.uniform(5, 50), 2)
+        minimo = rng.choice([0, 0, 0, 1, 2])
+        servicos.append(
+            {
+                "servico": f"servico {i}",
+                "tempo": round(rng.uniform(0.5, 16), 1),
+                "custo": custo,
+                "venda": round(custo + rng.uniform(10, 400), 2),
+                "minimo": minimo,
+                "maximo": minimo + rng.randint(1, 30),
+            }
+        )
+
+    tempo_minimo = sum(s["minimo"] * s["tempo"] for s in servicos)
+    tempo_maximo = sum(s["maximo"] * s["tempo"] for s in servicos)
+    return {
+        "servicos": servicos,
+        "horas": round(tempo_minimo + 0.3 * (tempo_maximo - tempo_minimo), 1),
+    }
+
+
+def gerar_corpos(n_servicos, requisicoes, unicos, seed=0):
+    # Uma fração dos pedidos muda as horas (não passa pelo cache); o resto
+    # repete o pedido base, como vários clientes consultando o mesmo plano.
+    base = gerar_pedido(n_servicos, seed)
+    rng = random.Random(seed)
+    corpos = []
+    for i in range(requisicoes):
+        pedido = base
+        if rng.random() < unicos:
+            pedido = {**base, "horas": base["horas"] + 0.001 * (i + 1)}
+        corpos.append(json.dumps(pedido).encode())
+    return corpos
+
+
+def disparar(url, corpos, proximo, lock, latencias, status):
+    partes = urlsplit(url)
+    conexao = http.client.HTTPConnection(partes.hostname, partes.port or 80)
+    caminho = partes.path or "/"
+    while True:
+        with lock:
+            i = next(proximo, None)
+        if i is None:
+            break
+
+        inicio = time.perf_counter()
+        try:
+            conexao.request(
+                "POST",
+                caminho,
+                body=corpos[i],
+                headers={"Content-Type": "application/json"},
+            )
+            resposta = conexao.getresponse()
+            resposta.read()
+            codigo = resposta.status
+        except (OSError, http.client.HTTPException) as e:
+            codigo = type(e).__name__
+            conexao.close()
+            conexao = http.client.HTTPConnection(partes.hostname, partes.port or 80)
+
+        with lock:
+            latencias.append(time.perf_counter() - inicio)
+            status[codigo] += 1
+    conexao.close()
+
+
+def percentil(valores, p):
+    if len(valores) < 2:
+        return valores[0] if valores else 0.0
+    return statistics.quantiles(valores, n=100, method="inclusive")[p - 1]
+
+
+def disparar_parte(url, corpos, concorrencia):
+    proximo = iter(range(len(corpos)))
+    lock = threading.Lock()
+    latencias, status = [], Counter()
+    threads = [
+        threading.Thread(
+            target=disparar, args=(url, corpos, proximo, lock, latencias, status)
+        )
+        for _ in range(concorrencia)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencias, status
+
+
+def executar(url, corpos, concorrencia, processos=1):
+    # Com vários workers no servidor, um só processo de carga (preso ao GIL)
+    # vira o gargalo: '--processos' divide os pedidos entre processos.
+    if processos > 1:
+        with multiprocessing.Pool(processos) as pool:
+            inicio = time.perf_counter()
+            partes = pool.starmap(
+                disparar_parte,
+                [
+                    (url, corpos[p::processos], max(concorrencia // processos, 1))
+                    for p in range(processos)
+                ],
+            )
+            duracao = time.perf_counter() - inicio
+    else:
+        inicio = time.perf_counter()
+        partes = [disparar_parte(url, corpos, concorrencia)]
+        duracao = time.perf_counter() - inicio
+
+    latencias, status = [], Counter()
+    for latencias_parte, status_parte in partes:
+        latencias.extend(latencias_parte)
+        status.update(status_parte)
+
+    return {
+        "requisicoes": len(latencias),
+        "duracao_s": duracao,
+        "req_por_s": len(latencias) / duracao,
+        "p50_ms": percentil(latencias, 50) * 1000,
+        "p95_ms": percentil(latencias, 95) * 1000,
+        "p99_ms": percentil(latencias, 99) * 1000,
+        "status": {str(k): v for k, v in sorted(status.items(), key=str)},
+    }
+
+
+def subir_servidor(workers, porta, threads):
+    processo = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(DIRETORIO, "servidor.py"),
+            "--workers",
+            str(workers),
+            "--threads",
+            str(threads),
+            "--endereco",
+            f"127.0.0.1:{porta}",
+        ],
+        cwd=DIRETORIO,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    limite = time.monotonic() + ESPERA_SERVIDOR
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"O servidor com {workers} workers não subiu")
+        try:
+            conexao = http.client.HTTPConnection("127.0.0.1", porta, timeout=1)
+            conexao.request("GET", "/metrics")
+            conexao.getresponse().read()
+            conexao.close()
+            return processo
+        except OSError:
+            time.sleep(0.2)
+
+    processo.terminate()
+    raise RuntimeError(f"O servidor com {workers} workers não respondeu")
+
+
+def escalonamento(args):
+    # Sobe 'servidor.py' com cada número de workers e mede a mesma carga.
+    # Cada rodada usa outro template para não aproveitar o cache em disco
+    # da rodada anterior.
+    resultados = []
+    for rodada, workers in enumerate(args.workers):
+        processo = subir_servidor(workers, args.porta, args.threads)
+        try:
+            url = f"http://127.0.0.1:{args.porta}/api/otimizar"
+            aquecimento = gerar_corpos(args.servicos, args.aquecimento, 0, seed=1)
+            executar(url, aquecimento, workers)
+            corpos = gerar_corpos(
+                args.servicos, args.requisicoes, args.unicos, seed=rodada + 2
+            )
+            resultado = executar(url, corpos, args.concorrencia, args.processos)
+        finally:
+            processo.terminate()
+            processo.wait()
+
+        resultados.append({"workers": workers, **resultado})
+        print(
+            f"{workers:>3} workers: {resultado['req_por_s']:>7.0f} req/s | "
+            f"p50 {resultado['p50_ms']:.1f} ms, p95 {resultado['p95_ms']:.1f} ms, "
+            f"p99 {resultado['p99_ms']:.1f} ms | status {resultado['status']}"
+        )
+    return resultados
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Teste de carga da API de otimização (POST /api/otimizar)."
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:8050/api/otimizar")
+    parser.add_argument("--requisicoes", type=int, default=2000)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--servicos", type=int, default=20)
+    parser.add_argument(
+        "--unicos",
+        type=float,
+        default=0.1,
+        help="Fração de pedidos diferentes entre si (0 a 1)",
+    )
+    parser.add_argument("--aquecimento", type=int, default=50)
+    parser.add_argument(
+        "--processos",
+        type=int,
+        default=1,
+        help="Processos geradores de carga (as conexões são divididas entre eles)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        help="Sobe servidor.py com cada número de workers e compara a vazão "
+        "(ignora --url)",
+    )
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--porta", type=int, default=8060)
+    parser.add_argument("--saida", help="Salva o resultado em JSON")
+    args = parser.parse_args(argv)
+
+    if args.workers:
+        resultado = {"rodadas": escalonamento(args)}
+    else:
+        corpos = gerar_corpos(args.servicos, args.requisicoes, args.unicos)
+        if args.aquecimento:
+            # Outro template, para não deixar no cache os pedidos medidos.
+            aquecimento = gerar_corpos(args.servicos, args.aquecimento, 0, seed=1)
+            executar(args.url, aquecimento, 1)
+
+        resultado = executar(args.url, corpos, args.concorrencia, args.processos)
+        print(
+            f"{resultado['requisicoes']} requisições em {resultado['duracao_s']:.2f}s: "
+            f"{resultado['req_por_s']:.0f} req/s | "
+            f"p50 {resultado['p50_ms']:.1f} ms, p95 {resultado['p95_ms']:.1f} ms, "
+            f"p99 {resultado['p99_ms']:.1f} ms | status {resultado['status']}"
+        )
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({**vars(args), **resultado}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
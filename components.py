@@ -1,8 +1,18 @@
+import functools
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+
 from dash import dcc, html, dash_table
-import plotly.graph_objects as go
+import numpy as np
 import pandas as pd
 from dash.dash_table.Format import Format, Group
 
+import data_manager
+import metricas
+
 COLORS = {
     "background": "#0f172a",
     "card_bg": "#1e293b",
@@ -15,6 +25,135 @@ COLORS = {
     "gray": "#64748b",
 }
 
+GAUGES_POR_PAGINA = 12
+
+# As figuras são montadas como dicts simples (sem a validação do go.Figure)
+# e guardadas pelo hash dos dados de entrada.
+MAX_FIGURAS = 256
+_template = {}
+
+
+class CacheFiguras:
+    def __init__(self, max_figuras=MAX_FIGURAS):
+        self.max_figuras = max_figuras
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        # Segundo nível opcional (ex.: diskcache.Cache), compartilhado com os
+        # processos dos callbacks em segundo plano.
+        self.disco = None
+
+    def get(self, chave):
+        with self._lock:
+            fig = self._itens.get(chave)
+            if fig is not None:
+                self._itens.move_to_end(chave)
+
+        if fig is None and self.disco is not None:
+            fig = self.disco.get(chave)
+            if fig is not None:
+                self._guardar(chave, fig)
+
+        metricas.metricas.contar_cache("figuras", fig is not None)
+        return fig
+
+    def put(self, chave, fig):
+        if self.disco is not None:
+            self.disco.set(chave, fig)
+        self._guardar(chave, fig)
+
+    def _guardar(self, chave, fig):
+        with self._lock:
+            self._itens[chave] = fig
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_figuras:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+cache_figuras = CacheFiguras()
+
+
+def template_padrao():
+    if not _template:
+        import plotly.io as pio
+
+        _template["layout"] = pio.templates["plotly"].layout.to_plotly_json()
+    return _template
+
+
+def chave_figura(nome, args):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(nome.encode())
+    for arg in args:
+        if isinstance(arg, pd.DataFrame):
+            digest.update(repr(list(arg.columns)).encode())
+            for _, coluna in arg.items():
+                if pd.api.types.is_numeric_dtype(coluna):
+                    valores = np.ascontiguousarray(coluna.to_numpy(dtype=float))
+                    digest.update(valores.tobytes())
+                else:
+                    digest.update("\x1f".join(coluna.astype(str).tolist()).encode())
+        else:
+            digest.update(repr(arg).encode())
+    return digest.hexdigest()
+
+
+def figura_em_cache(*colunas):
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def em_cache(*args):
+            if colunas:
+                args = (args[0][list(colunas)], *args[1:])
+            chave = chave_figura(funcao.__name__, args)
+
+            fig = cache_figuras.get(chave)
+            if fig is None:
+                fig = funcao(*args)
+                fig["layout"]["template"] = template_padrao()
+                cache_figuras.put(chave, fig)
+
+            return fig
+
+        return em_cache
+
+    return decorador
+
+
+def linha_vertical(x, cor, largura=2, tracejado=None, texto=None):
+    linha = {"color": cor, "width": largura}
+    if tracejado:
+        linha["dash"] = tracejado
+
+    forma = {
+        "type": "line",
+        "xref": "x",
+        "yref": "paper",
+        "x0": x,
+        "x1": x,
+        "y0": 0,
+        "y1": 1,
+        "line": linha,
+    }
+    anotacoes = []
+    if texto:
+        anotacoes.append(
+            {
+                "text": texto,
+                "x": x,
+                "xref": "x",
+                "y": 1,
+                "yref": "paper",
+                "xanchor": "left",
+                "yanchor": "top",
+                "showarrow": False,
+                "font": {"color": cor},
+            }
+        )
+    return forma, anotacoes
+
 
 def card_metrica(
     titulo,
@@ -85,17 +224,19 @@ def card_metrica(
     )
 
 
-def grafico_distribuicao_tempo(df):
-    fig = go.Figure(
-        data=[
-            go.Pie(
-                labels=df["servico"],
-                values=df["tempo_meta"],
-                hole=0.5,
-                textinfo="label+percent",
-                hoverinfo="label+value+percent",
-                marker=dict(
-                    colors=[
+@figura_em_cache("servico", "tempo_meta")
+def figura_distribuicao_tempo(df):
+    return {
+        "data": [
+            {
+                "type": "pie",
+                "labels": df["servico"].tolist(),
+                "values": df["tempo_meta"].to_numpy(),
+                "hole": 0.5,
+                "textinfo": "label+percent",
+                "hoverinfo": "label+value+percent",
+                "marker": {
+                    "colors": [
                         "#3b82f6",
                         "#8b5cf6",
                         "#10b981",
@@ -103,32 +244,35 @@ def grafico_distribuicao_tempo(df):
                         "#ef4444",
                         "#06b6d4",
                     ]
-                ),
-            )
-        ]
-    )
-
-    fig.update_layout(
-        title={
-            "text": "Para onde vai o seu tempo este mês?",
-            "x": 0.5,
-            "xanchor": "center",
-            "font": {"size": 18, "color": "white"},
-        },
-        annotations=[
-            dict(
-                text="Distribuição<br>do Tempo",
-                x=0.5,
-                y=0.5,
-                font_size=14,
-                showarrow=False,
-            )
+                },
+            }
         ],
-        paper_bgcolor=COLORS["card_bg"],
-        plot_bgcolor=COLORS["card_bg"],
-        font={"color": COLORS["text"]},
-        legend={"font": {"size": 11}},
-    )
+        "layout": {
+            "title": {
+                "text": "Para onde vai o seu tempo este mês?",
+                "x": 0.5,
+                "xanchor": "center",
+                "font": {"size": 18, "color": "white"},
+            },
+            "annotations": [
+                {
+                    "text": "Distribuição<br>do Tempo",
+                    "x": 0.5,
+                    "y": 0.5,
+                    "font": {"size": 14},
+                    "showarrow": False,
+                }
+            ],
+            "paper_bgcolor": COLORS["card_bg"],
+            "plot_bgcolor": COLORS["card_bg"],
+            "font": {"color": COLORS["text"]},
+            "legend": {"font": {"size": 11}},
+        },
+    }
+
+
+def grafico_distribuicao_tempo(df):
+    fig = figura_distribuicao_tempo(df)
     return html.Div(
         [
             html.Div(
@@ -151,36 +295,40 @@ def grafico_distribuicao_tempo(df):
     )
 
 
-def grafico_rentabilidade_pareto(df):
+@figura_em_cache("servico", "lucro_meta")
+def figura_rentabilidade_pareto(df):
     df_sorted = df.sort_values("lucro_meta", ascending=True)
 
-    fig = go.Figure(
-        go.Bar(
-            x=df_sorted["lucro_meta"],
-            y=df_sorted["servico"],
-            orientation="h",
-            marker_color=COLORS["purple"],
-            text=[
-                f"R$ {v:,.0f}".replace(",", "X").replace(".", ",").replace("X", ".")
-                for v in df_sorted["lucro_meta"]
-            ],
-            textposition="outside",
-            hovertemplate="<b>%{y}</b><br>Lucro esperado: R$ %{x:,.0f}<extra></extra>",
-        )
-    )
-
-    fig.update_layout(
-        title={
-            "text": "Quais serviços mais pagam o seu bolso?",
-            "x": 0.5,
-            "xanchor": "center",
+    return {
+        "data": [
+            {
+                "type": "bar",
+                "x": df_sorted["lucro_meta"].to_numpy(),
+                "y": df_sorted["servico"].tolist(),
+                "orientation": "h",
+                "marker": {"color": COLORS["purple"]},
+                "text": formatar_moeda(df_sorted["lucro_meta"]).tolist(),
+                "textposition": "outside",
+                "hovertemplate": "<b>%{y}</b><br>Lucro esperado: R$ %{x:,.0f}<extra></extra>",
+            }
+        ],
+        "layout": {
+            "title": {
+                "text": "Quais serviços mais pagam o seu bolso?",
+                "x": 0.5,
+                "xanchor": "center",
+            },
+            "xaxis": {"title": {"text": "Lucro Esperado (R$)"}},
+            "paper_bgcolor": COLORS["card_bg"],
+            "plot_bgcolor": COLORS["card_bg"],
+            "font": {"color": COLORS["text"]},
+            "height": 400 + len(df) * 15,
         },
-        xaxis_title="Lucro Esperado (R$)",
-        paper_bgcolor=COLORS["card_bg"],
-        plot_bgcolor=COLORS["card_bg"],
-        font={"color": COLORS["text"]},
-        height=400 + len(df) * 15,
-    )
+    }
+
+
+def grafico_rentabilidade_pareto(df):
+    fig = figura_rentabilidade_pareto(df)
 
     return html.Div(
         [
@@ -205,49 +353,259 @@ def grafico_rentabilidade_pareto(df):
     )
 
 
-def grafico_comparativo_financeiro(df):
-    fig = go.Figure()
-    fig.add_trace(
-        go.Bar(
-            name="Faturamento Previsto",
-            x=df["servico"],
-            y=df["faturamento_meta"],
-            marker_color=COLORS["blue"],
-        )
+@figura_em_cache()
+def figura_curva_horas(curva, horas_atuais):
+    curva = curva[curva["viavel"]]
+    linha, anotacoes = linha_vertical(
+        horas_atuais, COLORS["yellow"], tracejado="dash", texto=f"{horas_atuais:.0f}h"
     )
-    fig.add_trace(
-        go.Bar(
-            name="Faturamento Real",
-            x=df["servico"],
-            y=df["faturamento_real"],
-            marker_color=COLORS["green"],
-        )
+
+    return {
+        "data": [
+            {
+                "type": "scatter",
+                "x": curva["horas"].to_numpy(),
+                "y": curva["lucro"].to_numpy(),
+                "mode": "lines",
+                "line": {"color": COLORS["green"], "width": 3},
+                "customdata": curva["faturamento"].to_numpy(),
+                "hovertemplate": "<b>%{x:.0f}h</b><br>Lucro: R$ %{y:,.0f}"
+                "<br>Faturamento: R$ %{customdata:,.0f}<extra></extra>",
+            }
+        ],
+        "layout": {
+            "title": {
+                "text": "Quanto você ganha com mais (ou menos) horas?",
+                "x": 0.5,
+                "xanchor": "center",
+            },
+            "xaxis": {"title": {"text": "Horas disponíveis no mês"}},
+            "yaxis": {"title": {"text": "Lucro máximo (R$)"}},
+            "shapes": [linha],
+            "annotations": anotacoes,
+            "paper_bgcolor": COLORS["card_bg"],
+            "plot_bgcolor": COLORS["card_bg"],
+            "font": {"color": COLORS["text"]},
+            "height": 400,
+        },
+    }
+
+
+def grafico_curva_horas(curva, horas_atuais):
+    fig = figura_curva_horas(curva, horas_atuais)
+
+    return html.Div(
+        [
+            html.Div(
+                "Cada ponto da linha é o lucro máximo para aquela quantidade de horas. "
+                "Onde a linha fica plana, horas extras não trazem mais lucro.",
+                style={
+                    "color": COLORS["gray"],
+                    "fontSize": "13px",
+                    "marginBottom": "10px",
+                },
+            ),
+            dcc.Graph(figure=fig, config={"displayModeBar": False}),
+        ],
+        style={
+            "backgroundColor": COLORS["card_bg"],
+            "padding": "15px",
+            "borderRadius": "12px",
+            "margin": "10px 0",
+        },
     )
-    fig.add_trace(
-        go.Bar(
-            name="Custo Real (mão de obra + material)",
-            x=df["servico"],
-            y=df["quantidade_real"] * df["custo"],
-            marker_color=COLORS["red"],
-        )
+
+
+@figura_em_cache("mes", "lucro_meta", "lucro_real", "aderencia_lucro_movel")
+def figura_tendencia(tendencia):
+    meses = tendencia["mes"].tolist()
+    return {
+        "data": [
+            {
+                "type": "bar",
+                "name": "Lucro planejado",
+                "x": meses,
+                "y": tendencia["lucro_meta"].to_numpy(),
+                "marker": {"color": COLORS["blue"]},
+            },
+            {
+                "type": "bar",
+                "name": "Lucro real",
+                "x": meses,
+                "y": tendencia["lucro_real"].to_numpy(),
+                "marker": {"color": COLORS["green"]},
+            },
+            {
+                "type": "scatter",
+                "name": "Aderência (média móvel)",
+                "x": meses,
+                "y": tendencia["aderencia_lucro_movel"].to_numpy(),
+                "yaxis": "y2",
+                "mode": "lines+markers",
+                "line": {"color": COLORS["yellow"], "width": 3},
+                "hovertemplate": "%{x}: %{y:.0%}<extra></extra>",
+            },
+        ],
+        "layout": {
+            "barmode": "group",
+            "title": {"text": "Planejado × realizado mês a mês"},
+            "yaxis": {"title": {"text": "Lucro (R$)"}},
+            "yaxis2": {
+                "overlaying": "y",
+                "side": "right",
+                "tickformat": ".0%",
+                "showgrid": False,
+            },
+            "paper_bgcolor": COLORS["card_bg"],
+            "plot_bgcolor": COLORS["card_bg"],
+            "font": {"color": COLORS["text"]},
+            "legend": {
+                "orientation": "h",
+                "yanchor": "bottom",
+                "y": 1.02,
+                "xanchor": "right",
+                "x": 1,
+            },
+            "height": 400,
+        },
+    }
+
+
+def grafico_tendencia(tendencia):
+    if len(tendencia) < 2:
+        return html.Div()
+
+    fig = figura_tendencia(tendencia)
+
+    return html.Div(
+        [
+            html.Div(
+                "Meses fechados: planejado × realizado. A linha amarela é o lucro "
+                "real dividido pelo planejado nos últimos meses.",
+                style={
+                    "color": COLORS["gray"],
+                    "fontSize": "13px",
+                    "marginBottom": "10px",
+                },
+            ),
+            dcc.Graph(figure=fig, config={"displayModeBar": False}),
+        ],
+        style={
+            "backgroundColor": COLORS["card_bg"],
+            "padding": "15px",
+            "borderRadius": "12px",
+            "margin": "10px 0",
+        },
     )
 
-    fig.update_layout(
-        barmode="group",
-        title="O que você planejou × O que realmente aconteceu",
-        paper_bgcolor=COLORS["card_bg"],
-        plot_bgcolor=COLORS["card_bg"],
-        font={"color": COLORS["text"]},
-        legend={
-            "orientation": "h",
-            "yanchor": "bottom",
-            "y": 1.02,
-            "xanchor": "right",
-            "x": 1,
+
+def cards_sensibilidade(df):
+    valor_hora = df.attrs.get("valor_hora")
+    if valor_hora is None:
+        return html.Div()
+
+    inicio, fim = df.attrs.get("faixa_horas", (math.nan, math.nan))
+    if math.isfinite(inicio) and math.isfinite(fim):
+        explicacao = f"Vale de {inicio:.0f}h a {fim:.0f}h disponíveis"
+    elif math.isfinite(inicio):
+        explicacao = f"Acima de {inicio:.0f}h as horas extras sobram"
+    else:
+        explicacao = "Lucro extra de cada hora a mais no mês"
+    if df.attrs.get("gap_mip") is not None:
+        explicacao += " (relaxação linear)"
+
+    cards = [card_metrica("VALOR DE +1 HORA", valor_hora, explicacao, COLORS["yellow"])]
+
+    for recurso, preco in (df.attrs.get("precos_recursos") or {}).items():
+        cards.append(
+            card_metrica(
+                f"VALOR DE +1 {recurso.removeprefix('recurso_').upper()}",
+                preco,
+                "Lucro extra de cada unidade a mais de capacidade",
+                COLORS["purple"],
+            )
+        )
+
+    candidatos = df[(df["custo_reduzido"] < -1e-9) & (df["maximo"] > df["minimo"])]
+    if len(candidatos):
+        proximo = candidatos.loc[candidatos["custo_reduzido"].idxmax()]
+        falta = (
+            f"{-proximo['custo_reduzido']:,.2f}".replace(",", "X")
+            .replace(".", ",")
+            .replace("X", ".")
+        )
+        cards.append(
+            card_metrica(
+                "MAIS PERTO DE ENTRAR NO PLANO",
+                proximo["servico"],
+                f"Precisa de +R$ {falta} de lucro por unidade",
+                COLORS["blue"],
+                is_moeda=False,
+            )
+        )
+
+    return html.Div(
+        cards,
+        style={
+            "display": "flex",
+            "flexWrap": "wrap",
+            "gap": "20px",
+            "justifyContent": "center",
+            "margin": "30px 0",
         },
-        height=500,
     )
 
+
+@figura_em_cache(
+    "servico", "faturamento_meta", "faturamento_real", "quantidade_real", "custo"
+)
+def figura_comparativo_financeiro(df):
+    servicos = df["servico"].tolist()
+    return {
+        "data": [
+            {
+                "type": "bar",
+                "name": "Faturamento Previsto",
+                "x": servicos,
+                "y": df["faturamento_meta"].to_numpy(),
+                "marker": {"color": COLORS["blue"]},
+            },
+            {
+                "type": "bar",
+                "name": "Faturamento Real",
+                "x": servicos,
+                "y": df["faturamento_real"].to_numpy(),
+                "marker": {"color": COLORS["green"]},
+            },
+            {
+                "type": "bar",
+                "name": "Custo Real (mão de obra + material)",
+                "x": servicos,
+                "y": (df["quantidade_real"] * df["custo"]).to_numpy(),
+                "marker": {"color": COLORS["red"]},
+            },
+        ],
+        "layout": {
+            "barmode": "group",
+            "title": {"text": "O que você planejou × O que realmente aconteceu"},
+            "paper_bgcolor": COLORS["card_bg"],
+            "plot_bgcolor": COLORS["card_bg"],
+            "font": {"color": COLORS["text"]},
+            "legend": {
+                "orientation": "h",
+                "yanchor": "bottom",
+                "y": 1.02,
+                "xanchor": "right",
+                "x": 1,
+            },
+            "height": 500,
+        },
+    }
+
+
+def grafico_comparativo_financeiro(df):
+    fig = figura_comparativo_financeiro(df)
+
     return html.Div(
         [
             html.Div(
@@ -270,34 +628,43 @@ def grafico_comparativo_financeiro(df):
     )
 
 
-def grafico_waterfall_financeiro(df):
+@figura_em_cache("servico", "desvio_lucro")
+def figura_waterfall_financeiro(df):
     valores = df["desvio_lucro"].tolist()
     servicos = df["servico"].tolist()
 
     medida = ["relative"] * len(valores) + ["total"]
-    fig = go.Figure(
-        go.Waterfall(
-            orientation="v",
-            measure=medida,
-            x=servicos + ["TOTAL"],
-            textposition="outside",
-            text=[f"R$ {abs(v):,.0f}{' (perda)' if v<0 else ''}" for v in valores]
-            + [f"R$ {sum(valores):,.0f}"],
-            y=valores + [sum(valores)],
-            connector={"line": {"color": "white"}},
-            increasing={"marker": {"color": COLORS["green"]}},
-            decreasing={"marker": {"color": COLORS["red"]}},
-            totals={"marker": {"color": COLORS["purple"]}},
-        )
-    )
+    return {
+        "data": [
+            {
+                "type": "waterfall",
+                "orientation": "v",
+                "measure": medida,
+                "x": servicos + ["TOTAL"],
+                "textposition": "outside",
+                "text": [
+                    f"R$ {abs(v):,.0f}{' (perda)' if v<0 else ''}" for v in valores
+                ]
+                + [f"R$ {sum(valores):,.0f}"],
+                "y": valores + [sum(valores)],
+                "connector": {"line": {"color": "white"}},
+                "increasing": {"marker": {"color": COLORS["green"]}},
+                "decreasing": {"marker": {"color": COLORS["red"]}},
+                "totals": {"marker": {"color": COLORS["purple"]}},
+            }
+        ],
+        "layout": {
+            "title": {"text": "Onde você ganhou ou perdeu dinheiro este mês?"},
+            "paper_bgcolor": COLORS["card_bg"],
+            "plot_bgcolor": COLORS["card_bg"],
+            "font": {"color": COLORS["text"]},
+            "height": 500,
+        },
+    }
 
-    fig.update_layout(
-        title="Onde você ganhou ou perdeu dinheiro este mês?",
-        paper_bgcolor=COLORS["card_bg"],
-        plot_bgcolor=COLORS["card_bg"],
-        font={"color": COLORS["text"]},
-        height=500,
-    )
+
+def grafico_waterfall_financeiro(df):
+    fig = figura_waterfall_financeiro(df)
 
     return html.Div(
         [
@@ -321,52 +688,62 @@ def grafico_waterfall_financeiro(df):
     )
 
 
+@figura_em_cache()
+def figura_gauge(real, meta, titulo, prefix):
+    return {
+        "data": [
+            {
+                "type": "indicator",
+                "mode": "gauge+number+delta",
+                "value": real,
+                "number": {"prefix": prefix, "valueformat": ",.0f"},
+                "delta": {"reference": meta},
+                "gauge": {
+                    "axis": {"range": [0, meta * 1.4]},
+                    "bar": {"color": COLORS["purple"]},
+                    "steps": [
+                        {"range": [0, meta * 0.8], "color": "#ef4444"},  # vermelho
+                        {"range": [meta * 0.8, meta], "color": "#f59e0b"},  # amarelo
+                        {"range": [meta, meta * 1.4], "color": "#10b981"},  # verde
+                    ],
+                    "threshold": {
+                        "line": {"color": "white", "width": 6},
+                        "value": meta,
+                    },
+                },
+                "title": {"text": titulo},
+            }
+        ],
+        "layout": {
+            "paper_bgcolor": COLORS["card_bg"],
+            "font": {"color": "white"},
+            "height": 300,
+        },
+    }
+
+
 def grafico_gauge(real, meta, titulo, prefix):
-    fig = go.Figure(
-        go.Indicator(
-            mode="gauge+number+delta",
-            value=real,
-            number={"prefix": prefix, "valueformat": ",.0f"},
-            delta={"reference": meta},
-            gauge={
-                "axis": {"range": [0, meta * 1.4]},
-                "bar": {"color": COLORS["purple"]},
-                "steps": [
-                    {"range": [0, meta * 0.8], "color": "#ef4444"},  # vermelho sólido
-                    {"range": [meta * 0.8, meta], "color": "#f59e0b"},  # amarelo sólido
-                    {"range": [meta, meta * 1.4], "color": "#10b981"},  # verde sólido
-                ],
-                "threshold": {"line": {"color": "white", "width": 6}, "value": meta},
-            },
-            title={"text": titulo},
-        )
-    )
-    fig.update_layout(
-        paper_bgcolor=COLORS["card_bg"], font={"color": "white"}, height=300
-    )
+    fig = figura_gauge(float(real), float(meta), titulo, prefix)
     return dcc.Graph(figure=fig, config={"displayModeBar": False})
 
 
-def gauges_por_servico(df):
-    gauges = []
+@figura_em_cache()
+def figura_gauge_servico(servico, realizado, meta):
+    percentual = min((realizado / meta) * 100, 150)
 
-    for _, row in df.iterrows():
-        servico = row["servico"]
-        realizado = float(row["quantidade_real"] or 0)
-        meta = max(float(row["qtd_sugerida"]), 1)
-        percentual = min((realizado / meta) * 100, 150)
-
-        fig = go.Figure(
-            go.Indicator(
-                mode="gauge+number+delta",
-                value=percentual,
-                number={"suffix": "%", "font": {"size": 32, "color": "white"}},
-                delta={"reference": 100, "relative": False, "position": "top"},
-                title={
+    return {
+        "data": [
+            {
+                "type": "indicator",
+                "mode": "gauge+number+delta",
+                "value": percentual,
+                "number": {"suffix": "%", "font": {"size": 32, "color": "white"}},
+                "delta": {"reference": 100, "relative": False, "position": "top"},
+                "title": {
                     "text": f"<b>{servico}</b><br>{int(realizado)} de {int(meta)}",
                     "font": {"size": 16},
                 },
-                gauge={
+                "gauge": {
                     "axis": {
                         "range": [0, 120],
                         "tickvals": [0, 70, 100, 120],
@@ -395,27 +772,118 @@ def gauges_por_servico(df):
                         "value": 100,
                     },
                 },
-            )
-        )
+            }
+        ],
+        "layout": {
+            "height": 300,
+            "margin": {"l": 30, "r": 30, "t": 70, "b": 20},
+            "paper_bgcolor": COLORS["card_bg"],
+            "font": {"color": "white"},
+        },
+    }
+
+
+def gauge_servico(servico, realizado, meta):
+    fig = figura_gauge_servico(servico, realizado, meta)
+
+    return html.Div(
+        dcc.Graph(figure=fig, config={"displayModeBar": False}),
+        style={
+            "width": "340px",
+            "margin": "20px",
+            "display": "inline-block",
+            "verticalAlign": "top",
+        },
+    )
+
+
+def total_paginas(n_linhas, por_pagina):
+    return max(math.ceil(n_linhas / por_pagina), 1)
+
+
+@figura_em_cache("servico", "quantidade_real", "qtd_sugerida")
+def figura_bullet_servicos(df):
+    realizado = df["quantidade_real"].fillna(0).astype(float)
+    meta = df["qtd_sugerida"].astype(float).clip(lower=1)
+    percentual = (realizado / meta * 100).clip(upper=150).to_numpy()
+
+    cores = np.select(
+        [percentual >= 100, percentual >= 70],
+        [COLORS["green"], COLORS["yellow"]],
+        COLORS["red"],
+    )
+    linha, _ = linha_vertical(100, "white", largura=3)
+
+    return {
+        "data": [
+            {
+                "type": "bar",
+                "x": percentual,
+                "y": df["servico"].tolist(),
+                "orientation": "h",
+                "marker": {"color": cores.tolist()},
+                "customdata": np.column_stack(
+                    [realizado.astype(int), meta.astype(int)]
+                ),
+                "hovertemplate": "<b>%{y}</b><br>%{x:.0f}% da meta"
+                "<br>%{customdata[0]} de %{customdata[1]}<extra></extra>",
+            }
+        ],
+        "layout": {
+            "xaxis": {"range": [0, 150], "ticksuffix": "%"},
+            "yaxis": {"autorange": "reversed"},
+            "shapes": [linha],
+            "paper_bgcolor": COLORS["card_bg"],
+            "plot_bgcolor": COLORS["card_bg"],
+            "font": {"color": COLORS["text"]},
+            "margin": {"l": 20, "r": 20, "t": 20, "b": 20},
+            "height": 150 + len(df) * 22,
+        },
+    }
+
 
-        fig.update_layout(
-            height=300,
-            margin=dict(l=30, r=30, t=70, b=20),
-            paper_bgcolor=COLORS["card_bg"],
-            font={"color": "white"},
+def grafico_bullet_servicos(df):
+    fig = figura_bullet_servicos(df)
+    return dcc.Graph(figure=fig, config={"displayModeBar": False})
+
+
+def grade_gauges(df, pagina=0, por_pagina=GAUGES_POR_PAGINA, modo="gauges"):
+    if modo == "compacto":
+        return grafico_bullet_servicos(df)
+
+    inicio = pagina * por_pagina
+    df_pagina = df.iloc[inicio : inicio + por_pagina]
+
+    gauges = [
+        gauge_servico(
+            row["servico"],
+            float(row["quantidade_real"] or 0),
+            max(float(row["qtd_sugerida"]), 1),
         )
+        for _, row in df_pagina.iterrows()
+    ]
 
-        gauges.append(
+    return html.Div(
+        [
             html.Div(
-                dcc.Graph(figure=fig, config={"displayModeBar": False}),
-                style={
-                    "width": "340px",
-                    "margin": "20px",
-                    "display": "inline-block",
-                    "verticalAlign": "top",
-                },
-            )
-        )
+                f"Página {pagina + 1} de {total_paginas(len(df), por_pagina)}",
+                style={"color": COLORS["gray"], "fontSize": "14px"},
+            ),
+            html.Div(gauges),
+        ]
+    )
+
+
+def gauges_por_servico(df, por_pagina=GAUGES_POR_PAGINA):
+    estilo_botao = {
+        "padding": "8px 16px",
+        "backgroundColor": "#334155",
+        "color": "white",
+        "border": "none",
+        "borderRadius": "6px",
+        "cursor": "pointer",
+        "margin": "0 6px",
+    }
 
     return html.Div(
         [
@@ -429,52 +897,343 @@ def gauges_por_servico(df):
                     "fontWeight": "bold",
                 },
             ),
-            html.Div(gauges, style={"textAlign": "center", "padding": "20px"}),
+            html.Div(
+                [
+                    dcc.RadioItems(
+                        id="gauges-modo",
+                        options=[
+                            {"label": " Velocímetros", "value": "gauges"},
+                            {
+                                "label": " Todos os serviços (compacto)",
+                                "value": "compacto",
+                            },
+                        ],
+                        value="gauges",
+                        inline=True,
+                        inputStyle={"marginLeft": "15px"},
+                        style={"color": "white", "display": "inline-block"},
+                    ),
+                    html.Button(
+                        "◀", id="gauges-anterior", n_clicks=0, style=estilo_botao
+                    ),
+                    html.Button(
+                        "▶", id="gauges-proxima", n_clicks=0, style=estilo_botao
+                    ),
+                ],
+                style={"textAlign": "center"},
+            ),
+            dcc.Store(id="gauges-pagina", data=0),
+            html.Div(
+                grade_gauges(df, 0, por_pagina),
+                id="gauges-grade",
+                style={"textAlign": "center", "padding": "20px"},
+            ),
         ]
     )
 
 
-def tabela_detalhada(df):
-    df_vis = df[
+def secao_robustez(max_cenarios=None):
+    estilo_input = {
+        "width": "90px",
+        "padding": "8px",
+        "borderRadius": "5px",
+        "border": "none",
+        "backgroundColor": "#334155",
+        "color": "white",
+        "margin": "0 15px 0 6px",
+    }
+
+    return html.Div(
         [
-            "servico",
-            "qtd_sugerida",
-            "quantidade_real",
-            "lucro_meta",
-            "lucro_real",
-            "desvio_lucro",
+            html.H2(
+                "E se os tempos e preços variarem?",
+                style={
+                    "textAlign": "center",
+                    "color": COLORS["blue"],
+                    "margin": "60px 0 10px",
+                    "fontSize": "28px",
+                    "fontWeight": "bold",
+                },
+            ),
+            html.P(
+                "Simula milhares de meses com tempos e preços sorteados em torno do "
+                "template e mostra quanto o plano rende e quantas vezes ele estoura "
+                "as horas.",
+                style={"textAlign": "center", "color": COLORS["gray"]},
+            ),
+            html.Div(
+                [
+                    html.Label("Variação do tempo (%)", style={"color": "white"}),
+                    dcc.Input(
+                        id="robustez-variacao-tempo",
+                        type="number",
+                        value=15,
+                        min=0,
+                        style=estilo_input,
+                    ),
+                    html.Label("Variação dos preços (%)", style={"color": "white"}),
+                    dcc.Input(
+                        id="robustez-variacao-preco",
+                        type="number",
+                        value=5,
+                        min=0,
+                        style=estilo_input,
+                    ),
+                    html.Label("Cenários", style={"color": "white"}),
+                    dcc.Input(
+                        id="robustez-cenarios",
+                        type="number",
+                        value=10_000,
+                        min=100,
+                        max=max_cenarios,
+                        step=100,
+                        style=estilo_input,
+                    ),
+                    html.Button(
+                        "SIMULAR",
+                        id="btn-robustez",
+                        n_clicks=0,
+                        style={
+                            "padding": "8px 16px",
+                            "backgroundColor": COLORS["blue"],
+                            "color": "white",
+                            "border": "none",
+                            "borderRadius": "6px",
+                            "cursor": "pointer",
+                            "fontWeight": "bold",
+                        },
+                    ),
+                ],
+                style={"textAlign": "center", "margin": "20px 0"},
+            ),
+            dcc.Loading(
+                html.Div(id="robustez-resultado"),
+                type="dot",
+                color=COLORS["blue"],
+            ),
         ]
-    ].copy()
-    df_vis.columns = [
-        "Serviço",
-        "Qtd Ideal",
-        "Qtd Feita",
-        "Lucro Ideal",
-        "Lucro Real",
-        "Diferença",
-    ]
+    )
+
+
+@figura_em_cache("lucro_plano", "lucro_otimo")
+def figura_histograma_cenarios(cenarios):
+    # Histogramas pré-calculados: só as barras vão para o navegador, não os
+    # milhares de cenários.
+    valores = [cenarios["lucro_plano"], cenarios["lucro_otimo"].dropna()]
+    bordas = np.histogram_bin_edges(np.concatenate(valores), bins=50)
+    centros = (bordas[:-1] + bordas[1:]) / 2
+
+    barras = []
+    for nome, serie, cor in [
+        ("Plano atual", valores[0], COLORS["green"]),
+        ("Replanejando a cada mês", valores[1], COLORS["purple"]),
+    ]:
+        contagem, _ = np.histogram(serie, bins=bordas)
+        barras.append(
+            {
+                "type": "bar",
+                "x": centros,
+                "y": contagem / max(len(cenarios), 1),
+                "name": nome,
+                "marker": {"color": cor},
+                "opacity": 0.7,
+                "hovertemplate": "R$ %{x:,.0f}<br>%{y:.1%} dos meses<extra></extra>",
+            }
+        )
+
+    return {
+        "data": barras,
+        "layout": {
+            "barmode": "overlay",
+            "bargap": 0,
+            "xaxis": {"title": {"text": "Lucro do mês (R$)"}},
+            "yaxis": {"title": {"text": "Fração dos cenários"}, "tickformat": ".0%"},
+            "paper_bgcolor": COLORS["card_bg"],
+            "plot_bgcolor": COLORS["card_bg"],
+            "font": {"color": COLORS["text"]},
+            "legend": {"orientation": "h", "y": 1.05},
+            "height": 400,
+        },
+    }
+
+
+def resultado_robustez(resumo, cenarios):
+    plano = resumo.loc["plano_atual"]
+    reotimizado = resumo.loc["reotimizado"]
+
+    cards = html.Div(
+        [
+            card_metrica(
+                "LUCRO NO PIOR CASO (P5)",
+                plano["p5"],
+                "Em 95% dos meses o plano rende mais que isso",
+                COLORS["red"],
+            ),
+            card_metrica(
+                "LUCRO TÍPICO (MEDIANA)",
+                plano["p50"],
+                "Metade dos meses fica acima, metade abaixo",
+                COLORS["green"],
+            ),
+            card_metrica(
+                "LUCRO NO MELHOR CASO (P95)",
+                plano["p95"],
+                "Só 5% dos meses rendem mais que isso",
+                COLORS["blue"],
+            ),
+            card_metrica(
+                "MESES EM QUE O PLANO ESTOURA AS HORAS",
+                f"{plano['taxa_inviavel']:.1%}".replace(".", ","),
+                "Replanejando em cada mês, a mediana seria "
+                + formatar_moeda([reotimizado["p50"]])[0],
+                COLORS["yellow"],
+                is_moeda=False,
+            ),
+        ],
+        style={
+            "display": "flex",
+            "flexWrap": "wrap",
+            "gap": "20px",
+            "justifyContent": "center",
+            "margin": "30px 0",
+        },
+    )
+
+    fig = figura_histograma_cenarios(cenarios)
+
+    return html.Div(
+        [
+            cards,
+            html.Div(
+                dcc.Graph(figure=fig, config={"displayModeBar": False}),
+                style={
+                    "backgroundColor": COLORS["card_bg"],
+                    "padding": "15px",
+                    "borderRadius": "12px",
+                    "margin": "10px 0",
+                },
+            ),
+        ]
+    )
+
+
+COLUNAS_TABELA = {
+    "Serviço": "servico",
+    "Qtd Ideal": "qtd_sugerida",
+    "Qtd Feita": "quantidade_real",
+    "Lucro Ideal": "lucro_meta",
+    "Lucro Real": "lucro_real",
+    "Diferença": "desvio_lucro",
+}
+TABELA_POR_PAGINA = 15
+
+OPERADORES_FILTRO = {
+    ">=": "ge",
+    "<=": "le",
+    "<": "lt",
+    ">": "gt",
+    "!=": "ne",
+    "=": "eq",
+}
+RE_FILTRO = re.compile(
+    r"^\{(?P<coluna>[^}]+)\}\s*"
+    r"(?P<op>[is]?(?:>=|<=|!=|<|>|=|ge|le|lt|gt|ne|eq|contains|datestartswith))"
+    r"\s+(?P<valor>.+)$"
+)
+
+
+def formatar_moeda(valores, sinal=False):
+    valores = pd.Series(valores).fillna(0).astype(float)
+    inteiros = (
+        valores.abs()
+        .round(0)
+        .astype("int64")
+        .astype(str)
+        .str.replace(r"\B(?=(\d{3})+(?!\d))", ".", regex=True)
+    )
+    negativo = valores.to_numpy() < 0
+
+    if sinal:
+        prefixo = np.where(negativo, "-R$ ", "+R$ ")
+    else:
+        prefixo = np.where(negativo, "R$ -", "R$ ")
+
+    return prefixo + inteiros
+
+
+def dados_tabela(df):
+    df_vis = df[list(COLUNAS_TABELA.values())].copy()
+    df_vis.columns = list(COLUNAS_TABELA)
 
     df_vis["Qtd Ideal"] = df_vis["Qtd Ideal"].round(0).astype(int)
     df_vis["Qtd Feita"] = df_vis["Qtd Feita"].fillna(0).round(0).astype(int)
 
-    def formatar_moeda(valor):
-        if pd.isna(valor):
-            return "R$ 0"
-        valor = float(valor)
-        return f"R$ {valor:,.0f}".replace(",", "X").replace(".", ",").replace("X", ".")
-
-    df_vis["Lucro Ideal"] = df_vis["Lucro Ideal"].apply(formatar_moeda)
-    df_vis["Lucro Real"] = df_vis["Lucro Real"].apply(formatar_moeda)
-    df_vis["Diferença"] = df_vis["Diferença"].apply(
-        lambda x: (
-            f"+{formatar_moeda(abs(x))}"
-            if x >= 0
-            else f"-{formatar_moeda(abs(x))}".replace("R$ +", "R$ ").replace(
-                "R$ -", "-R$ "
-            )
-        )
+    df_vis["Lucro Ideal"] = formatar_moeda(df_vis["Lucro Ideal"])
+    df_vis["Lucro Real"] = formatar_moeda(df_vis["Lucro Real"])
+    df_vis["Diferença"] = formatar_moeda(df_vis["Diferença"], sinal=True)
+
+    return df_vis.to_dict("records")
+
+
+def filtrar_tabela(df, filter_query):
+    for parte in (filter_query or "").split(" && "):
+        encontrado = RE_FILTRO.match(parte.strip())
+        if not encontrado or encontrado["coluna"] not in COLUNAS_TABELA:
+            continue
+
+        coluna = df[COLUNAS_TABELA[encontrado["coluna"]]]
+        op = encontrado["op"].lstrip("is")
+        op = OPERADORES_FILTRO.get(op, op)
+        valor = encontrado["valor"].strip().strip("\"'`")
+
+        if op in ("contains", "datestartswith") or not pd.api.types.is_numeric_dtype(
+            coluna
+        ):
+            texto = coluna.astype(str).str.lower()
+            if op == "datestartswith":
+                mascara = texto.str.startswith(valor.lower())
+            elif op == "contains":
+                mascara = texto.str.contains(valor.lower(), regex=False)
+            else:
+                mascara = getattr(texto, f"__{op}__")(valor.lower())
+        else:
+            # Mesma leitura dos uploads: "1.000" é mil e "1.000,50" também vale.
+            numero = data_manager.converter_numeros_br(pd.Series([valor]))[0]
+            if pd.isna(numero):
+                continue
+            mascara = getattr(coluna, f"__{op}__")(numero)
+
+        df = df[mascara]
+
+    return df
+
+
+def ordenar_tabela(df, sort_by):
+    if not sort_by:
+        return df
+
+    return df.sort_values(
+        [COLUNAS_TABELA[s["column_id"]] for s in sort_by],
+        ascending=[s["direction"] == "asc" for s in sort_by],
+        kind="stable",
     )
 
+
+def pagina_tabela(
+    df, page_current=0, page_size=TABELA_POR_PAGINA, sort_by=None, filter_query=""
+):
+    df = ordenar_tabela(filtrar_tabela(df, filter_query), sort_by)
+
+    n_paginas = total_paginas(len(df), page_size)
+    pagina = min(page_current or 0, n_paginas - 1)
+    inicio = pagina * page_size
+
+    return dados_tabela(df.iloc[inicio : inicio + page_size]), n_paginas
+
+
+def tabela_detalhada(df):
+    dados, n_paginas = pagina_tabela(df)
+
     return html.Div(
         [
             html.H3(
@@ -491,7 +1250,8 @@ def tabela_detalhada(df):
                 },
             ),
             dash_table.DataTable(
-                data=df_vis.to_dict("records"),
+                id="tabela-detalhada",
+                data=dados,
                 columns=[
                     {"name": "Serviço", "id": "Serviço"},
                     {"name": "Qtd Ideal", "id": "Qtd Ideal"},
@@ -539,7 +1299,15 @@ def tabela_detalhada(df):
                     },
                 ],
                 style_table={"overflowX": "auto"},
-                page_size=15,
+                page_current=0,
+                page_size=TABELA_POR_PAGINA,
+                page_count=n_paginas,
+                page_action="custom",
+                sort_action="custom",
+                sort_mode="multi",
+                sort_by=[],
+                filter_action="custom",
+                filter_query="",
             ),
         ],
         style={
@@ -595,3 +1363,13 @@ def upload_area(id_componente, texto_label):
         style_reject={"borderColor": COLORS["red"]},
         multiple=False,
     )
+
+
+def seletor_arquivo_servidor(id_componente):
+    return dcc.Dropdown(
+        id=id_componente,
+        options=[],
+        placeholder="ou escolha um arquivo do servidor",
+        clearable=True,
+        style={"marginBottom": "10px", "color": "#0f172a", "fontSize": "13px"},
+    )
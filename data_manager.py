@@ -1,46 +1,660 @@
 import base64
+import hashlib
 import io
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
 import pandas as pd
 
+import metricas
+
+COLUNAS_NUMERICAS_TEMPLATE = ["tempo", "custo", "venda", "minimo", "maximo"]
+COLUNAS_NUMERICAS_REALIZADO = ["quantidade"]
+COLUNAS_VARIACAO = ["variacao_tempo", "variacao_custo", "variacao_venda"]
+PREFIXO_RECURSO = "recurso_"
+ABA_CAPACIDADE = "capacidade"
+RE_LIXO_NUMERICO = re.compile(r"R\$|\s")
+RE_MILHAR_PONTO = re.compile(r"[-+]?\d{1,3}(\.\d{3})+")
+RE_ACENTOS = "[\u0300-\u036f]"
+RE_ESPACOS = r"\s+"
+MAX_INDICES = 16
+TAMANHO_BLOCO = 100_000
+EXTENSOES = (".csv", ".xlsx", ".xls")
+RE_ID_UPLOAD = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+UPLOADS_HABILITADOS = os.environ.get("SIMPLEX_UPLOADS", "").lower() in (
+    "1",
+    "true",
+    "sim",
+)
+MAX_BYTES_UPLOAD = int(os.environ.get("SIMPLEX_UPLOAD_MAX_BYTES", 1024 * 1024 * 1024))
+MAX_BYTES_PARCIAIS = int(
+    os.environ.get("SIMPLEX_UPLOAD_MAX_BYTES_TOTAL", 4 * 1024 * 1024 * 1024)
+)
+PRAZO_PARCIAIS = float(os.environ.get("SIMPLEX_UPLOAD_PRAZO", 24 * 3600))
+DIRETORIO_ARQUIVOS = os.environ.get(
+    "SIMPLEX_DIRETORIO_ARQUIVOS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "arquivos"),
+)
+DIRETORIO_SNAPSHOTS = os.environ.get(
+    "SIMPLEX_DIRETORIO_SNAPSHOTS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "snapshots"),
+)
+
+
+class ErroUpload(ValueError):
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class CacheDataFrames:
+    def __init__(self, nome, max_entradas=32, max_bytes=512 * 1024 * 1024):
+        self.nome = nome
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Segundo nível opcional (ex.: diskcache.Cache), compartilhado entre os
+        # processos que executam os callbacks em segundo plano.
+        self.disco = None
+
+    def get(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                self._itens.move_to_end(chave)
+                self.hits += 1
+                metricas.metricas.contar_cache(self.nome, True)
+                return item[0].copy()
+
+        df = self.disco.get(chave) if self.disco is not None else None
+
+        with self._lock:
+            if df is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        metricas.metricas.contar_cache(self.nome, df is not None)
+        if df is None:
+            return None
+
+        self._guardar(chave, df)
+        return df.copy()
+
+    def put(self, chave, df):
+        if self.disco is not None:
+            self.disco.set(chave, df)
+        self._guardar(chave, df)
+
+    def _guardar(self, chave, df):
+        tamanho = int(df.memory_usage(deep=True).sum())
+        if tamanho > self.max_bytes:
+            return
+
+        with self._lock:
+            if chave in self._itens:
+                self._bytes -= self._itens.pop(chave)[1]
+            self._itens[chave] = (df.copy(), tamanho)
+            self._bytes += tamanho
+
+            while self._itens and (
+                len(self._itens) > self.max_entradas or self._bytes > self.max_bytes
+            ):
+                _, (_, tamanho_antigo) = self._itens.popitem(last=False)
+                self._bytes -= tamanho_antigo
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def estatisticas(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entradas": len(self._itens),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+cache_uploads = CacheDataFrames("uploads")
+cache_resultados = CacheDataFrames("resultados", max_entradas=64)
+
+
+class IndiceServicos:
+    def __init__(self, servicos):
+        # Cada linha do template aponta para a posição do seu nome normalizado;
+        # o pd.Index guarda a tabela hash para as próximas consultas.
+        codigos, normalizados = fatorar_servicos(servicos)
+        posicoes, chaves = pd.factorize(normalizados)
+        self.codigos = posicoes[codigos]
+        self.chaves = pd.Index(chaves, dtype=object)
+
+    def agregar(self, servicos, quantidades):
+        codigos, normalizados = fatorar_servicos(servicos)
+        posicoes = self.chaves.get_indexer(normalizados)[codigos]
+        encontrados = posicoes >= 0
+        totais = np.bincount(
+            posicoes[encontrados],
+            weights=np.nan_to_num(np.asarray(quantidades, dtype=float))[encontrados],
+            minlength=len(self.chaves),
+        )
+        return totais[self.codigos]
+
+
+_indices = OrderedDict()
+_indices_lock = threading.Lock()
+
+
+def fatorar_servicos(servicos):
+    # Normaliza só os valores distintos: caixa, acentos e espaços não mudam o
+    # serviço ("Lavagem  Completa" e "lavagem completa" são o mesmo).
+    codigos, valores = pd.factorize(pd.Series(servicos).fillna("").astype(str))
+    valores = pd.Series(valores)
+
+    acentuados = ~valores.str.isascii()
+    if acentuados.any():
+        valores[acentuados] = (
+            valores[acentuados]
+            .str.normalize("NFKD")
+            .str.replace(RE_ACENTOS, "", regex=True)
+        )
+
+    normalizados = (
+        valores.str.lower()
+        .str.replace(RE_ESPACOS, " ", regex=True)
+        .str.strip()
+        .to_numpy(dtype=object)
+    )
+    return codigos, normalizados
+
+
+def normalizar_servicos(servicos):
+    codigos, normalizados = fatorar_servicos(servicos)
+    return normalizados[codigos]
+
+
+def obter_indice_servicos(servicos):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update("\x1f".join(pd.Series(servicos).astype(str).tolist()).encode())
+    chave = digest.hexdigest()
+
+    with _indices_lock:
+        indice = _indices.get(chave)
+        if indice is not None:
+            _indices.move_to_end(chave)
+            return indice
+
+    indice = IndiceServicos(servicos)
+
+    with _indices_lock:
+        _indices[chave] = indice
+        while len(_indices) > MAX_INDICES:
+            _indices.popitem(last=False)
+
+    return indice
+
+
+def digest_upload(contents):
+    # Hash do conteúdo em base64 de um dcc.Upload, calculado uma vez por
+    # cálculo e reaproveitado na chave do cache de leitura e na de origem.
+    if contents is None:
+        return None
+    content_string = contents.split(",", 1)[1]
+    return hashlib.blake2b(content_string.encode("ascii"), digest_size=16).hexdigest()
+
+
+def chave_upload(digest, filename, colunas_numericas=None):
+    return (digest, filename, tuple(colunas_numericas or ()))
+
 
-def parse_upload(contents, filename):
+def chave_origem(*entradas):
+    digest = hashlib.blake2b(digest_size=16)
+    for entrada in entradas:
+        digest.update(str(entrada).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def chave_resultado(sessao_id, *entradas):
+    return f"{sessao_id}:{chave_origem(*entradas)}"
+
+
+def caminho_snapshot(origem):
+    return os.path.join(DIRETORIO_SNAPSHOTS, f"{origem}.arrow")
+
+
+def salvar_snapshot(origem, df):
+    import pyarrow as pa
+
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    metadados = dict(tabela.schema.metadata or {})
+    metadados[b"simplex_attrs"] = json.dumps(df.attrs).encode("utf-8")
+    tabela = tabela.replace_schema_metadata(metadados)
+
+    os.makedirs(DIRETORIO_SNAPSHOTS, exist_ok=True)
+    caminho = caminho_snapshot(origem)
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with pa.OSFile(temporario, "wb") as f:
+        with pa.ipc.new_file(f, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+    os.replace(temporario, caminho)
+
+    return caminho
+
+
+def carregar_snapshot(origem):
+    caminho = caminho_snapshot(origem)
+    if not os.path.exists(caminho):
+        return None
+
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+
+    # Arrow IPC sem compressão: as colunas numéricas são lidas direto do
+    # arquivo mapeado em memória, sem cópia.
+    tabela = pa.ipc.open_file(pa.memory_map(caminho, "r")).read_all()
+    df = tabela.to_pandas(split_blocks=True)
+
+    metadados = tabela.schema.metadata or {}
+    if b"simplex_attrs" in metadados:
+        df.attrs = json.loads(metadados[b"simplex_attrs"])
+
+    return df
+
+
+def parse_upload(contents, filename, colunas_numericas=None, digest=None):
     if contents is None:
         return None
 
     content_type, content_string = contents.split(",")
-    decoded = base64.b64decode(content_string)
+
+    return ler_com_cache(
+        chave_upload(digest or digest_upload(contents), filename, colunas_numericas),
+        filename,
+        lambda: ler_tabela(
+            io.BytesIO(base64.b64decode(content_string)), filename, colunas_numericas
+        ),
+    )
+
+
+def parse_upload_realizado(contents, filename, digest=None):
+    if contents is None:
+        return None
+
+    content_type, content_string = contents.split(",")
+
+    return ler_com_cache(
+        chave_upload(digest or digest_upload(contents), filename, ("agregado",)),
+        filename,
+        lambda: ler_realizado_agregado(
+            io.BytesIO(base64.b64decode(content_string)), filename
+        ),
+    )
+
+
+def parse_arquivo_servidor(nome, colunas_numericas=None):
+    caminho = caminho_servidor(nome)
+
+    return ler_com_cache(
+        chave_arquivo(caminho, colunas_numericas),
+        nome,
+        lambda: ler_tabela(caminho, nome, colunas_numericas),
+    )
+
+
+def parse_arquivo_servidor_realizado(nome):
+    caminho = caminho_servidor(nome)
+
+    return ler_com_cache(
+        chave_arquivo(caminho, ("agregado",)),
+        nome,
+        lambda: ler_realizado_agregado(caminho, nome),
+    )
+
+
+def ler_com_cache(chave, filename, ler):
+    df = cache_uploads.get(chave) if chave is not None else None
+    if df is not None:
+        return df
 
     try:
-        if "csv" in filename.lower():
-            df = pd.read_csv(io.StringIO(decoded.decode("utf-8")), sep=",", decimal=",")
-        elif "xlsx" in filename.lower():
-            df = pd.read_excel(io.BytesIO(decoded), engine="openpyxl")
-        elif "xls" in filename.lower():
-            df = pd.read_excel(io.BytesIO(decoded))
-        else:
-            return None
+        df = ler()
     except Exception as e:
-        print(f"ERRO DE LEITURA ({filename}): {e}")
+        metricas.logger.warning(
+            "erro de leitura", extra={"campos": {"arquivo": filename, "erro": str(e)}}
+        )
+        raise ValueError(f"Erro ao ler {filename}: {e}") from e
+
+    if df is not None and chave is not None:
+        cache_uploads.put(chave, df)
+
+    return df
+
+
+def chave_arquivo(caminho, colunas_numericas=None):
+    try:
+        info = os.stat(caminho)
+    except OSError:
         return None
+    return (caminho, info.st_mtime_ns, info.st_size, tuple(colunas_numericas or ()))
+
+
+def assinatura_arquivo_servidor(nome):
+    return chave_arquivo(caminho_servidor(nome)) if nome else None
+
+
+def caminho_servidor(nome):
+    return os.path.join(DIRETORIO_ARQUIVOS, os.path.basename(nome))
+
+
+def listar_arquivos_servidor():
+    if not os.path.isdir(DIRETORIO_ARQUIVOS):
+        return []
+
+    return [
+        nome
+        for nome in sorted(os.listdir(DIRETORIO_ARQUIVOS))
+        if os.path.splitext(nome)[1].lower() in EXTENSOES
+        and os.path.isfile(os.path.join(DIRETORIO_ARQUIVOS, nome))
+    ]
+
+
+def pasta_parciais():
+    return os.path.join(DIRETORIO_ARQUIVOS, ".parciais")
+
+
+def limpar_parciais(agora=None):
+    # Apaga envios parados há mais de PRAZO_PARCIAIS e devolve quanto espaço
+    # os que restam ocupam.
+    pasta = pasta_parciais()
+    if not os.path.isdir(pasta):
+        return 0
+
+    agora = time.time() if agora is None else agora
+    total = 0
+    for entrada in os.scandir(pasta):
+        try:
+            info = entrada.stat()
+            if agora - info.st_mtime > PRAZO_PARCIAIS:
+                os.remove(entrada.path)
+            else:
+                total += info.st_size
+        except OSError:
+            continue
+    return total
+
+
+def copiar_com_limite(fluxo, destino, limite, mensagem):
+    copiado = 0
+    while True:
+        bloco = fluxo.read(1024 * 1024)
+        if not bloco:
+            return copiado
+        copiado += len(bloco)
+        if copiado > limite:
+            raise ErroUpload(mensagem, 413)
+        destino.write(bloco)
+
+
+def gravar_bloco_upload(upload_id, offset, fluxo):
+    if not RE_ID_UPLOAD.match(upload_id):
+        raise ErroUpload("Id de upload inválido")
+
+    ocupado = limpar_parciais()
+    pasta = pasta_parciais()
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, upload_id)
+
+    tamanho = os.path.getsize(caminho) if os.path.exists(caminho) else 0
+    if offset != tamanho:
+        raise ErroUpload(f"Offset esperado: {tamanho}")
+
+    if MAX_BYTES_UPLOAD - tamanho <= MAX_BYTES_PARCIAIS - ocupado:
+        limite = MAX_BYTES_UPLOAD - tamanho
+        mensagem = f"Upload maior que o limite de {MAX_BYTES_UPLOAD} bytes"
+    else:
+        limite = MAX_BYTES_PARCIAIS - ocupado
+        mensagem = "Espaço para uploads em andamento esgotado; tente mais tarde"
+
+    with open(caminho, "ab") as f:
+        try:
+            copiar_com_limite(fluxo, f, max(limite, 0), mensagem)
+        except ErroUpload:
+            # Descarta o bloco recusado; o envio pode continuar do offset atual.
+            f.truncate(tamanho)
+            raise
+
+    return os.path.getsize(caminho)
+
+
+def concluir_upload(upload_id, nome):
+    if not RE_ID_UPLOAD.match(upload_id):
+        raise ErroUpload("Id de upload inválido")
+
+    nome = os.path.basename(nome)
+    if os.path.splitext(nome)[1].lower() not in EXTENSOES:
+        raise ErroUpload(f"Extensão não suportada: {nome}")
+
+    parcial = os.path.join(pasta_parciais(), upload_id)
+    if not os.path.exists(parcial):
+        raise ErroUpload("Upload não encontrado", 404)
+
+    # os.link falha se o nome já existe: um envio nunca substitui um arquivo
+    # que já está no servidor.
+    try:
+        os.link(parcial, caminho_servidor(nome))
+    except FileExistsError:
+        raise ErroUpload(
+            f"Já existe um arquivo chamado {nome} no servidor; escolha outro nome",
+            409,
+        ) from None
+    os.remove(parcial)
+    return nome
+
+
+def ler_realizado_agregado(fonte, filename, tamanho_bloco=TAMANHO_BLOCO):
+    if "csv" in filename.lower():
+        blocos = pd.read_csv(
+            fonte,
+            sep=",",
+            decimal=",",
+            encoding="utf-8",
+            usecols=lambda c: str(c).lower().strip() in ("servico", "quantidade"),
+            chunksize=tamanho_bloco,
+        )
+    elif "xlsx" in filename.lower():
+        blocos = blocos_xlsx(fonte, tamanho_bloco)
+    elif "xls" in filename.lower():
+        blocos = [pd.read_excel(fonte)]
+    else:
+        return None
+
+    total = None
+    for bloco in blocos:
+        parcial = agregar_bloco(bloco)
+        total = parcial if total is None else total.add(parcial, fill_value=0)
+
+    if total is None:
+        return pd.DataFrame({"servico": [], "quantidade": []})
+
+    return total.rename("quantidade").rename_axis("servico").reset_index()
+
+
+def blocos_xlsx(fonte, tamanho_bloco):
+    import openpyxl
+
+    wb = openpyxl.load_workbook(fonte, read_only=True, data_only=True)
+    try:
+        linhas = wb.worksheets[0].iter_rows(values_only=True)
+        cabecalho = [str(c) for c in next(linhas, [])]
+
+        bloco = []
+        for linha in linhas:
+            bloco.append(linha)
+            if len(bloco) >= tamanho_bloco:
+                yield pd.DataFrame(bloco, columns=cabecalho)
+                bloco = []
+
+        if bloco:
+            yield pd.DataFrame(bloco, columns=cabecalho)
+    finally:
+        wb.close()
+
+
+def agregar_bloco(bloco):
+    bloco.columns = bloco.columns.astype(str).str.lower().str.strip()
+
+    if "servico" not in bloco.columns:
+        raise ValueError("Falta a coluna 'servico' no Realizado")
+
+    # Agrega já pelo nome normalizado: variações de grafia viram uma linha só.
+    bloco["servico"] = normalizar_servicos(bloco["servico"])
+
+    # Sem 'quantidade', cada linha é um serviço feito (exportação transacional).
+    if "quantidade" not in bloco.columns:
+        return bloco.groupby("servico", sort=False).size().astype(float)
+
+    bloco = limpar_dados_numericos(bloco, COLUNAS_NUMERICAS_REALIZADO)
+    return bloco.groupby("servico", sort=False)["quantidade"].sum()
+
+
+def ler_arquivo(caminho, colunas_numericas=None):
+    return ler_tabela(caminho, os.path.basename(caminho), colunas_numericas)
+
+
+def ler_tabela(fonte, filename, colunas_numericas=None):
+    if "csv" in filename.lower():
+        df = pd.read_csv(
+            fonte,
+            sep=",",
+            decimal=",",
+            encoding="utf-8",
+            memory_map=isinstance(fonte, str),
+        )
+    elif "xlsx" in filename.lower():
+        df = ler_abas(pd.read_excel(fonte, engine="openpyxl", sheet_name=None))
+    elif "xls" in filename.lower():
+        df = ler_abas(pd.read_excel(fonte, sheet_name=None))
+    else:
+        return None
+
+    if colunas_numericas:
+        df = preparar_colunas(df, colunas_numericas)
 
     return df
 
 
+def preparar_colunas(df, colunas_numericas):
+    df.columns = df.columns.str.lower().str.strip()
+    return limpar_dados_numericos(df, colunas_numericas)
+
+
+def ler_abas(abas):
+    nomes = list(abas)
+    df = abas[nomes[0]]
+
+    for nome in nomes[1:]:
+        if str(nome).lower().strip() == ABA_CAPACIDADE:
+            df.attrs["capacidades"] = ler_capacidades(abas[nome])
+
+    return df
+
+
+def ler_capacidades(df_capacidade):
+    df_capacidade.columns = df_capacidade.columns.str.lower().str.strip()
+
+    missing = [c for c in ["recurso", "capacidade"] if c not in df_capacidade.columns]
+    if missing:
+        raise ValueError(f"Faltam colunas na aba de capacidade: {missing}")
+
+    df_capacidade = limpar_dados_numericos(df_capacidade, ["capacidade"])
+    recursos = df_capacidade["recurso"].astype(str).str.lower().str.strip()
+    recursos = recursos.where(
+        recursos.str.startswith(PREFIXO_RECURSO), PREFIXO_RECURSO + recursos
+    )
+
+    return dict(zip(recursos, df_capacidade["capacidade"].astype(float)))
+
+
+def colunas_recursos(df):
+    return [c for c in df.columns if str(c).startswith(PREFIXO_RECURSO)]
+
+
+def converter_numeros_br(textos):
+    textos = textos.str.replace(RE_LIXO_NUMERICO, "", regex=True)
+
+    # "1.234,56" e "2,5" (pt-BR) vs "1,234.56" (separador de milhar em
+    # inglês). Sem vírgula, ponto seguido de grupos de exatamente três
+    # dígitos é milhar ("1.500", "R$ 1.500.000"); os demais ("2.5", "0.75")
+    # são decimais.
+    decimal_virgula = (textos.str.rfind(",") > textos.str.rfind(".")) & (
+        textos.str.count(",") == 1
+    )
+    milhar_ponto = textos.str.fullmatch(RE_MILHAR_PONTO)
+    formato_br = textos.str.replace(".", "", regex=False).str.replace(
+        ",", ".", regex=False
+    )
+    formato_milhar = textos.str.replace(",", "", regex=False)
+
+    return pd.to_numeric(
+        formato_br.where(decimal_virgula | milhar_ponto, formato_milhar),
+        errors="coerce",
+    )
+
+
 def limpar_dados_numericos(df, colunas):
+    colunas_texto = []
     for col in colunas:
         if col in df.columns:
-            df[col] = df[col].astype(str)
+            if pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = df[col].fillna(0)
+            else:
+                colunas_texto.append(col)
+
+    if not colunas_texto:
+        return df
 
-            df[col] = df[col].str.replace("R$", "", regex=False)
-            df[col] = df[col].str.replace(" ", "", regex=False)
+    # Converte cada valor distinto uma única vez, para todas as colunas juntas.
+    codigos, valores = pd.factorize(
+        np.concatenate([df[col].to_numpy(dtype=object) for col in colunas_texto])
+    )
+    valores = pd.Series(valores, dtype=object)
+    # Números que já vieram como número (células numéricas de uma coluna
+    # mista) não passam pelo texto: 1.234 não pode virar "1.234" = 1234.
+    ja_numeros = valores.map(
+        lambda v: isinstance(v, (int, float, np.number)) and not isinstance(v, bool)
+    ).to_numpy(dtype=bool)
+    numeros = np.array(converter_numeros_br(valores.astype(str)), dtype=float)
+    numeros[ja_numeros] = valores[ja_numeros].to_numpy(dtype=float)
+    # Código -1 (valor ausente) cai no 0.0 acrescentado no fim.
+    numeros = np.append(np.where(np.isnan(numeros), 0.0, numeros), 0.0)
 
-            df[col] = df[col].str.replace(",", ".", regex=False)
+    convertidos = numeros[codigos]
+    for i, col in enumerate(colunas_texto):
+        df[col] = convertidos[i * len(df) : (i + 1) * len(df)]
 
-            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
     return df
 
 
-def consolidar_dados(df_template, df_realizado=None):
+def consolidar_dados(df_template, df_realizado=None, capacidades=None):
     cols_obrigat = ["servico", "tempo", "custo", "venda", "minimo", "maximo"]
 
     df_template.columns = df_template.columns.str.lower().str.strip()
@@ -49,8 +663,22 @@ def consolidar_dados(df_template, df_realizado=None):
     if missing:
         raise ValueError(f"Faltam colunas no Template: {missing}")
 
-    cols_numericas = ["tempo", "custo", "venda", "minimo", "maximo"]
-    df_template = limpar_dados_numericos(df_template, cols_numericas)
+    recursos = colunas_recursos(df_template)
+    variacoes = [c for c in COLUNAS_VARIACAO if c in df_template.columns]
+    df_template = limpar_dados_numericos(
+        df_template, COLUNAS_NUMERICAS_TEMPLATE + recursos + variacoes
+    )
+
+    if capacidades is None:
+        capacidades = df_template.attrs.get("capacidades", {})
+    capacidades = {
+        (r if r.startswith(PREFIXO_RECURSO) else PREFIXO_RECURSO + r): v
+        for r, v in capacidades.items()
+    }
+
+    missing = [r for r in recursos if r not in capacidades]
+    if missing:
+        raise ValueError(f"Faltam capacidades para os recursos: {missing}")
 
     df_template["lucro_unitario"] = df_template["venda"] - df_template["custo"]
 
@@ -59,24 +687,24 @@ def consolidar_dados(df_template, df_realizado=None):
         df_template["lucro_unitario"] / df_template["tempo"]
     )
 
+    # Junta pelo índice de serviços do template (reaproveitado entre
+    # consolidações): linhas repetidas do realizado são somadas em vez de
+    # multiplicarem as linhas do template.
+    quantidade_real = np.zeros(len(df_template))
     if df_realizado is not None:
         df_realizado.columns = df_realizado.columns.str.lower().str.strip()
         if "quantidade" in df_realizado.columns:
-            df_realizado = limpar_dados_numericos(df_realizado, ["quantidade"])
-            df_real_ok = df_realizado[["servico", "quantidade"]].copy()
-        else:
-            df_real_ok = pd.DataFrame(
-                {"servico": df_template["servico"], "quantidade": 0}
+            df_realizado = limpar_dados_numericos(
+                df_realizado, COLUNAS_NUMERICAS_REALIZADO
+            )
+            indice = obter_indice_servicos(df_template["servico"])
+            quantidade_real = indice.agregar(
+                df_realizado["servico"], df_realizado["quantidade"]
             )
-    else:
-        df_real_ok = pd.DataFrame({"servico": df_template["servico"], "quantidade": 0})
 
-    df_final = pd.merge(
-        df_template, df_real_ok, on="servico", how="left", suffixes=("", "_real")
-    )
+    df_final = df_template.reset_index(drop=True)
+    df_final["quantidade_real"] = quantidade_real
 
-    df_final["quantidade_real"] = df_final["quantidade"].fillna(0)
-    if "quantidade" in df_final.columns:
-        del df_final["quantidade"]
+    df_final.attrs["capacidades"] = {r: float(capacidades[r]) for r in recursos}
 
     return df_final
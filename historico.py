@@ -0,0 +1,289 @@
+import os
+import re
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+
+import metricas
+
+CAMINHO_HISTORICO = os.environ.get(
+    "SIMPLEX_HISTORICO",
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), ".cache", "historico.sqlite3"
+    ),
+)
+UNIDADE_PADRAO = os.environ.get("SIMPLEX_UNIDADE", "padrao")
+JANELA_ADERENCIA = 3
+RE_MES = re.compile(r"\d{4}-(0[1-9]|1[0-2])")
+COLUNAS_PLANO = [
+    "qtd_sugerida",
+    "quantidade_real",
+    "lucro_meta",
+    "lucro_real",
+    "faturamento_meta",
+    "faturamento_real",
+    "tempo_meta",
+    "tempo_real",
+    "desvio_qtd",
+    "desvio_lucro",
+]
+COLUNAS_TOTAIS = [
+    "qtd_sugerida",
+    "quantidade_real",
+    "lucro_meta",
+    "lucro_real",
+    "faturamento_meta",
+    "faturamento_real",
+]
+
+ESQUEMA = f"""
+CREATE TABLE IF NOT EXISTS execucoes (
+    id INTEGER PRIMARY KEY,
+    unidade TEXT NOT NULL,
+    mes TEXT NOT NULL,
+    registrado_em TEXT NOT NULL,
+    assinatura TEXT,
+    horas REAL,
+    fechado INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (unidade, mes, assinatura)
+);
+CREATE TABLE IF NOT EXISTS planos (
+    execucao INTEGER NOT NULL REFERENCES execucoes (id),
+    servico TEXT NOT NULL,
+    {", ".join(f"{c} REAL" for c in COLUNAS_PLANO)}
+);
+CREATE INDEX IF NOT EXISTS planos_execucao ON planos (execucao);
+CREATE TABLE IF NOT EXISTS mensal_servico (
+    unidade TEXT NOT NULL,
+    mes TEXT NOT NULL,
+    servico TEXT NOT NULL,
+    execucao INTEGER NOT NULL,
+    {", ".join(f"{c} REAL" for c in COLUNAS_TOTAIS)},
+    qtd_atendida REAL,
+    PRIMARY KEY (unidade, mes, servico)
+);
+CREATE TABLE IF NOT EXISTS mensal (
+    unidade TEXT NOT NULL,
+    mes TEXT NOT NULL,
+    execucao INTEGER NOT NULL,
+    servicos INTEGER,
+    {", ".join(f"{c} REAL" for c in COLUNAS_TOTAIS)},
+    qtd_atendida REAL,
+    PRIMARY KEY (unidade, mes)
+);
+CREATE TABLE IF NOT EXISTS totais_servico (
+    unidade TEXT NOT NULL,
+    servico TEXT NOT NULL,
+    meses INTEGER,
+    {", ".join(f"{c} REAL" for c in COLUNAS_TOTAIS)},
+    qtd_atendida REAL,
+    PRIMARY KEY (unidade, servico)
+);
+"""
+
+
+def conectar(caminho=None):
+    caminho = caminho or CAMINHO_HISTORICO
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+
+    # WAL deixa os gráficos lerem enquanto um callback em segundo plano grava.
+    conexao = sqlite3.connect(caminho, timeout=30, isolation_level=None)
+    conexao.execute("PRAGMA journal_mode=WAL")
+    conexao.execute("PRAGMA synchronous=NORMAL")
+    conexao.executescript(ESQUEMA)
+    colunas = {linha[1] for linha in conexao.execute("PRAGMA table_info(execucoes)")}
+    if "fechado" not in colunas:
+        # Bancos anteriores ao fechamento explícito: o que já estava nos
+        # agregados conta como fechado.
+        conexao.execute(
+            "ALTER TABLE execucoes ADD COLUMN fechado INTEGER NOT NULL DEFAULT 0"
+        )
+        conexao.execute(
+            "UPDATE execucoes SET fechado = 1 WHERE id IN (SELECT execucao FROM mensal)"
+        )
+    return conexao
+
+
+def mes_atual():
+    return datetime.now().strftime("%Y-%m")
+
+
+def validar_mes(mes):
+    mes = str(mes).strip()
+    if not RE_MES.fullmatch(mes):
+        raise ValueError(f"Mês inválido: {mes!r} (use AAAA-MM)")
+    return mes
+
+
+def normalizar_unidade(unidade):
+    return str(unidade).strip() if unidade and str(unidade).strip() else UNIDADE_PADRAO
+
+
+def somar_totais(conexao, unidade, mes, sinal):
+    # Soma (ou desconta) a contribuição de um mês nos totais por serviço:
+    # o custo é o de um mês, não o de todo o histórico.
+    colunas = COLUNAS_TOTAIS + ["qtd_atendida"]
+    conexao.execute(
+        f"""
+        INSERT INTO totais_servico (unidade, servico, meses, {", ".join(colunas)})
+        SELECT unidade, servico, ?, {", ".join(f"? * {c}" for c in colunas)}
+        FROM mensal_servico WHERE unidade = ? AND mes = ?
+        ON CONFLICT (unidade, servico) DO UPDATE SET
+            meses = meses + excluded.meses,
+            {", ".join(f"{c} = {c} + excluded.{c}" for c in colunas)}
+        """,
+        [sinal, *[sinal] * len(colunas), unidade, mes],
+    )
+
+
+def registrar_execucao(
+    df,
+    unidade=None,
+    mes=None,
+    assinatura=None,
+    horas=None,
+    fechar=False,
+    caminho=None,
+):
+    # Todo cálculo entra no registro; os agregados mensais só mudam quando o
+    # mês é fechado explicitamente (fechar=True) com um plano e realizado.
+    unidade = normalizar_unidade(unidade)
+    mes = validar_mes(mes) if mes else mes_atual()
+    colunas = [c for c in COLUNAS_PLANO if c in df.columns]
+
+    with metricas.etapa("registrar_historico", servicos=len(df)), closing(
+        conectar(caminho)
+    ) as conexao:
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conexao.execute(
+                "INSERT OR IGNORE INTO execucoes "
+                "(unidade, mes, registrado_em, assinatura, horas) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [unidade, mes, datetime.now().isoformat(), assinatura, horas],
+            )
+            if cursor.rowcount:
+                execucao = cursor.lastrowid
+                linhas = df[["servico", *colunas]].astype({"servico": str})
+                conexao.executemany(
+                    f"INSERT INTO planos (execucao, servico, {', '.join(colunas)}) "
+                    f"VALUES (?, ?, {', '.join('?' * len(colunas))})",
+                    (
+                        (execucao, *linha)
+                        for linha in linhas.itertuples(index=False, name=None)
+                    ),
+                )
+            else:
+                # Mesmo cálculo já registrado para a unidade e o mês.
+                execucao = conexao.execute(
+                    "SELECT id FROM execucoes "
+                    "WHERE unidade = ? AND mes = ? AND assinatura = ?",
+                    [unidade, mes, assinatura],
+                ).fetchone()[0]
+                atual = conexao.execute(
+                    "SELECT execucao FROM mensal WHERE unidade = ? AND mes = ?",
+                    [unidade, mes],
+                ).fetchone()
+                if not fechar or (atual and atual[0] == execucao):
+                    conexao.execute("ROLLBACK")
+                    return None
+
+            if fechar:
+                conexao.execute(
+                    "UPDATE execucoes SET fechado = 1 WHERE id = ?", [execucao]
+                )
+                atualizar_agregados(conexao, unidade, mes, execucao)
+            conexao.execute("COMMIT")
+        except BaseException:
+            conexao.execute("ROLLBACK")
+            raise
+
+    return execucao
+
+
+def atualizar_agregados(conexao, unidade, mes, execucao):
+    # O fechamento mais recente de cada mês é o que vale nos agregados:
+    # tira o anterior dos totais e soma o novo.
+    somar_totais(conexao, unidade, mes, -1)
+    conexao.execute(
+        "DELETE FROM mensal_servico WHERE unidade = ? AND mes = ?",
+        [unidade, mes],
+    )
+    conexao.execute(
+        f"""
+        INSERT INTO mensal_servico
+            (unidade, mes, servico, execucao, {", ".join(COLUNAS_TOTAIS)},
+             qtd_atendida)
+        SELECT ?, ?, servico, execucao,
+            {", ".join(f"SUM(COALESCE({c}, 0))" for c in COLUNAS_TOTAIS)},
+            SUM(MIN(COALESCE(quantidade_real, 0), COALESCE(qtd_sugerida, 0)))
+        FROM planos WHERE execucao = ? GROUP BY servico
+        """,
+        [unidade, mes, execucao],
+    )
+    somar_totais(conexao, unidade, mes, 1)
+    conexao.execute(
+        "DELETE FROM totais_servico WHERE unidade = ? AND meses <= 0",
+        [unidade],
+    )
+    conexao.execute(
+        f"""
+        INSERT OR REPLACE INTO mensal
+            (unidade, mes, execucao, servicos, {", ".join(COLUNAS_TOTAIS)},
+             qtd_atendida)
+        SELECT unidade, mes, execucao, COUNT(*),
+            {", ".join(f"SUM({c})" for c in COLUNAS_TOTAIS)},
+            SUM(qtd_atendida)
+        FROM mensal_servico WHERE unidade = ? AND mes = ?
+        """,
+        [unidade, mes],
+    )
+
+
+def tendencia(unidade=None, janela=JANELA_ADERENCIA, caminho=None):
+    # Lê só a tabela mensal (uma linha por mês), mesmo com anos de histórico.
+    consulta = f"""
+        SELECT mes, servicos, {", ".join(COLUNAS_TOTAIS)}, qtd_atendida,
+            lucro_real / NULLIF(lucro_meta, 0) AS aderencia_lucro,
+            qtd_atendida / NULLIF(qtd_sugerida, 0) AS aderencia_qtd,
+            SUM(lucro_real) OVER movel / NULLIF(SUM(lucro_meta) OVER movel, 0)
+                AS aderencia_lucro_movel,
+            SUM(qtd_atendida) OVER movel / NULLIF(SUM(qtd_sugerida) OVER movel, 0)
+                AS aderencia_qtd_movel
+        FROM mensal WHERE unidade = ?
+        WINDOW movel AS (ORDER BY mes ROWS BETWEEN {int(janela) - 1} PRECEDING
+                         AND CURRENT ROW)
+        ORDER BY mes
+    """
+    with closing(conectar(caminho)) as conexao:
+        return pd.read_sql_query(
+            consulta, conexao, params=[normalizar_unidade(unidade)]
+        )
+
+
+def totais_por_servico(unidade=None, caminho=None):
+    with closing(conectar(caminho)) as conexao:
+        return pd.read_sql_query(
+            "SELECT servico, meses, "
+            f"{', '.join(COLUNAS_TOTAIS)}, qtd_atendida, "
+            "qtd_atendida / NULLIF(qtd_sugerida, 0) AS aderencia_qtd "
+            "FROM totais_servico WHERE unidade = ? ORDER BY lucro_real DESC",
+            conexao,
+            params=[normalizar_unidade(unidade)],
+        )
+
+
+def planos_do_mes(unidade=None, mes=None, caminho=None):
+    with closing(conectar(caminho)) as conexao:
+        return pd.read_sql_query(
+            "SELECT e.registrado_em, e.horas, e.fechado, p.* FROM planos p "
+            "JOIN execucoes e ON e.id = p.execucao "
+            "WHERE e.unidade = ? AND e.mes = ? ORDER BY e.id",
+            conexao,
+            params=[
+                normalizar_unidade(unidade),
+                validar_mes(mes) if mes else mes_atual(),
+            ],
+        )
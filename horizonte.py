@@ -0,0 +1,419 @@
+import numpy as np
+import pandas as pd
+
+import data_manager
+import metricas
+import optimizer
+
+COLUNAS_PERIODO = ["tempo", "minimo", "maximo"]
+MSG_INVIAVEL = (
+    "INVIÁVEL: as horas e os máximos das semanas restantes não cobrem os "
+    "mínimos acumulados."
+)
+
+
+class Horizonte:
+    def __init__(self, df, horas, n_periodos=None, df_periodos=None):
+        # 'horas' pode ser um valor por período ou um único valor repetido.
+        horas = np.atleast_1d(np.asarray(horas, dtype=float))
+        if n_periodos is not None and len(horas) == 1:
+            horas = np.repeat(horas, n_periodos)
+        elif n_periodos is not None and len(horas) != n_periodos:
+            raise ValueError(
+                f"Foram informadas horas para {len(horas)} semanas, "
+                f"mas o horizonte tem {n_periodos}."
+            )
+
+        self.df = df
+        self.horas = horas
+        self.n_periodos = len(horas)
+        self.lucro = df["lucro_unitario"].to_numpy(dtype=float)
+
+        # As colunas do template valem para cada período; o arquivo de
+        # períodos (servico, periodo, tempo/minimo/maximo) sobrescreve semanas.
+        for col in COLUNAS_PERIODO:
+            valores = df[col].to_numpy(dtype=float)
+            setattr(self, col, np.repeat(valores[:, None], self.n_periodos, axis=1))
+        if df_periodos is not None:
+            self._aplicar_periodos(df_periodos)
+        self.tempo = np.where(self.tempo == 0, 0.01, self.tempo)
+
+        self.capacidades = dict(df.attrs.get("capacidades") or {})
+        self.recursos = list(self.capacidades)
+        self.capacidade = np.array(
+            [self.capacidades[r] for r in self.recursos], dtype=float
+        )
+        self.consumo = df[self.recursos].to_numpy(dtype=float).T
+
+        self.realizado = np.full((len(df), self.n_periodos), np.nan)
+        self.plano = None
+
+    def _aplicar_periodos(self, df_periodos):
+        df_periodos.columns = df_periodos.columns.str.lower().str.strip()
+        missing = [c for c in ["servico", "periodo"] if c not in df_periodos.columns]
+        if missing:
+            raise ValueError(f"Faltam colunas no arquivo de períodos: {missing}")
+
+        colunas = [c for c in COLUNAS_PERIODO if c in df_periodos.columns]
+        df_periodos = data_manager.limpar_dados_numericos(
+            df_periodos, ["periodo", *colunas]
+        )
+
+        indice = data_manager.obter_indice_servicos(self.df["servico"])
+        chaves = indice.chaves.get_indexer(
+            data_manager.normalizar_servicos(df_periodos["servico"])
+        )
+        periodos = df_periodos["periodo"].to_numpy(dtype=int) - 1
+        validos = (chaves >= 0) & (periodos >= 0) & (periodos < self.n_periodos)
+
+        # Preenche por chave de serviço e expande para as linhas do template.
+        for col in colunas:
+            por_chave = np.full((len(indice.chaves), self.n_periodos), np.nan)
+            por_chave[chaves[validos], periodos[validos]] = df_periodos[col].to_numpy(
+                dtype=float
+            )[validos]
+            por_chave = por_chave[indice.codigos]
+            atual = getattr(self, col)
+            setattr(self, col, np.where(np.isnan(por_chave), atual, por_chave))
+
+    def inicio(self):
+        # Primeiro período ainda sem realizado registrado.
+        fechados = ~np.isnan(self.realizado).any(axis=0)
+        abertos = np.flatnonzero(~fechados)
+        return int(abertos[0]) if len(abertos) else self.n_periodos
+
+    def saldo(self, inicio):
+        # O que foi feito acima do mínimo nas semanas fechadas conta para os
+        # mínimos das seguintes; o que faltou precisa ser recuperado.
+        feito = self.realizado[:, :inicio] - self.minimo[:, :inicio]
+        return feito.sum(axis=1)
+
+    def blocos(self, inicio):
+        # Semanas seguidas com as mesmas entradas viram um bloco só: a média de
+        # um plano ótimo dentro do bloco continua viável e ótima, então basta
+        # uma quantidade por semana para o bloco inteiro.
+        iguais = self.horas[inicio + 1 :] == self.horas[inicio:-1]
+        for matriz in [self.tempo, self.minimo, self.maximo]:
+            iguais &= np.all(matriz[:, inicio + 1 :] == matriz[:, inicio:-1], axis=0)
+
+        inicios = np.concatenate([[inicio], np.flatnonzero(~iguais) + inicio + 1])
+        tamanhos = np.diff(np.append(inicios, self.n_periodos))
+        return inicios, tamanhos
+
+    def montar_lp(self, inicios, tamanhos, saldo):
+        from scipy import sparse
+
+        n, n_blocos = len(self.lucro), len(inicios)
+        n_y = n * n_blocos
+        tempo = self.tempo[:, inicios]
+        minimo = self.minimo[:, inicios]
+        maximo = self.maximo[:, inicios]
+
+        # Variáveis: y[b, i] (quantidade por semana no bloco) e s[b, i] (saldo
+        # acumulado acima dos mínimos no fim do bloco), bloco a bloco. Cada
+        # restrição só toca as variáveis do seu bloco e do anterior.
+        bloco_y = np.repeat(np.arange(n_blocos), n)
+        colunas = np.arange(n_y)
+        blocos_ub = [
+            sparse.csr_array(
+                (tempo.T.ravel(), (bloco_y, colunas)), shape=(n_blocos, 2 * n_y)
+            )
+        ]
+        b_ub = [self.horas[inicios]]
+
+        for r in range(len(self.recursos)):
+            blocos_ub.append(
+                sparse.csr_array(
+                    (np.tile(self.consumo[r], n_blocos), (bloco_y, colunas)),
+                    shape=(n_blocos, 2 * n_y),
+                )
+            )
+            b_ub.append(np.full(n_blocos, self.capacidade[r]))
+
+        # s[b] - s[b-1] - L*y[b] = -L*minimo[b], com s >= 0: os mínimos
+        # acumulados precisam ser cumpridos. A sobra das semanas fechadas entra
+        # como s[-1]; a falta só precisa ser recuperada até o fim do horizonte.
+        semanas = np.repeat(tamanhos, n).astype(float)
+        anteriores = colunas[n:]
+        A_eq = sparse.csr_array(
+            (
+                np.concatenate([-semanas, np.ones(n_y), -np.ones(n_y - n)]),
+                (
+                    np.concatenate([colunas, colunas, anteriores]),
+                    np.concatenate([colunas, n_y + colunas, n_y + anteriores - n]),
+                ),
+            ),
+            shape=(n_y, 2 * n_y),
+        )
+        b_eq = -(minimo * tamanhos).T.ravel()
+        b_eq[:n] += np.maximum(saldo, 0)
+        b_eq[n_y - n :] -= np.maximum(-saldo, 0)
+
+        c = np.concatenate([-np.outer(tamanhos, self.lucro).ravel(), np.zeros(n_y)])
+        bounds = np.column_stack(
+            [
+                np.zeros(2 * n_y),
+                np.concatenate([maximo.T.ravel(), np.full(n_y, np.inf)]),
+            ]
+        )
+
+        return (
+            c,
+            sparse.vstack(blocos_ub).tocsr(),
+            np.concatenate(b_ub),
+            A_eq,
+            b_eq,
+            bounds,
+        )
+
+    def resolver_bloco_unico(self, inicio, semanas, saldo):
+        # Com todas as semanas iguais, os mínimos acumulados viram um mínimo
+        # por semana (descontada a sobra, acrescida a falta) e o problema é o
+        # mesmo da otimização mensal.
+        minimo = np.clip(self.minimo[:, inicio] - saldo / semanas, 0, None)
+        if np.any(minimo > self.maximo[:, inicio] + 1e-9):
+            return None, MSG_INVIAVEL
+
+        df = pd.DataFrame(
+            {
+                "lucro_unitario": self.lucro,
+                "tempo": self.tempo[:, inicio],
+                "minimo": minimo,
+                "maximo": self.maximo[:, inicio],
+                "venda": self.df["venda"].to_numpy(dtype=float),
+            }
+        )
+        for r, recurso in enumerate(self.recursos):
+            df[recurso] = self.consumo[r]
+        df.attrs["capacidades"] = self.capacidades
+
+        sessao = optimizer.SessaoOtimizacao(df)
+        if sessao.tempo_minimo > self.horas[inicio] + 1e-9 or np.any(
+            sessao.consumo_minimo > sessao.capacidade + 1e-9
+        ):
+            return None, MSG_INVIAVEL
+        return sessao.resolver(self.horas[inicio])
+
+    def otimizar(self):
+        inicio = self.inicio()
+        if inicio >= self.n_periodos:
+            return self.tabela(), None
+
+        # Se as semanas fechadas saíram como o planejado, o restante do plano
+        # anterior continua ótimo: não há o que resolver de novo.
+        if self.plano is not None and np.allclose(
+            self.realizado[:, :inicio], self.plano[:, :inicio], atol=1e-6
+        ):
+            return self.tabela(), None
+
+        n = len(self.lucro)
+        inicios, tamanhos = self.blocos(inicio)
+        saldo = self.saldo(inicio)
+
+        with metricas.etapa(
+            "horizonte",
+            servicos=n,
+            periodos=self.n_periodos - inicio,
+            blocos=len(inicios),
+        ):
+            if len(inicios) == 1:
+                y, erro = self.resolver_bloco_unico(inicio, tamanhos[0], saldo)
+            else:
+                y, erro = self.resolver_lp(inicios, tamanhos, saldo)
+
+        if erro:
+            return None, erro
+
+        plano = np.where(np.isnan(self.realizado), 0.0, self.realizado)
+        plano[:, inicio:] = self.arredondar(
+            np.repeat(y.reshape(-1, n).T, tamanhos, axis=1), inicio, saldo
+        )
+        self.plano = plano
+        return self.tabela(), None
+
+    def arredondar(self, y, inicio, saldo):
+        # Arredondar o LP para o inteiro mais próximo pode estourar as horas
+        # ou os recursos de uma semana. O piso nunca estoura; depois devolve
+        # unidades primeiro onde faltam para os mínimos acumulados e depois
+        # pelo lucro/hora, sempre só onde couberem.
+        q = np.clip(np.floor(y + 1e-9), 0, None)
+        tempo = self.tempo[:, inicio:]
+        maximo = self.maximo[:, inicio:]
+        horas_livres = self.horas[inicio:] - (tempo * q).sum(axis=0)
+        recursos_livres = self.capacidade[:, None] - self.consumo @ q
+
+        def cabe(i, k):
+            return tempo[i, k] <= horas_livres[k] + 1e-9 and np.all(
+                self.consumo[:, i] <= recursos_livres[:, k] + 1e-9
+            )
+
+        def somar(i, k, unidades=1):
+            q[i, k] += unidades
+            horas_livres[k] -= unidades * tempo[i, k]
+            recursos_livres[:, k] -= unidades * self.consumo[:, i]
+            folga[i, k:] += unidades
+
+        def abrir_espaco(i, k):
+            # Tira unidades dos serviços de menor lucro/hora da semana que
+            # têm sobra nos próprios mínimos até caber uma unidade de i.
+            if q[i, k] + 1 > maximo[i, k] + 1e-9:
+                return False
+            if cabe(i, k):
+                return True
+            retirados = []
+            livres = np.flatnonzero(q[:, k] >= 1)
+            livres = livres[(livres != i) & (folga[livres, k:].min(axis=1) >= 1 - 1e-9)]
+            razao = self.lucro[livres] / np.where(
+                tempo[livres, k] > 0, tempo[livres, k], 1e-12
+            )
+            for j in livres[np.argsort(razao, kind="stable")]:
+                while q[j, k] >= 1 and folga[j, k:].min() >= 1 - 1e-9:
+                    somar(j, k, -1)
+                    retirados.append(j)
+                    if cabe(i, k):
+                        return True
+            for j in retirados:
+                somar(j, k)
+            return False
+
+        # Mínimos acumulados, como em montar_lp: a sobra das semanas fechadas
+        # vale desde já; a falta só precisa ser coberta até a última semana.
+        exigido = (
+            np.cumsum(self.minimo[:, inicio:], axis=1) - np.maximum(saldo, 0)[:, None]
+        )
+        exigido[:, -1] += np.maximum(-saldo, 0)
+        folga = np.cumsum(q, axis=1) - exigido
+        self.deficit_arredondamento = 0.0
+        for i in np.flatnonzero((folga < -1e-9).any(axis=1)):
+            for k in range(q.shape[1]):
+                while folga[i, k] < -1e-9:
+                    # A unidade vai para a semana mais tardia que ainda conta.
+                    semana = next(
+                        (j for j in range(k, -1, -1) if abrir_espaco(i, j)), None
+                    )
+                    if semana is None:
+                        break
+                    somar(i, semana)
+            self.deficit_arredondamento += float(
+                np.ceil(max(-folga[i].min(), 0) - 1e-9)
+            )
+
+        for k in range(q.shape[1]):
+            razao = np.where(tempo[:, k] > 0, self.lucro / tempo[:, k], np.inf)
+            ordem = np.argsort(-razao, kind="stable")
+            candidatos = ordem[
+                (self.lucro[ordem] > 0)
+                & (q[ordem, k] < maximo[ordem, k])
+                & (tempo[ordem, k] <= horas_livres[k] + 1e-9)
+            ]
+            for i in candidatos:
+                limites = [maximo[i, k] - q[i, k]]
+                if tempo[i, k] > 0:
+                    limites.append((horas_livres[k] + 1e-9) // tempo[i, k])
+                usa = self.consumo[:, i] > 0
+                if usa.any():
+                    limites.append(
+                        ((recursos_livres[usa, k] + 1e-9) // self.consumo[usa, i]).min()
+                    )
+                unidades = max(np.floor(min(limites)), 0)
+                if unidades:
+                    somar(i, k, unidades)
+
+        if self.deficit_arredondamento:
+            # O guloso não conseguiu cumprir algum mínimo: resolve o modelo
+            # inteiro semana a semana, com o mesmo limite de tempo da
+            # otimização mensal. Sem solução, fica o guloso e a falta aparece
+            # em 'deficit_minimos'.
+            x = self.resolver_inteiro(inicio, saldo)
+            if x is not None:
+                self.deficit_arredondamento = 0.0
+                return x
+
+        return q
+
+    def resolver_lp(self, inicios, tamanhos, saldo):
+        from scipy.optimize import linprog
+
+        c, A_ub, b_ub, A_eq, b_eq, bounds = self.montar_lp(inicios, tamanhos, saldo)
+        resultado = linprog(
+            c,
+            A_ub=A_ub,
+            b_ub=b_ub,
+            A_eq=A_eq,
+            b_eq=b_eq,
+            bounds=bounds,
+            method="highs",
+        )
+
+        if not resultado.success:
+            if resultado.status == 2:
+                return None, MSG_INVIAVEL
+            return None, f"Erro matemático: {resultado.message}"
+
+        return resultado.x[: len(c) // 2], None
+
+    def resolver_inteiro(self, inicio, saldo):
+        from scipy.optimize import Bounds, LinearConstraint, milp
+
+        semanas = np.arange(inicio, self.n_periodos)
+        c, A_ub, b_ub, A_eq, b_eq, bounds = self.montar_lp(
+            semanas, np.ones(len(semanas), dtype=int), saldo
+        )
+        n_y = len(c) // 2
+        with metricas.etapa("milp_horizonte", variaveis=n_y):
+            resultado = milp(
+                c,
+                constraints=[
+                    LinearConstraint(A_ub, -np.inf, b_ub),
+                    LinearConstraint(A_eq, b_eq, b_eq),
+                ],
+                integrality=np.concatenate([np.ones(n_y), np.zeros(n_y)]),
+                bounds=Bounds(bounds[:, 0], bounds[:, 1]),
+                options={
+                    "time_limit": optimizer.LIMITE_TEMPO_MIP,
+                    "mip_rel_gap": optimizer.GAP_MIP,
+                },
+            )
+
+        if resultado.x is None:
+            return None
+        return np.round(resultado.x[:n_y]).reshape(len(semanas), -1).T
+
+    def registrar_realizado(self, periodo, df_realizado):
+        # 'periodo' começa em 1, como na planilha.
+        if not 1 <= periodo <= self.n_periodos:
+            raise ValueError(f"Período fora do horizonte: {periodo}")
+
+        df_realizado.columns = df_realizado.columns.str.lower().str.strip()
+        missing = [c for c in ["servico", "quantidade"] if c not in df_realizado]
+        if missing:
+            raise ValueError(f"Faltam colunas no Realizado: {missing}")
+
+        df_realizado = data_manager.limpar_dados_numericos(
+            df_realizado, data_manager.COLUNAS_NUMERICAS_REALIZADO
+        )
+        indice = data_manager.obter_indice_servicos(self.df["servico"])
+        self.realizado[:, periodo - 1] = indice.agregar(
+            df_realizado["servico"], df_realizado["quantidade"]
+        )
+
+    def tabela(self):
+        plano = self.plano if self.plano is not None else np.zeros_like(self.tempo)
+        plano = plano.round(0) + 0.0
+        colunas = [f"periodo_{t + 1}" for t in range(self.n_periodos)]
+        tabela = pd.DataFrame(
+            plano, index=self.df["servico"].to_numpy(), columns=colunas
+        )
+        tabela.index.name = "servico"
+        tabela.attrs["lucro_total"] = float(self.lucro @ plano.sum(axis=1))
+        tabela.attrs["horas_usadas"] = (self.tempo * plano).sum(axis=0).tolist()
+        tabela.attrs["horas_disponiveis"] = self.horas.tolist()
+        tabela.attrs["deficit_minimos"] = getattr(self, "deficit_arredondamento", 0.0)
+        tabela.attrs["periodos_fechados"] = self.inicio()
+        return tabela
+
+
+def planejar_horizonte(df, horas, n_periodos=None, df_periodos=None):
+    horizonte = Horizonte(df, horas, n_periodos, df_periodos)
+    tabela, erro = horizonte.otimizar()
+    return horizonte, tabela, erro
@@ -0,0 +1,195 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import data_manager
+import optimizer
+
+SUFIXO_REALIZADO = "_realizado"
+
+
+def listar_arquivos(diretorio, sufixo_realizado=SUFIXO_REALIZADO):
+    # Devolve as tarefas e os arquivos que não viram tarefa (realizado sem
+    # template, nomes repetidos em extensões diferentes), para o relatório de
+    # erros em vez de sumirem.
+    arquivos = {}
+    realizados = {}
+
+    for nome in sorted(os.listdir(diretorio)):
+        base, ext = os.path.splitext(nome)
+        if ext.lower() not in data_manager.EXTENSOES:
+            continue
+
+        caminho = os.path.join(diretorio, nome)
+        if base.endswith(sufixo_realizado):
+            realizados.setdefault(base[: -len(sufixo_realizado)], []).append(caminho)
+        else:
+            arquivos.setdefault(base, []).append(caminho)
+
+    tarefas, erros = [], []
+    for base, caminhos in arquivos.items():
+        caminhos_realizado = realizados.get(base, [])
+        if len(caminhos) > 1:
+            erros.append({"arquivo": base, "erro": repetidos("Templates", caminhos)})
+        elif len(caminhos_realizado) > 1:
+            erros.append(
+                {"arquivo": base, "erro": repetidos("Realizados", caminhos_realizado)}
+            )
+        else:
+            tarefas.append(
+                (
+                    base,
+                    caminhos[0],
+                    caminhos_realizado[0] if caminhos_realizado else None,
+                )
+            )
+
+    for base, caminhos in realizados.items():
+        if base not in arquivos:
+            for caminho in caminhos:
+                erros.append(
+                    {
+                        "arquivo": os.path.basename(caminho),
+                        "erro": f"Realizado sem template correspondente ({base})",
+                    }
+                )
+
+    return tarefas, erros
+
+
+def repetidos(tipo, caminhos):
+    nomes = ", ".join(os.path.basename(c) for c in caminhos)
+    return f"{tipo} com o mesmo nome em extensões diferentes: {nomes}"
+
+
+def otimizar_arquivo(base, caminho_template, caminho_realizado, tempo, inteiro=False):
+    try:
+        df_template = data_manager.ler_arquivo(
+            caminho_template, data_manager.COLUNAS_NUMERICAS_TEMPLATE
+        )
+        if df_template is None:
+            return base, None, "Erro ao ler o Template"
+
+        df_realizado = None
+        if caminho_realizado:
+            df_realizado = data_manager.ler_realizado_agregado(
+                caminho_realizado, os.path.basename(caminho_realizado)
+            )
+
+        df_raw = data_manager.consolidar_dados(df_template, df_realizado)
+        df_final, erro_opt = optimizer.calcular_otimizacao(
+            df_raw, tempo, inteiro=inteiro
+        )
+    except Exception as e:
+        return base, None, f"{type(e).__name__}: {e}"
+
+    if erro_opt:
+        return base, None, erro_opt
+
+    df_final.insert(0, "arquivo", base)
+    df_final.insert(1, "horas_disponiveis", tempo)
+    return base, df_final, None
+
+
+def otimizar_lote(
+    diretorio,
+    tempo_total_disponivel,
+    horas_por_arquivo=None,
+    workers=None,
+    inteiro=False,
+    sufixo_realizado=SUFIXO_REALIZADO,
+):
+    horas_por_arquivo = horas_por_arquivo or {}
+    tarefas, erros = listar_arquivos(diretorio, sufixo_realizado)
+
+    resultados = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futuros = [
+            executor.submit(
+                otimizar_arquivo,
+                base,
+                caminho_template,
+                caminho_realizado,
+                horas_por_arquivo.get(base, tempo_total_disponivel),
+                inteiro,
+            )
+            for base, caminho_template, caminho_realizado in tarefas
+        ]
+
+        for futuro in as_completed(futuros):
+            base, df, erro = futuro.result()
+            if erro:
+                erros.append({"arquivo": base, "erro": erro})
+            else:
+                resultados.append(df)
+
+    df_resultados = (
+        pd.concat(resultados, ignore_index=True).sort_values(
+            ["arquivo", "rentabilidade_hora"], ascending=[True, False]
+        )
+        if resultados
+        else pd.DataFrame()
+    )
+    df_erros = pd.DataFrame(erros, columns=["arquivo", "erro"]).sort_values("arquivo")
+
+    return df_resultados, df_erros
+
+
+def salvar_tabela(df, caminho):
+    if caminho.lower().endswith(".parquet"):
+        df.to_parquet(caminho, index=False)
+    else:
+        df.to_csv(caminho, index=False)
+
+
+def ler_horas_por_arquivo(caminho):
+    df = pd.read_csv(caminho)
+    df.columns = df.columns.str.lower().str.strip()
+    df = data_manager.limpar_dados_numericos(df, ["horas"])
+    return dict(zip(df["arquivo"].astype(str), df["horas"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Otimiza em lote todos os templates de um diretório."
+    )
+    parser.add_argument("diretorio", help="Diretório com templates e realizados")
+    parser.add_argument("saida", help="Tabela consolidada (.csv ou .parquet)")
+    parser.add_argument("--horas", type=float, default=360, help="Horas por mês")
+    parser.add_argument(
+        "--horas-csv",
+        help="CSV com colunas arquivo,horas para horas específicas por arquivo",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--inteiro", action="store_true")
+    parser.add_argument("--sufixo-realizado", default=SUFIXO_REALIZADO)
+    args = parser.parse_args(argv)
+
+    horas_por_arquivo = ler_horas_por_arquivo(args.horas_csv) if args.horas_csv else {}
+
+    df_resultados, df_erros = otimizar_lote(
+        args.diretorio,
+        args.horas,
+        horas_por_arquivo=horas_por_arquivo,
+        workers=args.workers,
+        inteiro=args.inteiro,
+        sufixo_realizado=args.sufixo_realizado,
+    )
+
+    salvar_tabela(df_resultados, args.saida)
+
+    base, _ = os.path.splitext(args.saida)
+    caminho_erros = f"{base}_erros.csv"
+    df_erros.to_csv(caminho_erros, index=False)
+
+    print(
+        f"{df_resultados['arquivo'].nunique() if len(df_resultados) else 0} "
+        f"arquivos otimizados, {len(df_erros)} com erro ({caminho_erros})"
+    )
+
+
+if __name__ == "__main__":
+    main()
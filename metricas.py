@@ -0,0 +1,227 @@
+import atexit
+import cProfile
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DIRETORIO_PERFIS = os.environ.get("SIMPLEX_DIRETORIO_PERFIS")
+INTERVALO_DESCARGA = float(os.environ.get("SIMPLEX_METRICAS_INTERVALO", 5.0))
+LOG_MINIMO_MS = float(os.environ.get("SIMPLEX_LOG_MINIMO_MS", 10.0))
+
+logger = logging.getLogger("simplex")
+
+
+class FormatadorJson(logging.Formatter):
+    def format(self, record):
+        registro = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "nivel": record.levelname.lower(),
+            "msg": record.getMessage(),
+            "pid": record.process,
+            **getattr(record, "campos", {}),
+        }
+        if record.exc_info:
+            registro["erro"] = self.formatException(record.exc_info)
+        return json.dumps(registro, ensure_ascii=False, default=str)
+
+
+def configurar_log(nivel=logging.INFO):
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(FormatadorJson())
+        logger.addHandler(handler)
+    logger.setLevel(nivel)
+    logger.propagate = False
+
+
+def registrar(msg, **campos):
+    logger.info(msg, extra={"campos": campos})
+
+
+class Metricas:
+    def __init__(self, intervalo_descarga=INTERVALO_DESCARGA):
+        self.intervalo_descarga = intervalo_descarga
+        self._valores = {}
+        self._pendentes = {}
+        self._ultima_descarga = time.monotonic()
+        self._lock = threading.Lock()
+        # Segundo nível opcional (ex.: diskcache.Cache), para somar as medições
+        # dos processos que executam os callbacks em segundo plano. Cada
+        # processo soma em memória e só leva os totais ao disco de tempos em
+        # tempos, numa transação.
+        self.disco = None
+
+    def _somar(self, chave, valor):
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+            if self.disco is None:
+                return
+            agendar = not self._pendentes
+            self._pendentes[chave] = self._pendentes.get(chave, 0) + valor
+            vencido = (
+                time.monotonic() - self._ultima_descarga >= self.intervalo_descarga
+            )
+        if vencido:
+            self.descarregar()
+        elif agendar:
+            # Garante a descarga mesmo que o processo fique ocioso.
+            timer = threading.Timer(self.intervalo_descarga, self.descarregar)
+            timer.daemon = True
+            timer.start()
+
+    def descarregar(self):
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, {}
+            self._ultima_descarga = time.monotonic()
+        if self.disco is None or not pendentes:
+            return
+
+        with self.disco.transact():
+            for chave, valor in pendentes.items():
+                self.disco.incr(chave, valor)
+
+    def _apos_fork(self):
+        # O processo filho não leva ao disco o que o pai ainda vai levar.
+        self._lock = threading.Lock()
+        self._pendentes = {}
+        self._ultima_descarga = time.monotonic()
+
+    def observar(self, etapa, segundos):
+        for limite in BUCKETS:
+            if segundos <= limite:
+                self._somar(("bucket", etapa, limite), 1)
+        self._somar(("soma", etapa), segundos)
+        self._somar(("contagem", etapa), 1)
+
+    def contar_cache(self, cache, acerto):
+        self._somar(("cache", cache, "hit" if acerto else "miss"), 1)
+
+    def valores(self):
+        if self.disco is not None:
+            self.descarregar()
+            return {chave: self.disco.get(chave) for chave in self.disco.iterkeys()}
+        with self._lock:
+            return dict(self._valores)
+
+    def limpar(self):
+        if self.disco is not None:
+            self.disco.clear()
+        with self._lock:
+            self._valores.clear()
+            self._pendentes.clear()
+
+    def texto_prometheus(self):
+        valores = self.valores()
+        etapas = sorted({c[1] for c in valores if c[0] == "contagem"})
+        caches = sorted({c[1] for c in valores if c[0] == "cache"})
+
+        linhas = [
+            "# HELP simplex_etapa_segundos Duração de cada etapa do processamento",
+            "# TYPE simplex_etapa_segundos histogram",
+        ]
+        for etapa in etapas:
+            rotulo = f'etapa="{escapar(etapa)}"'
+            for limite in BUCKETS:
+                n = valores.get(("bucket", etapa, limite), 0)
+                linhas.append(
+                    f'simplex_etapa_segundos_bucket{{{rotulo},le="{limite}"}} {n}'
+                )
+            contagem = valores[("contagem", etapa)]
+            linhas.append(
+                f'simplex_etapa_segundos_bucket{{{rotulo},le="+Inf"}} {contagem}'
+            )
+            linhas.append(
+                f"simplex_etapa_segundos_sum{{{rotulo}}} {valores[('soma', etapa)]}"
+            )
+            linhas.append(f"simplex_etapa_segundos_count{{{rotulo}}} {contagem}")
+
+        linhas += [
+            "# HELP simplex_cache_consultas_total Consultas aos caches de DataFrames",
+            "# TYPE simplex_cache_consultas_total counter",
+        ]
+        for cache in caches:
+            for resultado in ("hit", "miss"):
+                n = valores.get(("cache", cache, resultado), 0)
+                linhas.append(
+                    f'simplex_cache_consultas_total{{cache="{escapar(cache)}",resultado="{resultado}"}} {n}'
+                )
+
+        linhas += [
+            "# HELP simplex_cache_hit_ratio Fração das consultas atendidas pelo cache",
+            "# TYPE simplex_cache_hit_ratio gauge",
+        ]
+        for cache in caches:
+            hits = valores.get(("cache", cache, "hit"), 0)
+            total = hits + valores.get(("cache", cache, "miss"), 0)
+            linhas.append(
+                f'simplex_cache_hit_ratio{{cache="{escapar(cache)}"}} {hits / total if total else 0.0}'
+            )
+
+        return "\n".join(linhas) + "\n"
+
+
+metricas = Metricas()
+atexit.register(metricas.descarregar)
+os.register_at_fork(after_in_child=metricas._apos_fork)
+
+
+def escapar(texto):
+    return re.sub(r'(["\\])', r"\\\1", str(texto)).replace("\n", r"\n")
+
+
+@contextmanager
+def etapa(nome, **campos):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        metricas.observar(nome, duracao)
+        # Etapas rápidas (ex.: cada pedido da API) só entram no histograma.
+        if duracao * 1000 >= LOG_MINIMO_MS:
+            registrar(
+                "etapa", etapa=nome, duracao_ms=round(duracao * 1000, 3), **campos
+            )
+
+
+@contextmanager
+def perfilar(nome):
+    if not DIRETORIO_PERFIS:
+        yield
+        return
+
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield
+    finally:
+        perfil.disable()
+        os.makedirs(DIRETORIO_PERFIS, exist_ok=True)
+        carimbo = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        caminho = os.path.join(DIRETORIO_PERFIS, f"{nome}_{carimbo}_{os.getpid()}.prof")
+        perfil.dump_stats(caminho)
+        registrar("perfil", etapa=nome, arquivo=caminho)
+
+
+def medido(nome):
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            try:
+                with perfilar(nome), etapa(nome):
+                    return funcao(*args, **kwargs)
+            finally:
+                # Callbacks em segundo plano rodam em processos que podem
+                # terminar logo depois: leva as medições ao disco já.
+                metricas.descarregar()
+
+        return medida
+
+    return decorador
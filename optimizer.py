@@ -1,9 +1,357 @@
-from scipy.optimize import linprog
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
 import pandas as pd
 
+import metricas
+
+LIMITE_TEMPO_MIP = 10.0
+GAP_MIP = 1e-4
+
+
+class SessaoOtimizacao:
+    def __init__(self, df):
+        self.lucro = df["lucro_unitario"].to_numpy(dtype=float)
+        self.tempo = df["tempo"].to_numpy(dtype=float)
+        self.minimo = df["minimo"].to_numpy(dtype=float)
+        self.maximo = df["maximo"].to_numpy(dtype=float)
+        self.venda = df["venda"].to_numpy(dtype=float)
+
+        self.tempo_minimo = float(self.minimo @ self.tempo)
+
+        # Recursos extras (equipes, veículos, materiais) viram linhas de A_ub,
+        # ao lado da linha de tempo.
+        self.capacidades = dict(df.attrs.get("capacidades") or {})
+        self.recursos = list(self.capacidades)
+        self.capacidade = np.array(
+            [self.capacidades[r] for r in self.recursos], dtype=float
+        )
+        self.consumo = (
+            df[self.recursos].to_numpy(dtype=float).T
+            if self.recursos
+            else np.zeros((0, len(self.lucro)))
+        )
+        self.consumo_minimo = self.consumo @ self.minimo
+
+        self.c = -self.lucro
+        self.bounds = np.column_stack([self.minimo, self.maximo])
+        self._ultimo_lp = None
+
+        # Com uma única restrição de tempo e limites por serviço, o LP é uma
+        # mochila fracionária: preencher por lucro/hora é exato.
+        self.guloso = bool(
+            not self.recursos
+            and np.all(self.tempo > 0)
+            and np.all(np.isfinite(self.minimo))
+            and np.all(self.minimo <= self.maximo)
+        )
+
+        if self.guloso:
+            ordem = np.argsort(-(self.lucro / self.tempo), kind="stable")
+            self.ordem = ordem[self.lucro[ordem] > 0]
+            self.folga_tempo = (self.maximo - self.minimo)[self.ordem] * self.tempo[
+                self.ordem
+            ]
+            self.tempo_acumulado = np.cumsum(self.folga_tempo)
+
+    @functools.cached_property
+    def A(self):
+        # scipy só é importado quando o HiGHS é realmente usado: o caminho
+        # guloso roda só com numpy.
+        from scipy import sparse
+
+        return sparse.vstack(
+            [sparse.csr_array(self.tempo[None, :]), sparse.csr_array(self.consumo)]
+        ).tocsr()
+
+    def lado_direito(self, tempo_total_disponivel):
+        return np.concatenate([[tempo_total_disponivel], self.capacidade])
+
+    def _resolver_lp(self, tempo_total_disponivel):
+        # Guarda a última solução para que sensibilidade() reaproveite os duais
+        # do mesmo solve.
+        ultimo = self._ultimo_lp
+        if ultimo is not None and ultimo[0] == tempo_total_disponivel:
+            return ultimo[1]
+
+        from scipy.optimize import linprog
+
+        with metricas.etapa("linprog", variaveis=len(self.c)):
+            resultado = linprog(
+                self.c,
+                A_ub=self.A,
+                b_ub=self.lado_direito(tempo_total_disponivel),
+                bounds=self.bounds,
+                method="highs",
+            )
+        self._ultimo_lp = (tempo_total_disponivel, resultado)
+        return resultado
+
+    def resolver(self, tempo_total_disponivel):
+        if not self.guloso:
+            resultado = self._resolver_lp(tempo_total_disponivel)
+            if not resultado.success:
+                return None, f"Erro matemático: {resultado.message}"
+            return resultado.x, None
+
+        restante = tempo_total_disponivel - self.tempo_minimo
+        x = self.minimo.copy()
+
+        k = int(np.searchsorted(self.tempo_acumulado, restante, side="right"))
+        cheios = self.ordem[:k]
+        x[cheios] = self.maximo[cheios]
+
+        if k < len(self.ordem):
+            usado = self.tempo_acumulado[k - 1] if k else 0.0
+            i = self.ordem[k]
+            x[i] += (restante - usado) / self.tempo[i]
+
+        return x, None
+
+    def sensibilidade(self, tempo_total_disponivel):
+        if self.guloso:
+            return self._sensibilidade_gulosa(tempo_total_disponivel)
+
+        resultado = self._resolver_lp(tempo_total_disponivel)
+        if not resultado.success:
+            return None
+
+        # linprog minimiza -lucro, então os marginais saem com o sinal trocado.
+        precos = -resultado.ineqlin.marginals
+        custo_reduzido = self.lucro - self.A.T @ precos
+
+        no_maximo = resultado.x >= self.maximo - 1e-7
+        no_minimo = (resultado.x <= self.minimo + 1e-7) & ~no_maximo
+
+        # O scipy não expõe o ranging do HiGHS; para variáveis básicas a faixa
+        # fica indefinida (NaN).
+        lucro_min = np.full(len(self.lucro), np.nan)
+        lucro_max = np.full(len(self.lucro), np.nan)
+        lucro_min[no_maximo] = (self.lucro - np.maximum(custo_reduzido, 0))[no_maximo]
+        lucro_max[no_maximo] = np.inf
+        lucro_min[no_minimo] = -np.inf
+        lucro_max[no_minimo] = (self.lucro - np.minimum(custo_reduzido, 0))[no_minimo]
+
+        return self._montar_sensibilidade(
+            precos[0],
+            (np.nan, np.nan),
+            precos[1:],
+            custo_reduzido,
+            lucro_min,
+            lucro_max,
+        )
+
+    def _sensibilidade_gulosa(self, tempo_total_disponivel):
+        restante = tempo_total_disponivel - self.tempo_minimo
+        k = int(np.searchsorted(self.tempo_acumulado, restante, side="right"))
+        n = len(self.ordem)
+        razao = self.lucro[self.ordem] / self.tempo[self.ordem]
+
+        # O valor da hora é o lucro/hora do serviço parcialmente preenchido e
+        # vale enquanto as horas extras couberem na folga dele.
+        valor_hora = razao[k] if k < n else 0.0
+        faixa_horas = (
+            self.tempo_minimo + (self.tempo_acumulado[k - 1] if k else 0.0),
+            self.tempo_minimo + (self.tempo_acumulado[k] if k < n else np.inf),
+        )
+
+        custo_reduzido = self.lucro - valor_hora * self.tempo
+        limite = valor_hora * self.tempo
+
+        lucro_min = np.full(len(self.lucro), -np.inf)
+        lucro_max = limite.copy()
+        cheios = self.ordem[:k]
+        lucro_min[cheios] = limite[cheios]
+        lucro_max[cheios] = np.inf
+
+        if k < n:
+            # Vizinhos sem folga (mínimo = máximo) não mudam o plano ao trocar
+            # de posição com o serviço parcial.
+            ativos = np.flatnonzero(self.folga_tempo > 0)
+            anteriores = ativos[ativos < k]
+            seguintes = ativos[ativos > k]
+            i = self.ordem[k]
+            lucro_min[i] = (
+                razao[seguintes[0]] if len(seguintes) else 0.0
+            ) * self.tempo[i]
+            lucro_max[i] = (
+                razao[anteriores[-1]] if len(anteriores) else np.inf
+            ) * self.tempo[i]
+
+        return self._montar_sensibilidade(
+            valor_hora,
+            faixa_horas,
+            np.zeros(0),
+            custo_reduzido,
+            lucro_min,
+            lucro_max,
+        )
 
-def calcular_otimizacao(df, tempo_total_disponivel):
-    tempo_minimo_obrigatorio = (df["minimo"] * df["tempo"]).sum()
+    def _montar_sensibilidade(
+        self, valor_hora, faixa_horas, precos, custo_reduzido, lucro_min, lucro_max
+    ):
+        fixo = self.minimo == self.maximo
+        lucro_min[fixo] = -np.inf
+        lucro_max[fixo] = np.inf
+
+        return {
+            "valor_hora": float(valor_hora),
+            "faixa_horas": tuple(float(h) for h in faixa_horas),
+            "precos_recursos": {r: float(p) for r, p in zip(self.recursos, precos)},
+            "custo_reduzido": custo_reduzido,
+            "lucro_unitario_min": lucro_min,
+            "lucro_unitario_max": lucro_max,
+        }
+
+    def resolver_inteiro(
+        self, tempo_total_disponivel, limite_tempo=LIMITE_TEMPO_MIP, gap_mip=GAP_MIP
+    ):
+        from scipy.optimize import Bounds, LinearConstraint, milp
+
+        minimo = np.ceil(self.minimo)
+        maximo = np.floor(self.maximo)
+        b = self.lado_direito(tempo_total_disponivel)
+
+        with metricas.etapa("milp", variaveis=len(self.c)):
+            resultado = milp(
+                self.c,
+                constraints=LinearConstraint(self.A, -np.inf, b),
+                integrality=np.ones(len(self.lucro)),
+                bounds=Bounds(minimo, maximo),
+                options={"time_limit": limite_tempo, "mip_rel_gap": gap_mip},
+            )
+
+        if resultado.x is not None:
+            gap = resultado.mip_gap if resultado.mip_gap is not None else 0.0
+            return np.round(resultado.x), float(gap), None
+
+        if resultado.status == 2:
+            return None, None, "INVIÁVEL: não existe plano com quantidades inteiras."
+
+        # Estourou o tempo sem solução inteira: arredonda o LP para baixo,
+        # que continua respeitando as horas quando os mínimos são inteiros.
+        x_lp, erro = self.resolver(tempo_total_disponivel)
+        if erro:
+            return None, None, erro
+
+        x = np.maximum(np.floor(x_lp + 1e-9), minimo)
+        if np.any(self.A @ x > b) or np.any(x > maximo):
+            return None, None, f"Erro matemático: {resultado.message}"
+
+        limite = x_lp @ self.lucro
+        gap = (limite - x @ self.lucro) / max(abs(limite), 1e-9)
+        return x, float(gap), None
+
+    def resolver_varios(self, horas):
+        horas = np.asarray(horas, dtype=float)
+        X = np.tile(self.minimo, (len(horas), 1))
+        viavel = horas >= self.tempo_minimo
+
+        if not self.guloso:
+            for j, h in enumerate(horas):
+                if viavel[j]:
+                    x, erro = self.resolver(h)
+                    if erro:
+                        viavel[j] = False
+                    else:
+                        X[j] = x
+            X[~viavel] = np.nan
+            return X, viavel
+
+        # A solução é linear por partes nas horas: cada serviço, na ordem de
+        # lucro/hora, recebe o tempo que sobra depois dos anteriores.
+        restante = np.clip(horas - self.tempo_minimo, 0, None)[:, None]
+        inicio = np.concatenate([[0.0], self.tempo_acumulado[:-1]])
+        preenchido = np.clip(restante - inicio, 0, self.folga_tempo)
+        X[:, self.ordem] += preenchido / self.tempo[self.ordem]
+
+        X[~viavel] = np.nan
+        return X, viavel
+
+    def breakpoints(self, max_pontos=500):
+        if not self.guloso:
+            tempo_maximo = float(np.nan_to_num(self.maximo, posinf=0) @ self.tempo)
+            return np.linspace(
+                self.tempo_minimo, max(tempo_maximo, self.tempo_minimo), 25
+            )
+
+        pontos = self.tempo_minimo + np.concatenate([[0.0], self.tempo_acumulado])
+        pontos = pontos[np.isfinite(pontos)]
+
+        if len(pontos) > max_pontos:
+            pontos = np.linspace(pontos[0], pontos[-1], max_pontos)
+
+        return pontos
+
+
+_sessoes = OrderedDict()
+_sessoes_lock = threading.Lock()
+MAX_SESSOES = 16
+
+
+def obter_sessao(df):
+    digest = hashlib.blake2b(digest_size=16)
+    capacidades = df.attrs.get("capacidades") or {}
+    digest.update(repr(sorted(capacidades.items())).encode())
+    for col in ["lucro_unitario", "tempo", "minimo", "maximo", "venda", *capacidades]:
+        digest.update(np.ascontiguousarray(df[col].to_numpy(dtype=float)).tobytes())
+    chave = digest.hexdigest()
+
+    with _sessoes_lock:
+        sessao = _sessoes.get(chave)
+        if sessao is not None:
+            _sessoes.move_to_end(chave)
+            return sessao
+
+    sessao = SessaoOtimizacao(df)
+
+    with _sessoes_lock:
+        _sessoes[chave] = sessao
+        while len(_sessoes) > MAX_SESSOES:
+            _sessoes.popitem(last=False)
+
+    return sessao
+
+
+def varrer_horas(df, horas=None, sessao=None):
+    if sessao is None:
+        sessao = obter_sessao(df)
+
+    if horas is None:
+        horas = sessao.breakpoints()
+
+    horas = np.asarray(horas, dtype=float)
+    X, viavel = sessao.resolver_varios(horas)
+
+    curva = pd.DataFrame(
+        {
+            "horas": horas,
+            "lucro": X @ sessao.lucro,
+            "faturamento": X @ sessao.venda,
+            "tempo_usado": X @ sessao.tempo,
+            "viavel": viavel,
+        }
+    )
+    quantidades = pd.DataFrame(X, index=horas, columns=df["servico"].to_numpy())
+
+    return curva, quantidades
+
+
+def calcular_otimizacao(
+    df,
+    tempo_total_disponivel,
+    sessao=None,
+    inteiro=False,
+    limite_tempo=LIMITE_TEMPO_MIP,
+    gap_mip=GAP_MIP,
+):
+    if sessao is None:
+        sessao = obter_sessao(df)
+
+    tempo_minimo_obrigatorio = sessao.tempo_minimo
 
     if tempo_minimo_obrigatorio > tempo_total_disponivel:
         deficit = tempo_minimo_obrigatorio - tempo_total_disponivel
@@ -14,17 +362,39 @@ def calcular_otimizacao(df, tempo_total_disponivel):
         )
         return None, msg_erro
 
-    c = -df["lucro_unitario"].values
-    A = [df["tempo"].values]
-    b = [tempo_total_disponivel]
-    bounds = list(zip(df["minimo"], df["maximo"]))
+    for recurso, minimo, capacidade in zip(
+        sessao.recursos, sessao.consumo_minimo, sessao.capacidade
+    ):
+        if minimo > capacidade:
+            return None, (
+                f"INVIÁVEL: Os mínimos exigem {minimo:.1f} de "
+                f"'{recurso.removeprefix('recurso_')}', "
+                f"mas a capacidade é {capacidade:g}."
+            )
+
+    if inteiro:
+        x, gap, erro = sessao.resolver_inteiro(
+            tempo_total_disponivel, limite_tempo, gap_mip
+        )
+        df.attrs["gap_mip"] = gap
+    else:
+        x, erro = sessao.resolver(tempo_total_disponivel)
+        df.attrs.pop("gap_mip", None)
 
-    resultado = linprog(c, A_ub=A, b_ub=b, bounds=bounds, method="highs")
+    if erro:
+        return None, erro
 
-    if not resultado.success:
-        return None, f"Erro matemático: {resultado.message}"
+    df["qtd_sugerida"] = x.round(0)
+    df.attrs["horas_disponiveis"] = tempo_total_disponivel
 
-    df["qtd_sugerida"] = resultado.x.round(0)
+    # Duais do LP (no modo inteiro, da relaxação linear): valor de uma hora a
+    # mais e quanto cada lucro unitário pode variar sem mudar o plano.
+    sensibilidade = sessao.sensibilidade(tempo_total_disponivel)
+    if sensibilidade is not None:
+        for col in ["custo_reduzido", "lucro_unitario_min", "lucro_unitario_max"]:
+            df[col] = sensibilidade[col]
+        for chave in ["valor_hora", "faixa_horas", "precos_recursos"]:
+            df.attrs[chave] = sensibilidade[chave]
 
     df["lucro_meta"] = df["qtd_sugerida"] * df["lucro_unitario"]
     df["faturamento_meta"] = df["qtd_sugerida"] * df["venda"]
@@ -0,0 +1,199 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import metricas
+import optimizer
+
+N_CENARIOS = 10_000
+# Limite por pedido no dashboard: cada simulação ocupa um processo até o fim.
+MAX_CENARIOS = int(os.environ.get("SIMPLEX_MAX_CENARIOS", 50_000))
+VARIACAO_TEMPO = 0.15
+VARIACAO_PRECO = 0.05
+PERCENTIS = [5, 25, 50, 75, 95]
+ELEMENTOS_POR_BLOCO = 2_000_000
+MIN_ELEMENTOS_PARALELO = 50_000_000
+
+
+def variacoes(df, coluna, padrao):
+    col = f"variacao_{coluna}"
+    if col in df.columns:
+        return df[col].fillna(padrao).to_numpy(dtype=float)
+    return np.full(len(df), float(padrao))
+
+
+def sortear(rng, media, variacao, n_cenarios):
+    # Lognormal com a média do template e o coeficiente de variação pedido:
+    # sempre positiva e com cauda longa, como a duração real dos serviços.
+    sigma2 = np.log1p(variacao**2)
+    positivo = media > 0
+    mu = np.log(np.where(positivo, media, 1.0)) - sigma2 / 2
+    amostras = rng.lognormal(mu, np.sqrt(sigma2), size=(n_cenarios, len(media)))
+    return np.where(positivo, amostras, media)
+
+
+def reotimizar_guloso(tempo, lucro, minimo, maximo, tempo_total_disponivel):
+    # Mesma mochila fracionária de SessaoOtimizacao, mas com uma linha por
+    # cenário: ordena por lucro/hora e preenche as horas que sobram.
+    tempo_minimo = tempo @ minimo
+    positivo = lucro > 0
+    razao = np.where(positivo, lucro / tempo, 0.0)
+
+    ordem = np.argsort(-razao, axis=1)
+    folga = np.take_along_axis(
+        np.where(positivo, (maximo - minimo) * tempo, 0.0), ordem, axis=1
+    )
+    acumulado = np.cumsum(folga, axis=1)
+    inicio = np.concatenate([np.zeros((len(folga), 1)), acumulado[:, :-1]], axis=1)
+
+    restante = np.clip(tempo_total_disponivel - tempo_minimo, 0, None)[:, None]
+    preenchido = np.clip(restante - inicio, 0, folga)
+
+    lucro_otimo = lucro @ minimo + np.sum(
+        preenchido * np.take_along_axis(razao, ordem, axis=1), axis=1
+    )
+    return lucro_otimo, tempo_minimo <= tempo_total_disponivel
+
+
+def reotimizar_linprog(tempo, lucro, modelo, tempo_total_disponivel):
+    from scipy.optimize import linprog
+
+    lucro_otimo = np.full(len(tempo), np.nan)
+    viavel = np.zeros(len(tempo), dtype=bool)
+    b = np.concatenate([[tempo_total_disponivel], modelo["capacidade"]])
+
+    for i in range(len(tempo)):
+        resultado = linprog(
+            -lucro[i],
+            A_ub=np.vstack([tempo[i], modelo["consumo"]]),
+            b_ub=b,
+            bounds=modelo["bounds"],
+            method="highs",
+        )
+        if resultado.success:
+            lucro_otimo[i] = -resultado.fun
+            viavel[i] = True
+
+    return lucro_otimo, viavel
+
+
+def avaliar_bloco(semente, n_cenarios, modelo, tempo_total_disponivel):
+    rng = np.random.default_rng(semente)
+    tempo = sortear(rng, modelo["tempo"], modelo["variacao_tempo"], n_cenarios)
+    custo = sortear(rng, modelo["custo"], modelo["variacao_custo"], n_cenarios)
+    venda = sortear(rng, modelo["venda"], modelo["variacao_venda"], n_cenarios)
+    lucro = venda - custo
+
+    plano = modelo["plano"]
+    tempo_plano = tempo @ plano
+    # O plano arredondado pode passar um pouco das horas já no cenário base;
+    # inviável é estourar além disso.
+    limite_plano = max(tempo_total_disponivel, modelo["tempo"] @ plano) + 1e-9
+
+    if modelo["guloso"]:
+        lucro_otimo, viavel_otimo = reotimizar_guloso(
+            tempo, lucro, modelo["minimo"], modelo["maximo"], tempo_total_disponivel
+        )
+    else:
+        lucro_otimo, viavel_otimo = reotimizar_linprog(
+            tempo, lucro, modelo, tempo_total_disponivel
+        )
+
+    return pd.DataFrame(
+        {
+            "lucro_plano": lucro @ plano,
+            "tempo_plano": tempo_plano,
+            "viavel_plano": tempo_plano <= limite_plano,
+            "lucro_otimo": np.where(viavel_otimo, lucro_otimo, np.nan),
+            "viavel_otimo": viavel_otimo,
+        }
+    )
+
+
+def montar_modelo(df, variacao_tempo, variacao_preco):
+    sessao = optimizer.obter_sessao(df)
+    return {
+        "tempo": sessao.tempo,
+        "custo": df["custo"].to_numpy(dtype=float),
+        "venda": sessao.venda,
+        "variacao_tempo": variacoes(df, "tempo", variacao_tempo),
+        "variacao_custo": variacoes(df, "custo", variacao_preco),
+        "variacao_venda": variacoes(df, "venda", variacao_preco),
+        "plano": df["qtd_sugerida"].to_numpy(dtype=float),
+        "minimo": sessao.minimo,
+        "maximo": sessao.maximo,
+        "guloso": sessao.guloso,
+        "consumo": sessao.consumo,
+        "capacidade": sessao.capacidade,
+        "bounds": sessao.bounds,
+    }
+
+
+def resumir(cenarios):
+    linhas = {}
+    for nome, lucro, viavel in [
+        ("plano_atual", cenarios["lucro_plano"], cenarios["viavel_plano"]),
+        ("reotimizado", cenarios["lucro_otimo"], cenarios["viavel_otimo"]),
+    ]:
+        valores = lucro.dropna().to_numpy()
+        percentis = (
+            np.percentile(valores, PERCENTIS)
+            if len(valores)
+            else np.full(len(PERCENTIS), np.nan)
+        )
+        linhas[nome] = {
+            "lucro_medio": float(np.mean(valores)) if len(valores) else np.nan,
+            **{f"p{p}": float(v) for p, v in zip(PERCENTIS, percentis)},
+            "taxa_inviavel": float(1 - viavel.mean()),
+        }
+    return pd.DataFrame.from_dict(linhas, orient="index")
+
+
+def simular_cenarios(
+    df,
+    tempo_total_disponivel=None,
+    n_cenarios=N_CENARIOS,
+    variacao_tempo=VARIACAO_TEMPO,
+    variacao_preco=VARIACAO_PRECO,
+    seed=0,
+    workers=None,
+):
+    if tempo_total_disponivel is None:
+        tempo_total_disponivel = df.attrs["horas_disponiveis"]
+
+    modelo = montar_modelo(df, variacao_tempo, variacao_preco)
+
+    # Com a mochila vetorizada só vale abrir processos para simulações grandes;
+    # com recursos extras cada cenário é um linprog e o paralelismo compensa.
+    if workers is None:
+        grande = n_cenarios * len(df) >= MIN_ELEMENTOS_PARALELO
+        workers = (os.cpu_count() or 1) if grande or not modelo["guloso"] else 1
+
+    # Blocos com sementes independentes, dependentes só do tamanho do modelo:
+    # o resultado é o mesmo com qualquer número de processos.
+    por_bloco = max(1, ELEMENTOS_POR_BLOCO // max(len(df), 1))
+    if not modelo["guloso"]:
+        por_bloco = min(por_bloco, 250)
+    tamanhos = [
+        min(por_bloco, n_cenarios - inicio)
+        for inicio in range(0, n_cenarios, por_bloco)
+    ]
+    sementes = np.random.SeedSequence(seed).spawn(len(tamanhos))
+    workers = max(1, min(workers, len(tamanhos)))
+
+    with metricas.etapa("simular_cenarios", cenarios=n_cenarios, workers=workers):
+        argumentos = (
+            sementes,
+            tamanhos,
+            [modelo] * len(tamanhos),
+            [tempo_total_disponivel] * len(tamanhos),
+        )
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                blocos = list(executor.map(avaliar_bloco, *argumentos))
+        else:
+            blocos = list(map(avaliar_bloco, *argumentos))
+
+    cenarios = pd.concat(blocos, ignore_index=True)
+    return resumir(cenarios), cenarios
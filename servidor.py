@@ -0,0 +1,121 @@
+import argparse
+import os
+
+ENDERECO = os.environ.get("SIMPLEX_ENDERECO", "127.0.0.1:8050")
+WORKERS = int(os.environ.get("SIMPLEX_WORKERS", (os.cpu_count() or 1) + 1))
+THREADS = int(os.environ.get("SIMPLEX_THREADS", 4))
+TIMEOUT = int(os.environ.get("SIMPLEX_TIMEOUT", 300))
+PEDIDO_AQUECIMENTO = {
+    "servicos": {
+        "servico": ["aquecimento a", "aquecimento b"],
+        "tempo": [1.0, 2.0],
+        "custo": [10.0, 20.0],
+        "venda": [30.0, 70.0],
+        "minimo": [1, 0],
+        "maximo": [5, 5],
+    },
+    "horas": 8,
+}
+
+
+def aquecer(no_mestre=True):
+    # Com preload roda no processo mestre antes do fork: as importações
+    # pesadas (scipy, plotly, openpyxl) e o primeiro cálculo ficam prontos
+    # para todos os workers, que herdam a memória já carregada. Os caches em
+    # disco ficam de fora (só memória no mestre) e cada worker os abre em
+    # apos_fork. Sem preload roda em cada worker, que abre os próprios caches.
+    if no_mestre:
+        os.environ["SIMPLEX_DISCOS_POR_WORKER"] = "1"
+    import openpyxl  # noqa: F401
+
+    import api
+    import app
+    import components
+
+    components.template_padrao()
+    api.resolver_json(PEDIDO_AQUECIMENTO)
+    return app.server
+
+
+def apos_fork(servidor, worker):
+    import app
+
+    app.conectar_discos()
+
+
+def opcoes_gunicorn(args):
+    # Com preload o código fica carregado no mestre e o HUP só recria os
+    # workers com ele; código novo exige USR2 (novo mestre) ou --sem-preload.
+    preload = not args.sem_preload
+    opcoes = {
+        "bind": args.endereco,
+        "workers": args.workers,
+        "threads": args.threads,
+        "worker_class": "gthread",
+        "preload_app": preload,
+        "timeout": TIMEOUT,
+        # Em HUP os workers novos sobem antes dos antigos saírem, e os
+        # antigos terminam os pedidos em andamento.
+        "graceful_timeout": TIMEOUT,
+        "keepalive": 5,
+        # Reinicia cada worker de tempos em tempos para devolver a memória
+        # de uploads grandes; o jitter evita que todos reiniciem juntos.
+        "max_requests": args.max_pedidos,
+        "max_requests_jitter": max(args.max_pedidos // 10, 1),
+        "accesslog": "-" if args.log_acesso else None,
+        "proc_name": "simplex-dashboard",
+    }
+    if preload:
+        opcoes["post_fork"] = apos_fork
+    return opcoes
+
+
+def servir(args):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit(
+            "O modo de produção requer o gunicorn: pip install gunicorn"
+        ) from None
+
+    class Servidor(BaseApplication):
+        def load_config(self):
+            for chave, valor in opcoes_gunicorn(args).items():
+                self.cfg.set(chave, valor)
+
+        def load(self):
+            return aquecer(no_mestre=not args.sem_preload)
+
+    Servidor().run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve o dashboard e a API com vários processos (gunicorn)."
+    )
+    parser.add_argument(
+        "--endereco",
+        default=ENDERECO,
+        help="host:porta (padrão: só esta máquina). Use 0.0.0.0:PORTA para "
+        "aceitar conexões de fora, de preferência atrás de um proxy",
+    )
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--threads", type=int, default=THREADS)
+    parser.add_argument(
+        "--max-pedidos",
+        type=int,
+        default=10_000,
+        help="Pedidos atendidos por worker antes de ser reiniciado (0 desliga)",
+    )
+    parser.add_argument("--log-acesso", action="store_true")
+    parser.add_argument(
+        "--sem-preload",
+        action="store_true",
+        help="Cada worker carrega o app ao subir: mais lento e sem memória "
+        "compartilhada, mas 'kill -HUP' passa a recarregar o código",
+    )
+    servir(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
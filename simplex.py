@@ -0,0 +1,218 @@
+import argparse
+import os
+import sys
+
+import data_manager
+import optimizer
+
+COLUNAS_RESUMO = ["servico", "qtd_sugerida", "tempo_meta", "lucro_meta"]
+
+
+def otimizar(
+    caminho_template, horas, caminho_realizado=None, inteiro=False, capacidades=None
+):
+    df_template = data_manager.ler_arquivo(
+        caminho_template, data_manager.COLUNAS_NUMERICAS_TEMPLATE
+    )
+    if df_template is None:
+        raise ValueError(f"Erro ao ler o Template: {caminho_template}")
+
+    df_realizado = None
+    if caminho_realizado:
+        df_realizado = data_manager.ler_realizado_agregado(
+            caminho_realizado, os.path.basename(caminho_realizado)
+        )
+
+    df_raw = data_manager.consolidar_dados(df_template, df_realizado, capacidades)
+    df_final, erro = optimizer.calcular_otimizacao(df_raw, horas, inteiro=inteiro)
+    if erro:
+        raise ValueError(erro)
+
+    return df_final
+
+
+def planejar(
+    caminho_template,
+    horas,
+    semanas=None,
+    caminho_periodos=None,
+    realizados=None,
+    capacidades=None,
+):
+    import horizonte
+
+    df_template = data_manager.ler_arquivo(
+        caminho_template, data_manager.COLUNAS_NUMERICAS_TEMPLATE
+    )
+    if df_template is None:
+        raise ValueError(f"Erro ao ler o Template: {caminho_template}")
+    df_raw = data_manager.consolidar_dados(df_template, capacidades=capacidades)
+
+    df_periodos = None
+    if caminho_periodos:
+        df_periodos = data_manager.ler_arquivo(caminho_periodos)
+        if df_periodos is None:
+            raise ValueError(f"Erro ao ler o arquivo de períodos: {caminho_periodos}")
+
+    plano = horizonte.Horizonte(df_raw, horas, semanas, df_periodos)
+    for periodo, caminho in sorted((realizados or {}).items()):
+        plano.registrar_realizado(
+            periodo,
+            data_manager.ler_realizado_agregado(caminho, os.path.basename(caminho)),
+        )
+
+    tabela, erro = plano.otimizar()
+    if erro:
+        raise ValueError(erro)
+
+    return tabela
+
+
+def ler_capacidades(valores):
+    capacidades = {}
+    for valor in valores or []:
+        recurso, sep, capacidade = valor.partition("=")
+        if not sep:
+            raise ValueError(f"Capacidade inválida (use recurso=valor): {valor}")
+        capacidades[recurso.strip().lower()] = float(capacidade.replace(",", "."))
+    return capacidades or None
+
+
+def ler_realizados(valores):
+    realizados = {}
+    for valor in valores or []:
+        periodo, sep, caminho = valor.partition("=")
+        if not sep or not periodo.strip().isdigit():
+            raise ValueError(f"Realizado inválido (use semana=arquivo): {valor}")
+        realizados[int(periodo)] = caminho
+    return realizados
+
+
+def moeda(valor):
+    return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def comando_otimizar(args):
+    df_final = otimizar(
+        args.template,
+        args.horas,
+        args.realizado,
+        inteiro=args.inteiro,
+        capacidades=ler_capacidades(args.capacidade),
+    )
+
+    if args.saida:
+        import lote
+
+        lote.salvar_tabela(df_final, args.saida)
+
+    print(df_final[COLUNAS_RESUMO].to_string(index=False))
+    print(
+        f"\nLucro: {moeda(df_final['lucro_meta'].sum())} | "
+        f"Tempo: {df_final['tempo_meta'].sum():.1f}h de {args.horas:g}h | "
+        f"Valor de +1 hora: {moeda(df_final.attrs.get('valor_hora', 0.0))}"
+    )
+
+
+def comando_horizonte(args):
+    semanas = args.semanas
+    if semanas is None and len(args.horas) == 1:
+        semanas = 12
+
+    tabela = planejar(
+        args.template,
+        args.horas,
+        semanas,
+        args.periodos,
+        ler_realizados(args.realizado),
+        ler_capacidades(args.capacidade),
+    )
+
+    if args.saida:
+        import lote
+
+        lote.salvar_tabela(tabela.reset_index(), args.saida)
+
+    print(tabela.to_string())
+    print(
+        f"\nLucro no horizonte: {moeda(tabela.attrs['lucro_total'])} | "
+        f"Semanas fechadas: {tabela.attrs['periodos_fechados']} de {tabela.shape[1]}"
+    )
+    print("\nHoras por semana (usadas / disponíveis):")
+    for semana, (usadas, disponiveis) in enumerate(
+        zip(tabela.attrs["horas_usadas"], tabela.attrs["horas_disponiveis"]), 1
+    ):
+        marca = " ACIMA DO LIMITE" if usadas > disponiveis + 1e-6 else ""
+        print(f"  {semana:>3}: {usadas:.1f} / {disponiveis:.1f}{marca}")
+    if tabela.attrs["deficit_minimos"]:
+        print(
+            "Atenção: com quantidades inteiras faltam "
+            f"{tabela.attrs['deficit_minimos']:.0f} unidades para os mínimos acumulados."
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m simplex",
+        description="Otimização de serviços sem abrir o dashboard.",
+    )
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    otimizar_parser = comandos.add_parser(
+        "otimizar", help="Otimiza um template e mostra o plano"
+    )
+    otimizar_parser.add_argument("template", help="Template de metas (.xlsx ou .csv)")
+    otimizar_parser.add_argument("--horas", type=float, default=360)
+    otimizar_parser.add_argument("--realizado", help="Arquivo de dados realizados")
+    otimizar_parser.add_argument("--inteiro", action="store_true")
+    otimizar_parser.add_argument(
+        "--capacidade",
+        action="append",
+        help="Capacidade de um recurso extra (ex.: equipe=3); pode repetir",
+    )
+    otimizar_parser.add_argument("--saida", help="Salva o plano (.csv ou .parquet)")
+    otimizar_parser.set_defaults(funcao=comando_otimizar)
+
+    horizonte_parser = comandos.add_parser(
+        "horizonte", help="Planeja várias semanas com um único modelo"
+    )
+    horizonte_parser.add_argument("template", help="Template de metas (.xlsx ou .csv)")
+    horizonte_parser.add_argument(
+        "--horas",
+        type=float,
+        nargs="+",
+        required=True,
+        help="Horas por semana: um valor para todas ou um por semana",
+    )
+    horizonte_parser.add_argument(
+        "--semanas",
+        type=int,
+        help="Tamanho do horizonte (padrão: 12, ou o número de valores em --horas)",
+    )
+    horizonte_parser.add_argument(
+        "--periodos", help="Arquivo com servico, periodo e tempo/minimo/maximo"
+    )
+    horizonte_parser.add_argument(
+        "--realizado",
+        action="append",
+        help="Realizado de uma semana já fechada (ex.: 1=semana1.csv); pode repetir",
+    )
+    horizonte_parser.add_argument(
+        "--capacidade",
+        action="append",
+        help="Capacidade de um recurso extra por semana (ex.: equipe=3)",
+    )
+    horizonte_parser.add_argument("--saida", help="Salva o plano (.csv ou .parquet)")
+    horizonte_parser.set_defaults(funcao=comando_horizonte)
+
+    args = parser.parse_args(argv)
+    try:
+        args.funcao(args)
+    except ValueError as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
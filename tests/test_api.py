@@ -0,0 +1,51 @@
+import pytest
+from flask import Flask
+
+import api
+
+SERVICOS = {
+    "servico": ["a", "b"],
+    "tempo": [1, 2],
+    "custo": [1, 2],
+    "venda": [5, 9],
+    "minimo": [0, 0],
+    "maximo": [4, 4],
+}
+
+
+@pytest.fixture
+def cliente():
+    servidor = Flask(__name__)
+    servidor.register_blueprint(api.api)
+    api.cache_respostas.limpar()
+    return servidor.test_client()
+
+
+def test_realizado_sem_servico_responde_400_json(cliente):
+    resposta = cliente.post(
+        "/api/otimizar",
+        json={"servicos": SERVICOS, "realizado": [{"quantidade": 1}], "horas": 7},
+    )
+    assert resposta.status_code == 400
+    assert "servico" in resposta.get_json()["erro"]
+
+
+def test_lote_com_realizado_invalido_responde_por_item(cliente):
+    resposta = cliente.post(
+        "/api/otimizar/lote",
+        json={
+            "pedidos": [
+                {"servicos": SERVICOS, "horas": 7},
+                {"servicos": SERVICOS, "realizado": {"qtd": [1]}, "horas": 7},
+                {
+                    "servicos": SERVICOS,
+                    "realizado": [{"servico": "a", "quantidade": 2}],
+                    "horas": 7,
+                },
+            ]
+        },
+    )
+    assert resposta.status_code == 200
+    resultados = resposta.get_json()["resultados"]
+    assert [r["status"] for r in resultados] == [200, 400, 200]
+    assert resultados[2]["resposta"]["plano"][0]["quantidade_real"] == 2
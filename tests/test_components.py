@@ -0,0 +1,18 @@
+import pandas as pd
+import pytest
+
+import components
+
+
+@pytest.mark.parametrize(
+    "filtro, esperado",
+    [
+        ("{Lucro Ideal} > 1.000", ["c"]),
+        ("{Lucro Ideal} >= 1.000,50", ["c"]),
+        ("{Lucro Ideal} > R$ 999,99", ["b", "c"]),
+        ("{Lucro Ideal} < 2.5", ["a"]),
+    ],
+)
+def test_filtrar_tabela_le_numeros_pt_br(filtro, esperado):
+    df = pd.DataFrame({"servico": ["a", "b", "c"], "lucro_meta": [2.0, 1000.0, 1500.0]})
+    assert components.filtrar_tabela(df, filtro)["servico"].tolist() == esperado
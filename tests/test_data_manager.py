@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+import data_manager
+
+
+@pytest.mark.parametrize(
+    "texto, esperado",
+    [
+        ("R$ 1.500", 1500.0),
+        ("1.234", 1234.0),
+        ("2.5", 2.5),
+        ("0.75", 0.75),
+        ("1.500,00", 1500.0),
+        ("R$ 1.234,56", 1234.56),
+        ("R$ 1.500.000", 1500000.0),
+        ("2,5", 2.5),
+        ("1,234.56", 1234.56),
+    ],
+)
+def test_converter_numeros_br(texto, esperado):
+    assert data_manager.converter_numeros_br(pd.Series([texto]))[0] == esperado
+
+
+def test_limpar_dados_numericos_mantem_numeros_de_coluna_mista():
+    df = pd.DataFrame({"custo": [1.234, "1.234", None]})
+    df = data_manager.limpar_dados_numericos(df, ["custo"])
+    assert df["custo"].tolist() == [1.234, 1234.0, 0.0]
+
+
+def test_limpar_dados_numericos_coluna_so_de_texto():
+    df = pd.DataFrame({"custo": ["R$ 1.500", "2,5"], "venda": ["3", None]})
+    df = data_manager.limpar_dados_numericos(df, ["custo", "venda"])
+    assert df["custo"].tolist() == [1500.0, 2.5]
+    assert df["venda"].tolist() == [3.0, 0.0]
@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+import historico
+
+
+def plano(lucro_real):
+    return pd.DataFrame(
+        {
+            "servico": ["a", "b"],
+            "qtd_sugerida": [2.0, 1.0],
+            "quantidade_real": [1.0, 1.0],
+            "lucro_meta": [20.0, 10.0],
+            "lucro_real": [lucro_real, 10.0],
+        }
+    )
+
+
+def test_so_o_fechamento_atualiza_os_agregados(tmp_path):
+    caminho = str(tmp_path / "historico.sqlite3")
+    fechado = historico.registrar_execucao(
+        plano(10.0), "loja 1", "2026-09", "a", fechar=True, caminho=caminho
+    )
+    # Um cálculo posterior (outras horas) não substitui o mês fechado.
+    historico.registrar_execucao(plano(99.0), "loja 1", "2026-09", "b", caminho=caminho)
+    historico.registrar_execucao(
+        plano(5.0), "loja 2", "2026-09", "c", fechar=True, caminho=caminho
+    )
+
+    tendencia = historico.tendencia("loja 1", caminho=caminho)
+    assert tendencia["lucro_real"].tolist() == [20.0]
+    assert len(historico.planos_do_mes("loja 1", "2026-09", caminho=caminho)) == 4
+    assert historico.tendencia("loja 2", caminho=caminho)["lucro_real"].tolist() == [
+        15.0
+    ]
+
+    # Fechar de novo com o cálculo já registrado reaproveita o registro.
+    segundo = historico.registrar_execucao(
+        plano(99.0), "loja 1", "2026-09", "b", fechar=True, caminho=caminho
+    )
+    assert segundo != fechado
+    assert historico.tendencia("loja 1", caminho=caminho)["lucro_real"].tolist() == [
+        109.0
+    ]
+    totais = historico.totais_por_servico("loja 1", caminho=caminho)
+    assert totais.set_index("servico")["lucro_real"].to_dict() == {"a": 99.0, "b": 10.0}
+
+
+def test_mes_invalido(tmp_path):
+    with pytest.raises(ValueError):
+        historico.registrar_execucao(
+            plano(1.0), mes="09/2026", caminho=str(tmp_path / "h.sqlite3")
+        )
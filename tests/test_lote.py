@@ -0,0 +1,21 @@
+import lote
+
+
+def test_listar_arquivos_reporta_realizado_orfao_e_nomes_repetidos(tmp_path):
+    for nome in [
+        "centro.csv",
+        "centro.xlsx",
+        "norte.csv",
+        "norte_realizado.csv",
+        "oeste_realizado.xlsx",
+        "leiame.txt",
+    ]:
+        (tmp_path / nome).write_text("")
+
+    tarefas, erros = lote.listar_arquivos(str(tmp_path))
+
+    assert [(base, realizado is not None) for base, _, realizado in tarefas] == [
+        ("norte", True)
+    ]
+    assert sorted(e["arquivo"] for e in erros) == ["centro", "oeste_realizado.xlsx"]
+    assert "centro.csv, centro.xlsx" in erros[0]["erro"]